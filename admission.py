@@ -0,0 +1,209 @@
+import math
+import time
+import asyncio
+import ipaddress
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from metrics import registry
+from logging_setup import get_logger
+
+logger = get_logger("admission")
+
+class Overloaded(Exception):
+    """请求被准入控制拒绝"""
+    
+    def __init__(self, status_code, reason, retry_after):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+def parse_trusted_proxies(values):
+    """解析受信任的反向代理地址列表（IP或CIDR网段），无效的条目忽略"""
+    networks = []
+    for value in values or ():
+        value = value.strip()
+        if not value:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(value, strict=False))
+        except ValueError:
+            logger.warning("忽略无效的受信任代理地址: %s", value)
+    return networks
+
+def _is_trusted(address, trusted_proxies):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+def client_address(peer, forwarded_for=None, trusted_proxies=()):
+    """限流使用的客户端地址
+    
+    直连的对端是受信任的反向代理时，从 X-Forwarded-For 右侧开始跳过受信任的代理，
+    取第一个不受信任的地址；否则使用对端地址。不信任任意客户端自带的 X-Forwarded-For，避免伪造地址绕过限流。
+    
+    Args:
+        peer: 连接的对端地址
+        forwarded_for: X-Forwarded-For 请求头
+        trusted_proxies: parse_trusted_proxies 的返回值
+    """
+    if not peer or not forwarded_for or not trusted_proxies or not _is_trusted(peer, trusted_proxies):
+        return peer
+    address = peer
+    for hop in reversed([hop.strip() for hop in forwarded_for.split(",") if hop.strip()]):
+        address = hop
+        if not _is_trusted(hop, trusted_proxies):
+            break
+    return address
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量"""
+    
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def try_acquire(self, now=None):
+        """取一个令牌，返回 (是否成功, 需要等待的秒数)"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """按键（会话ID / 客户端IP）划分的令牌桶，键数量有上限，最久未使用的先淘汰"""
+    
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.rate > 0
+    
+    def check(self, key):
+        """返回 (是否放行, 建议的Retry-After秒数)"""
+        if not self.enabled or not key:
+            return True, 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.try_acquire()
+
+class AdmissionController:
+    """全局并发上限加有界等待队列
+    
+    并发数未满时直接放行；已满时进入等待队列，队列已满或等待超时立即拒绝（503），
+    不让请求无限堆积。每个工作进程各自计数。
+    """
+    
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=5.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # 请求占用时长的指数移动平均，用于估算Retry-After
+        self._avg_hold = 1.0
+    
+    def _publish(self):
+        registry.set_gauge("rag_admission_in_flight", self.in_flight, "正在处理的请求数")
+        registry.set_gauge("rag_admission_queue_depth", self.waiting, "等待处理的请求数")
+    
+    def retry_after(self):
+        """按当前排队长度和平均处理时长估算客户端应等待的秒数"""
+        return max(1, math.ceil(self._avg_hold * (self.waiting + 1) / self.max_concurrent))
+    
+    def reject(self, status_code, reason, retry_after=None):
+        registry.inc("rag_admission_rejected_total", help_text="被准入控制拒绝的请求数", reason=reason)
+        return Overloaded(status_code, reason, retry_after if retry_after is not None else self.retry_after())
+    
+    async def acquire(self):
+        if not self._semaphore.locked():
+            # 有空闲名额时不会挂起
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                raise self.reject(503, "queue_full")
+            self.waiting += 1
+            self._publish()
+            acquire = asyncio.ensure_future(self._semaphore.acquire())
+            try:
+                await asyncio.wait_for(asyncio.shield(acquire), self.queue_timeout)
+            except BaseException as e:
+                # 超时或请求被取消（客户端断开）：取消等待；取消与获取同时发生时名额已经拿到，必须归还
+                self._abandon(acquire)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self.reject(503, "queue_timeout")
+                raise
+            finally:
+                self.waiting -= 1
+                self._publish()
+        self.in_flight += 1
+        self._publish()
+        return time.monotonic()
+    
+    def _abandon(self, acquire):
+        """放弃一次名额申请，已经获得的名额归还"""
+        if acquire.done():
+            if not acquire.cancelled() and acquire.exception() is None:
+                self._semaphore.release()
+            return
+        acquire.cancel()
+        acquire.add_done_callback(
+            lambda future: future.cancelled() or future.exception() is not None or self._semaphore.release())
+    
+    def release(self, acquired_at):
+        self.in_flight -= 1
+        self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - acquired_at)
+        self._semaphore.release()
+        self._publish()
+    
+    @asynccontextmanager
+    async def slot(self):
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+class Admission:
+    """准入控制入口：先检查会话和IP的令牌桶（429），再申请全局并发名额（503）"""
+    
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=5.0,
+                 ip_rate=0.0, ip_burst=1, session_rate=0.0, session_burst=1):
+        self.controller = AdmissionController(max_concurrent, max_queue, queue_timeout)
+        self.ip_limiter = RateLimiter(ip_rate, ip_burst)
+        self.session_limiter = RateLimiter(session_rate, session_burst)
+    
+    def check_rate(self, client_ip=None, session_id=None):
+        for reason, limiter, key in (("session_rate", self.session_limiter, session_id),
+                                     ("ip_rate", self.ip_limiter, client_ip)):
+            allowed, wait = limiter.check(key)
+            if not allowed:
+                raise self.controller.reject(429, reason, max(1, math.ceil(wait)))
+    
+    @asynccontextmanager
+    async def admit(self, client_ip=None, session_id=None):
+        self.check_rate(client_ip, session_id)
+        async with self.controller.slot():
+            yield
@@ -1,8 +1,12 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import json
 
 from rag_core import RAGCore
 from session_manager import SessionManager
+from metrics import span
+from logging_setup import get_logger
+
+logger = get_logger("agent_core")
 
 class RAGTool:
     """RAG工具，封装现有的RAG功能"""
@@ -30,40 +34,96 @@ class RAGTool:
         Returns:
             str: 回答内容
         """
+        answer, _ = self.run_with_docs(query, chat_history=chat_history)
+        return answer["message"]
+    
+    def run_with_docs(self, query: str, chat_history: str = "",
+                      deadline: Optional[float] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        运行RAG工具，同时返回生成回答所用的检索片段
+        
+        Args:
+            query: 用户查询
+            chat_history: 会话历史
+            deadline: 请求的截止时间（time.monotonic()），为空时从现在开始计算
+            
+        Returns:
+            Tuple[Dict[str, Any], List[Dict[str, Any]]]: 回答字典（type、message，降级时带 degraded）和检索片段
+        """
         try:
-            # 构建完整的查询上下文
-            full_query = query
-            if chat_history:
-                # 将会话历史与当前查询结合
-                full_query = f"{chat_history}\n用户: {query}"
+            # 路由按本轮问题长度和已有轮次判断难度，不受拼接的历史影响
+            answer, relevant_docs = self.rag_core.process_query(self._full_query(query, chat_history),
+                                                                conversation_depth=chat_history.count("用户: "),
+                                                                query_length=len(query), deadline=deadline)
             
-            answer, relevant_docs = self.rag_core.process_query(full_query)
+            return self._answer_with_docs(answer, relevant_docs)
+        except Exception as e:
+            logger.exception("RAG工具执行失败: %s", e)
+            return self._failed_answer(), []
+    
+    @staticmethod
+    def _answer_with_docs(answer: Dict[str, Any], relevant_docs: List[Dict[str, Any]]):
+        """无资料时不返回检索片段；回答中不添加参考资料，参考资料由前端统一处理"""
+        if answer.get("type") == "no_info":
+            return {"type": "no_info", "message": "抱歉，我无法回答这个问题，请转人工客服处理。"}, []
+        return answer, relevant_docs
+    
+    @staticmethod
+    def _failed_answer() -> Dict[str, Any]:
+        """RAG流程本身出错时的回答"""
+        return {"type": "error", "message": "抱歉，系统暂时无法回答您的问题，请稍后再试。"}
+    
+    @staticmethod
+    def _full_query(query: str, chat_history: str) -> str:
+        """构建完整的查询上下文：将会话历史与当前查询结合"""
+        if chat_history:
+            return f"{chat_history}\n用户: {query}"
+        return query
+    
+    def stream_with_docs(self, query: str, chat_history: str = "",
+                         deadline: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        流式运行RAG工具
+        
+        Args:
+            query: 用户查询
+            chat_history: 会话历史
+            deadline: 请求的截止时间（time.monotonic()），为空时从现在开始计算
             
-            # 构建回答内容
-            if answer.get("type") == "no_info":
-                return "抱歉，我无法回答这个问题，请转人工客服处理。"
-            else:
-                # 只返回纯粹的回答内容，不添加参考资料
-                # 参考资料由前端统一处理
-                return answer.get("message", "")
+        Yields:
+            ("sources", 检索片段)、("token", 文本块)...，最后是 ("answer", (回答内容, 检索片段))，
+            回答内容和检索片段与 run_with_docs 的返回值一致
+        """
+        relevant_docs = []
+        try:
+            for kind, payload in self.rag_core.process_query_stream(self._full_query(query, chat_history),
+                                                                    conversation_depth=chat_history.count("用户: "),
+                                                                    query_length=len(query), deadline=deadline):
+                if kind == "sources":
+                    relevant_docs = payload
+                elif kind == "answer":
+                    yield "answer", self._answer_with_docs(payload, relevant_docs)
+                    return
+                yield kind, payload
         except Exception as e:
-            print(f"RAG工具执行失败: {e}")
-            return "抱歉，系统暂时无法回答您的问题，请稍后再试。"
+            logger.exception("RAG工具执行失败: %s", e)
+            yield "answer", (self._failed_answer(), [])
 
 class AgentCore:
     """Agent核心，处理上下文理解和工具调用"""
     
-    def __init__(self, rag_core: RAGCore, doubao_api_key: str):
+    def __init__(self, rag_core: RAGCore, doubao_api_key: str, session_manager: SessionManager = None):
         """
         初始化Agent核心
         
         Args:
             rag_core: RAGCore实例
             doubao_api_key: 豆包API密钥
+            session_manager: 会话管理器，为空时使用进程内的 SessionManager
         """
         self.rag_core = rag_core
         self.doubao_api_key = doubao_api_key
-        self.session_manager = SessionManager()
+        self.session_manager = session_manager or SessionManager()
         
         # 创建RAG工具
         self.rag_tool = RAGTool(rag_core)
@@ -120,45 +180,83 @@ class AgentCore:
         
         return history_str
     
-    def process_query(self, query: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+    def process_query(self, query: str, session_id: Optional[str] = None,
+                      deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         处理用户查询
         
         Args:
             query: 用户查询
             session_id: 会话ID，可选
+            deadline: 请求的截止时间（time.monotonic()），由接收请求的处理函数计算
             
         Returns:
-            Dict[str, Any]: 回答内容和会话信息
+            Dict[str, Any]: 回答内容、会话信息和检索片段
         """
         # 如果没有会话ID，创建新会话
         if not session_id:
             session_id = self.create_session()
         
         # 获取会话历史
-        chat_history = self.get_session_history(session_id)
+        with span("session_ops"):
+            chat_history = self.get_session_history(session_id)
         
         # 直接使用RAG工具处理查询（简化实现）
         # 后续可以升级为完整的Agent流程
-        answer = self.rag_tool._run(query, chat_history=chat_history)
+        answer, relevant_docs = self.rag_tool.run_with_docs(query, chat_history=chat_history, deadline=deadline)
         
         # 添加消息到会话历史
-        self.session_manager.add_message(session_id, "user", query)
-        self.session_manager.add_message(session_id, "assistant", answer)
-        
-        # 解析回答，判断是否需要调用豆包
-        if "抱歉，我无法回答这个问题，请转人工客服处理。" in answer:
-            answer_type = "no_info"
-        else:
-            answer_type = "info"
+        with span("session_ops"):
+            self.session_manager.add_message(session_id, "user", query)
+            self.session_manager.add_message(session_id, "assistant", answer["message"])
         
         return {
-            "answer": {
-                "type": answer_type,
-                "message": answer
-            },
+            "answer": answer,
+            "session_id": session_id,
+            "session_count": self.session_manager.get_session_count(),
+            "relevant_docs": relevant_docs
+        }
+    
+    def process_query_stream(self, query: str, session_id: Optional[str] = None,
+                             deadline: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        流式处理用户查询
+        
+        Args:
+            query: 用户查询
+            session_id: 会话ID，可选
+            deadline: 请求的截止时间（time.monotonic()），由接收请求的处理函数计算
+            
+        Yields:
+            ("session", 会话ID)、("sources", 检索片段)、("token", 文本块)...，
+            最后是 ("result", 结果字典)，结果字典与 process_query 的返回值一致
+        """
+        # 如果没有会话ID，创建新会话
+        if not session_id:
+            session_id = self.create_session()
+        yield "session", session_id
+        
+        # 获取会话历史
+        with span("session_ops"):
+            chat_history = self.get_session_history(session_id)
+        
+        answer, relevant_docs = RAGTool._failed_answer(), []
+        for kind, payload in self.rag_tool.stream_with_docs(query, chat_history=chat_history, deadline=deadline):
+            if kind == "answer":
+                answer, relevant_docs = payload
+            else:
+                yield kind, payload
+        
+        # 添加消息到会话历史
+        with span("session_ops"):
+            self.session_manager.add_message(session_id, "user", query)
+            self.session_manager.add_message(session_id, "assistant", answer["message"])
+        
+        yield "result", {
+            "answer": answer,
             "session_id": session_id,
-            "session_count": self.session_manager.get_session_count()
+            "session_count": self.session_manager.get_session_count(),
+            "relevant_docs": relevant_docs
         }
     
     def delete_session(self, session_id: str) -> bool:
@@ -0,0 +1,242 @@
+import time
+import faiss
+import numpy as np
+from logging_setup import get_logger
+
+logger = get_logger("ann_index")
+
+# 小于该规模时直接使用精确检索
+FLAT_THRESHOLD = 1000
+# 超过该规模时使用IVF-PQ压缩存储，控制内存占用
+PQ_THRESHOLD = 1000000
+# 目标召回率高于该值时优先使用HNSW
+HNSW_RECALL = 0.97
+# 训练8位/4位PQ码本所需的最少向量数
+PQ_MIN_TRAIN_8BIT = 256 * 39
+PQ_MIN_TRAIN_4BIT = 16 * 39
+
+# 各类索引可调的检索参数及候选值（从小到大，越大召回越高、越慢）
+NPROBE_CANDIDATES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+EF_SEARCH_CANDIDATES = [16, 24, 32, 48, 64, 96, 128, 256, 512]
+
+def _nlist_for(n):
+    """IVF聚类数：约4*sqrt(n)，并保证每个聚类至少有39个训练样本"""
+    return int(max(1, min(4 * np.sqrt(n), n // 39, 65536)))
+
+def _pq_subquantizers(dim):
+    """PQ子空间数：每个子空间4维，且必须整除向量维度"""
+    m = max(1, dim // 4)
+    while dim % m:
+        m -= 1
+    return m
+
+def _storage(n, dim, compression):
+    """向量存储方式：Flat（float32原始向量）、SQ8（每维1字节）或 PQ（每向量m个码字）"""
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        # 8位码本需要约 256*39 个训练样本，样本不足时改用4位码本，再不足则退回SQ8
+        if n >= PQ_MIN_TRAIN_8BIT:
+            return f"PQ{_pq_subquantizers(dim)}"
+        if n >= PQ_MIN_TRAIN_4BIT:
+            return f"PQ{_pq_subquantizers(dim)}x4"
+        logger.warning("向量数 %d 不足以训练PQ码本，改用SQ8", n)
+        return "SQ8"
+    if compression:
+        raise ValueError(f"不支持的向量压缩方式: {compression}")
+    return "Flat"
+
+def is_compressed(factory):
+    """工厂字符串是否使用有损压缩存储"""
+    return factory.split(",")[-1].startswith(("SQ", "PQ"))
+
+def choose_factory_string(n, dim, target_recall=0.95, compression=None):
+    """根据向量数量、目标召回率和压缩方式选择FAISS索引工厂字符串
+    
+    Args:
+        n: 向量数量
+        dim: 向量维度
+        target_recall: 目标召回率（相对精确检索的recall@k）
+        compression: 向量压缩方式，None / "sq8" / "pq"
+    
+    Returns:
+        工厂字符串，如 "Flat"、"IVF126,Flat"、"HNSW32,Flat"、"IVF4096,PQ32"、"IVF126,SQ8"
+    """
+    if n >= PQ_THRESHOLD and not compression:
+        compression = "pq"
+    storage = _storage(n, dim, compression)
+    if n < FLAT_THRESHOLD:
+        return storage
+    # HNSW的图结构本身每个向量占用数百字节，压缩存储时用IVF，召回率靠精确重排弥补
+    if target_recall >= HNSW_RECALL and not compression:
+        return "HNSW32,Flat"
+    return f"IVF{_nlist_for(n)},{storage}"
+
+def build_index(embeddings, factory):
+    """按工厂字符串创建索引，需要训练的索引先训练再添加向量"""
+    index = faiss.index_factory(embeddings.shape[1], factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        logger.info("训练索引 %s，训练样本数: %d", factory, len(embeddings))
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+class RerankIndex:
+    """压缩索引加精确重排
+    
+    先用压缩索引取前 shortlist 个候选，再用内存映射的float16原始向量重新计算L2距离，
+    只有候选行会被读入内存。search 接口与FAISS索引一致，检索代码无需区分。
+    """
+    
+    def __init__(self, index, vectors, shortlist=64):
+        self.index = index
+        self.vectors = vectors
+        self.shortlist = shortlist
+    
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+    
+    def search(self, queries, k):
+        _, candidates = self.index.search(queries, max(k, self.shortlist))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            ids = np.sort(candidates[row][candidates[row] >= 0])
+            if len(ids) == 0:
+                continue
+            vectors = np.asarray(self.vectors[ids], dtype=np.float32)
+            exact = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+def _base_index(index):
+    return index.index if isinstance(index, RerankIndex) else index
+
+def _tunable_parameter(index):
+    """返回索引可调的检索参数名及候选值，精确检索索引返回 (None, [])"""
+    index = _base_index(index)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        return "nprobe", [v for v in NPROBE_CANDIDATES if v <= ivf.nlist] or [ivf.nlist]
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+        return "efSearch", EF_SEARCH_CANDIDATES
+    return None, []
+
+def apply_search_params(index, params):
+    """把保存的检索参数应用到索引上"""
+    space = faiss.ParameterSpace()
+    for name, value in (params or {}).items():
+        space.set_index_parameter(_base_index(index), name, value)
+
+def sample_queries(embeddings, count=100, seed=0):
+    """从语料中抽样留出行作为调参查询，返回 (查询向量, 留出的行号)
+    
+    计算基准结果和测量召回率时都排除查询自身所在的行（留一法），
+    相当于用不在库中的真实查询调参，而不是查询命中自己。
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=min(count, len(embeddings)), replace=False)
+    return embeddings[rows].astype(np.float32), rows
+
+def _drop_rows(ids, exclude, k):
+    """去掉每行中等于 exclude 对应行号的结果，保留前 k 个"""
+    if exclude is None:
+        return ids[:, :k]
+    kept = np.full((len(ids), k), -1, dtype=np.int64)
+    for i, row in enumerate(ids):
+        row = row[row != exclude[i]][:k]
+        kept[i, :len(row)] = row
+    return kept
+
+def exact_neighbors(queries, embeddings, k, exclude=None):
+    """精确检索的前 k 个结果作为召回率基准，exclude 为每条查询需要排除的行号（留出行）"""
+    _, ids = faiss.knn(queries, embeddings, k + (exclude is not None))
+    return _drop_rows(ids, exclude, k)
+
+def measure(index, queries, ground_truth, k, exclude=None, repeat=1):
+    """逐条查询测量召回率和单次查询延迟（毫秒），与线上单条检索的方式一致
+    
+    repeat 大于1时重复测量，延迟取各轮的中位数，避免单次抖动影响调参结果。
+    """
+    rounds = []
+    for _ in range(max(1, repeat)):
+        hits = 0
+        start = time.perf_counter()
+        for i in range(len(queries)):
+            _, found = index.search(queries[i:i + 1], k + (exclude is not None))
+            found = _drop_rows(found, None if exclude is None else exclude[i:i + 1], k)
+            hits += len(np.intersect1d(found[0], ground_truth[i]))
+        rounds.append((time.perf_counter() - start) * 1000 / max(1, len(queries)))
+    return hits / max(1, ground_truth.size), float(np.median(rounds))
+
+def auto_tune(index, embeddings, target_recall=0.95, latency_budget_ms=2.0, k=8, queries=None, query_count=100,
+              repeat=3):
+    """自动选择检索参数（nprobe / efSearch）
+    
+    以精确检索结果为基准，从小到大尝试候选值，选第一个在延迟预算内达到目标召回率的值；
+    都达不到时选预算内召回率最高的值，预算内没有可用值时选最小值。
+    
+    Args:
+        index: 已构建的索引，可以是 RerankIndex
+        embeddings: 索引中的全部向量，用于计算精确检索结果
+        target_recall: 目标召回率
+        latency_budget_ms: 单次查询延迟预算（毫秒）
+        k: 检索数量
+        queries: 调参查询向量（如真实用户问题的嵌入），为空时从语料中抽样留出行
+        query_count: 抽样的查询数量
+        repeat: 每个候选值的测量轮数，延迟取中位数
+    
+    Returns:
+        调参结果字典，search_params 可直接传给 apply_search_params
+    """
+    param, candidates = _tunable_parameter(index)
+    exclude = None
+    if queries is None:
+        queries, exclude = sample_queries(embeddings, query_count)
+    k = min(k, index.ntotal - (exclude is not None))
+    if k <= 0:
+        return {"search_params": {}, "recall": 1.0, "latency_ms": 0.0, "target_recall": target_recall, "trials": []}
+    ground_truth = exact_neighbors(queries, embeddings, k, exclude)
+    
+    if param is None:
+        # 没有可调参数（Flat / SQ8 / PQ），只记录实际召回率和延迟
+        recall, latency_ms = measure(index, queries, ground_truth, k, exclude, repeat)
+        return {"search_params": {}, "recall": round(recall, 4), "latency_ms": round(latency_ms, 4),
+                "target_recall": target_recall, "trials": []}
+    
+    trials = []
+    chosen = None
+    for value in candidates:
+        apply_search_params(index, {param: value})
+        recall, latency_ms = measure(index, queries, ground_truth, k, exclude, repeat)
+        trials.append({"value": value, "recall": round(recall, 4), "latency_ms": round(latency_ms, 4)})
+        # 候选值越大越慢，延迟中位数已超出预算时不再尝试更大的值
+        if latency_ms > latency_budget_ms:
+            break
+        if recall >= target_recall:
+            chosen = trials[-1]
+            break
+    
+    if chosen is None:
+        within_budget = [t for t in trials if t["latency_ms"] <= latency_budget_ms]
+        chosen = max(within_budget, key=lambda t: t["recall"]) if within_budget else trials[0]
+        logger.warning("检索参数未达到目标召回率 %.3f，选择 %s=%d（召回率 %.3f，延迟 %.3fms）",
+                       target_recall, param, chosen["value"], chosen["recall"], chosen["latency_ms"])
+    
+    apply_search_params(index, {param: chosen["value"]})
+    logger.info("检索参数调优完成: %s=%d，召回率 %.3f，单次延迟 %.3fms",
+                param, chosen["value"], chosen["recall"], chosen["latency_ms"])
+    return {
+        "search_params": {param: chosen["value"]},
+        "recall": chosen["recall"],
+        "latency_ms": chosen["latency_ms"],
+        "target_recall": target_recall,
+        "latency_budget_ms": latency_budget_ms,
+        "trials": trials
+    }
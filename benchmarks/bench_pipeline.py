@@ -0,0 +1,226 @@
+"""入库与检索微基准
+
+对合成语料依次计时 load_files（冷启动和命中解析缓存）、split_single_text、compute_embeddings、
+build_vector_store、load_vector_store 和 retrieve_relevant_docs，
+输出吞吐量、耗时分位数和峰值内存（JSON），可与基线结果对比。
+index_tradeoff 部分对比各种向量压缩方式的索引大小、召回率和单次检索延迟（含/不含精确重排）。
+
+用法:
+    python benchmarks/bench_pipeline.py --chunks 10000 --formats txt,docx --output bench.json
+    python benchmarks/bench_pipeline.py --chunks 10000 --baseline bench.json
+    python benchmarks/bench_pipeline.py --chunks 100000 --compression none,sq8,pq --rerank-top-n 64
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+import bench_utils
+from bench_utils import PeakRSSSampler, Timer, stage_result, compare_with_baseline, write_results
+from corpus_generator import generate_corpus, generate_queries
+
+def index_tradeoff(embeddings, query_embeddings, compressions, rerank_top_n, target_recall=0.95, k=8):
+    """对比不同压缩方式：索引字节数、压缩比、recall@k 和单次检索延迟
+    
+    查询集前一半用于调整 nprobe / efSearch，后一半用于测量，避免在调参查询上评估。
+    """
+    import faiss
+    import ann_index
+    
+    k = min(k, len(embeddings))
+    half = max(1, len(query_embeddings) // 2)
+    tune_queries, query_embeddings = query_embeddings[:half], query_embeddings[half:]
+    _, ground_truth = faiss.knn(query_embeddings, embeddings, k)
+    raw_bytes = embeddings.shape[1] * 4
+    vectors_f16 = embeddings.astype(np.float16)
+    report = {}
+    for compression in compressions:
+        factory = ann_index.choose_factory_string(len(embeddings), embeddings.shape[1], target_recall,
+                                                  None if compression == "none" else compression)
+        with Timer() as t:
+            index = ann_index.build_index(embeddings, factory)
+            tuning = ann_index.auto_tune(index, embeddings, target_recall, latency_budget_ms=float("inf"), k=k,
+                                         queries=tune_queries)
+        bytes_per_vector = len(faiss.serialize_index(index)) / len(embeddings)
+        recall, latency_ms = ann_index.measure(index, query_embeddings, ground_truth, k)
+        variant = {
+            "factory": factory,
+            "search_params": tuning["search_params"],
+            "build_s": round(t.elapsed_ms / 1000, 3),
+            "bytes_per_vector": round(bytes_per_vector, 2),
+            "compression_ratio": round(raw_bytes / bytes_per_vector, 2),
+            "recall_at_k": round(recall, 4),
+            "latency_ms": round(latency_ms, 4)
+        }
+        if ann_index.is_compressed(factory) and rerank_top_n > 0:
+            reranked = ann_index.RerankIndex(index, vectors_f16, rerank_top_n)
+            recall, latency_ms = ann_index.measure(reranked, query_embeddings, ground_truth, k)
+            variant.update({
+                "rerank_top_n": rerank_top_n,
+                "rerank_recall_at_k": round(recall, 4),
+                "rerank_latency_ms": round(latency_ms, 4),
+                # 重排向量内存映射在磁盘上，只有候选行会被读入内存
+                "rerank_vectors_bytes_on_disk": int(vectors_f16.nbytes)
+            })
+        report[compression] = variant
+    return report
+
+def run_benchmark(workdir, chunks, formats, query_count, repeat, seed=42,
+                  compressions=("none", "sq8", "pq"), rerank_top_n=64):
+    from logging_setup import configure_logging
+    from data_loader import DataLoader
+    from keyword_manager import KeywordManager
+    from rag_core import RAGCore
+    
+    # 基准测试只关心耗时，关闭诊断日志
+    configure_logging("production", level="WARNING")
+    
+    data_dir = os.path.join(workdir, "data")
+    vector_db_path = os.path.join(workdir, "vector_db", "faiss_index.bin")
+    os.makedirs(os.path.dirname(vector_db_path), exist_ok=True)
+    
+    with Timer() as t:
+        generate_corpus(data_dir, chunks, formats, seed=seed)
+    queries = generate_queries(query_count, seed + 1)
+    results = {
+        "meta": {
+            "chunks_target": chunks,
+            "formats": list(formats),
+            "queries": query_count,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus_generation_s": round(t.elapsed_ms / 1000, 3)
+        },
+        "stages": {}
+    }
+    stages = results["stages"]
+    # 关闭解析缓存，load_files 每次都完整解析
+    loader = DataLoader(data_dir, vector_db_path, parse_cache=False)
+    
+    # load_files
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            with Timer() as t:
+                files = loader.load_files()
+            samples.append(t.elapsed_ms)
+    stages["load_files"] = stage_result(samples, len(files), rss.peak_mb, "files")
+    
+    # load_files_cached：首次加载写入解析缓存，之后计时全部命中缓存的加载
+    cached_loader = DataLoader(data_dir, vector_db_path)
+    cached_loader.load_files()
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            with Timer() as t:
+                cached_loader.load_files()
+            samples.append(t.elapsed_ms)
+    stages["load_files_cached"] = stage_result(samples, len(files), rss.peak_mb, "files")
+    
+    # split_single_text（逐文件计时，输入为解析后的结构块）
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            for path, content in files:
+                with Timer() as t:
+                    loader.split_single_text(content, ext=os.path.splitext(path)[1].lower())
+                samples.append(t.elapsed_ms)
+    char_counts = [len(content) if isinstance(content, str) else sum(len(block.text) for block in content)
+                   for _, content in files]
+    avg_chars = sum(char_counts) / max(1, len(char_counts))
+    stages["split_single_text"] = stage_result(samples, round(avg_chars), rss.peak_mb, "chars")
+    
+    documents = loader.split_text(files)
+    results["meta"]["chunks_actual"] = len(documents)
+    
+    # compute_embeddings
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            with Timer() as t:
+                embeddings = loader.compute_embeddings(documents)
+            samples.append(t.elapsed_ms)
+    stages["compute_embeddings"] = stage_result(samples, len(documents), rss.peak_mb, "chunks")
+    
+    # build_vector_store
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            with Timer() as t:
+                loader.build_vector_store(documents, embeddings)
+            samples.append(t.elapsed_ms)
+    stages["build_vector_store"] = stage_result(samples, len(documents), rss.peak_mb, "chunks")
+    results["meta"]["index"] = {key: loader.index_info.get(key) for key in ("factory", "search_params", "recall")}
+    
+    # 向量压缩的内存/召回率/延迟权衡
+    if compressions:
+        query_embeddings = np.array([loader.simple_embed(query) for query in queries], dtype=np.float32)
+        results["index_tradeoff"] = index_tradeoff(embeddings, query_embeddings, compressions, rerank_top_n)
+    
+    # load_vector_store（新的加载器，模拟进程启动）
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            fresh = DataLoader(data_dir, vector_db_path)
+            with Timer() as t:
+                fresh.load_vector_store()
+            samples.append(t.elapsed_ms)
+    stages["load_vector_store"] = stage_result(samples, len(fresh.documents), rss.peak_mb, "chunks")
+    
+    # retrieve_relevant_docs（逐查询计时，使用临时关键词库避免修改仓库中的文件）
+    keyword_file = os.path.join(workdir, "keyword_library.json")
+    shutil.copy(os.path.join(bench_utils.REPO_DIR, "keyword_library.json"), keyword_file)
+    rag_core = RAGCore(fresh, "bench")
+    rag_core.keyword_manager = KeywordManager(keyword_file)
+    rag_core.retrieve_relevant_docs(queries[0])  # 预热分词词典
+    samples = []
+    with PeakRSSSampler() as rss:
+        for _ in range(repeat):
+            for query in queries:
+                with Timer() as t:
+                    rag_core.retrieve_relevant_docs(query)
+                samples.append(t.elapsed_ms)
+    stages["retrieve_relevant_docs"] = stage_result(samples, 1, rss.peak_mb, "queries")
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="入库与检索微基准")
+    parser.add_argument("--chunks", type=int, default=1000, help="目标文档块数量，如 1000/10000/100000")
+    parser.add_argument("--formats", default="txt", help="语料格式，逗号分隔：txt,docx")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    parser.add_argument("--baseline", default=None, help="基线结果JSON，输出各阶段p50耗时比值")
+    parser.add_argument("--compression", default="none,sq8,pq", help="对比的向量压缩方式，逗号分隔，留空跳过")
+    parser.add_argument("--rerank-top-n", type=int, default=64, help="压缩索引精确重排的候选数，0表示不重排")
+    args = parser.parse_args()
+    
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    compressions = tuple(c.strip() for c in args.compression.split(",") if c.strip())
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_bench_")
+    # RAGCore 在当前目录下读写关键词库，切换到工作目录避免影响仓库文件
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run_benchmark(workdir, args.chunks, formats, args.queries, args.repeat, args.seed,
+                                compressions, args.rerank_top_n)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.baseline:
+        results["baseline_ratio_p50"] = compare_with_baseline(results, args.baseline)
+    write_results(results, args.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""基准测试公共工具：分位数统计、峰值内存采样、与基线结果对比"""
+import os
+import sys
+import json
+import time
+import threading
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+def percentiles(samples_ms):
+    """计算耗时分位数（毫秒）"""
+    if not samples_ms:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples_ms)
+    
+    def pick(q):
+        idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return round(ordered[idx], 3)
+    
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(ordered[-1], 3)}
+
+def current_rss():
+    """当前进程常驻内存（字节）"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        import resource
+        # Linux 上 ru_maxrss 单位为KB，只能得到历史峰值
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakRSSSampler:
+    """后台线程周期性采样常驻内存，记录代码块执行期间的峰值"""
+    
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+    
+    @property
+    def peak_mb(self):
+        return round(self.peak / 1024 / 1024, 2)
+
+def stage_result(samples_ms, items, peak_mb, unit):
+    """汇总单个阶段的结果：吞吐量、分位数和峰值内存"""
+    total_s = sum(samples_ms) / 1000
+    result = {
+        "runs": len(samples_ms),
+        "items_per_run": items,
+        "unit": unit,
+        "total_s": round(total_s, 4),
+        "throughput_per_s": round(items * len(samples_ms) / total_s, 2) if total_s > 0 else None,
+        "peak_rss_mb": peak_mb
+    }
+    result.update(percentiles(samples_ms))
+    return result
+
+class Timer:
+    """计时上下文，elapsed_ms 为代码块耗时"""
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed_ms = (time.perf_counter() - self._start) * 1000
+
+def compare_with_baseline(results, baseline_path, key="p50_ms"):
+    """与基线结果逐阶段对比，返回 {阶段: 当前值/基线值}"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    comparison = {}
+    for stage, current in results.get("stages", {}).items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get(key) or current.get(key) is None:
+            continue
+        comparison[stage] = round(current[key] / old[key], 3)
+    return comparison
+
+def write_results(results, output_path):
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,154 @@
+"""合成客服语料生成器
+
+按指定规模生成费控商旅领域的中文客服资料（.txt / .docx）和对应的查询集，
+用于基准测试。相同的参数和随机种子总是生成相同的语料，便于前后对比。
+
+用法:
+    python benchmarks/corpus_generator.py --chunks 10000 --formats txt,docx --out bench_corpus
+"""
+import os
+import json
+import random
+import argparse
+
+# 功能模块及其所在菜单
+MODULES = [
+    ("出差申请", "移动端操作"), ("差旅报销", "移动端操作"), ("费用申请", "移动端操作"),
+    ("费用报销", "移动端操作"), ("借还款", "移动端操作"), ("票据夹", "移动端操作"),
+    ("单据审批", "我的审批"), ("商旅预订", "移动端操作"), ("我的单据", "移动端操作"),
+    ("我的账户", "移动端操作"), ("流程管理", "业务管理"), ("规则维护", "业务管理"),
+    ("单据管理", "业务管理"), ("报表管理", "报表管理"), ("发票导入", "票据夹"),
+    ("收款账户维护", "我的账户"), ("审批流设置", "流程管理"), ("预算控制", "规则维护")
+]
+
+ACTIONS = ["新建", "提交", "查看", "修改", "撤回", "删除", "导出", "打印"]
+
+STEP_TEMPLATES = [
+    "登录企业手机银行，进入费控商旅",
+    "点击{module}",
+    "点击右上角“{action}”按钮",
+    "填写{field}等信息",
+    "上传相关附件或从票据夹选择发票",
+    "确认信息无误后点击“提交”",
+    "系统自动流转至审批人进行审批",
+    "审批通过后可在“我的单据”中查看处理进度"
+]
+
+FIELDS = ["出差事由、出发地、目的地、出行日期", "费用类型、金额、发生日期", "借款金额、用途、预计还款日期",
+          "报销明细、发票信息、收款账户", "预订人、出行人、差旅标准", "部门、项目、预算科目"]
+
+FAQ_TEMPLATES = [
+    ("{module}在哪里", "{module}功能位于{menu}菜单下，管理员可在配置向导中开启该功能。"),
+    ("{module}怎么{action}", "在{menu}中找到{module}，点击“{action}”即可完成操作，操作结果会实时同步到单据列表。"),
+    ("{module}提交后能撤回吗", "审批人处理之前，申请人可以在我的单据中撤回{module}，撤回后可以修改再次提交。"),
+    ("{module}有额度限制吗", "{module}的额度由企业在规则维护中配置，超出额度时系统会给出提示并按规则拦截或预警。")
+]
+
+BOILERPLATE = [
+    "“小天元·费控商旅”是专为50-200人规模中小微企业打造的“金融+费控+商旅”B2B2C服务平台。",
+    "通过“三步上线”极简配置，助力企业高效管理差旅流程，实现从出差申请、商旅预订、智能报销到财务支付的全流程闭环。",
+    "如遇系统问题，请联系企业管理员或拨打客服热线，工作时间为工作日9:00-18:00。",
+    "本手册内容随版本更新，请以系统实际界面为准。"
+]
+
+QUERY_TEMPLATES = ["{module}怎么{action}", "{module}在哪里", "如何{action}{module}", "{module}的操作步骤是什么",
+                   "{module}提交后能撤回吗", "怎么进入{module}", "{module}需要填写哪些信息"]
+
+def _section(rng, module, menu):
+    """生成一个章节（约一个文档块大小），返回(标题, 段落列表)"""
+    action = rng.choice(ACTIONS)
+    kind = rng.random()
+    paragraphs = []
+    if kind < 0.45:
+        # 操作步骤
+        title = f"{module}{action}操作步骤"
+        steps = STEP_TEMPLATES[:2] + rng.sample(STEP_TEMPLATES[2:], k=rng.randint(3, len(STEP_TEMPLATES) - 2))
+        for i, step in enumerate(steps, 1):
+            paragraphs.append(f"{i}. " + step.format(module=module, action=action, field=rng.choice(FIELDS)) + "。")
+    elif kind < 0.8:
+        # 常见问题
+        title = f"{module}常见问题"
+        for q, a in rng.sample(FAQ_TEMPLATES, k=rng.randint(2, len(FAQ_TEMPLATES))):
+            paragraphs.append(f"问：{q.format(module=module, action=action)}？")
+            paragraphs.append(f"答：{a.format(module=module, action=action, menu=menu)}")
+    else:
+        # 功能说明，夹带重复的样板文字
+        title = f"{module}功能说明"
+        paragraphs.append(f"{module}用于{rng.choice(FIELDS)}的在线管理，支持{action}、查询和统计。")
+        paragraphs.extend(rng.sample(BOILERPLATE, k=2))
+    return title, paragraphs
+
+def generate_corpus(out_dir, chunks=1000, formats=("txt",), sections_per_file=50, seed=42):
+    """生成语料文件，返回生成的文件路径列表
+    
+    Args:
+        out_dir: 输出目录
+        chunks: 目标文档块数量（每个章节约对应一个文档块）
+        formats: 输出格式，支持 txt / docx
+        sections_per_file: 每个文件包含的章节数
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    file_count = max(1, (chunks + sections_per_file - 1) // sections_per_file)
+    for file_idx in range(file_count):
+        fmt = formats[file_idx % len(formats)]
+        sections = []
+        for _ in range(min(sections_per_file, chunks - file_idx * sections_per_file)):
+            module, menu = rng.choice(MODULES)
+            sections.append(_section(rng, module, menu))
+        path = os.path.join(out_dir, f"manual_{file_idx:05d}.{fmt}")
+        if fmt == "docx":
+            _write_docx(path, sections)
+        else:
+            _write_txt(path, sections)
+        paths.append(path)
+    return paths
+
+def _write_txt(path, sections):
+    with open(path, "w", encoding="utf-8") as f:
+        for title, paragraphs in sections:
+            f.write(title + "\n")
+            f.write("\n".join(paragraphs) + "\n\n")
+
+def _write_docx(path, sections):
+    # python-docx 只在生成docx语料时需要
+    from docx import Document
+    doc = Document()
+    for title, paragraphs in sections:
+        doc.add_heading(title, level=2)
+        for para in paragraphs:
+            style = "List Number" if para[:1].isdigit() else None
+            doc.add_paragraph(para.split(". ", 1)[-1] if style else para, style=style)
+    doc.save(path)
+
+def generate_queries(count=200, seed=7):
+    """生成查询集"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        module, _ = rng.choice(MODULES)
+        template = rng.choice(QUERY_TEMPLATES)
+        queries.append(template.format(module=module, action=rng.choice(ACTIONS)))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成客服语料和查询集")
+    parser.add_argument("--chunks", type=int, default=1000, help="目标文档块数量，如 1000/10000/100000")
+    parser.add_argument("--formats", default="txt", help="输出格式，逗号分隔：txt,docx")
+    parser.add_argument("--sections-per-file", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_corpus", help="输出目录")
+    args = parser.parse_args()
+    
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    paths = generate_corpus(os.path.join(args.out, "data"), args.chunks, formats, args.sections_per_file, args.seed)
+    queries = generate_queries(args.queries, args.seed + 1)
+    with open(os.path.join(args.out, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump(queries, f, ensure_ascii=False, indent=2)
+    print(f"已生成 {len(paths)} 个文件、{len(queries)} 条查询，输出目录: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""端到端压测：模拟多个并发会话请求 web_server 的 /api/query
+
+每个虚拟用户先创建会话，然后在同一会话中连续提问，统计吞吐量、
+延迟分位数和按状态码划分的错误率。配合 mock_doubao_server.py 可完全离线运行。
+所有虚拟用户来自同一IP，压测吞吐上限时可用 RAG_RATE_LIMIT_IP_RPS=0 关闭服务端的IP限流，
+此时 http_429/http_503 只反映会话限流和并发上限。
+
+用法:
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 32 --duration 60
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+from bench_utils import percentiles, write_results
+from corpus_generator import generate_queries
+
+# 服务端在大模型调用失败时返回的降级文案前缀
+DEGRADED_PREFIX = "抱歉，系统暂时无法回答"
+
+class LoadResult:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies_ms = []
+        self.status = Counter()
+        self.errors = Counter()
+    
+    def record(self, latency_ms, status=None, error=None):
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            if status is not None:
+                self.status[str(status)] += 1
+            if error is not None:
+                self.errors[error] += 1
+
+def _user_loop(base_url, queries, deadline, max_requests, counter, result, turns_per_session, timeout, think_ms):
+    http = requests.Session()
+    rng = random.Random()
+    session_id = None
+    turns = 0
+    while time.monotonic() < deadline:
+        with counter["lock"]:
+            if max_requests and counter["sent"] >= max_requests:
+                return
+            counter["sent"] += 1
+        
+        if session_id is None or turns >= turns_per_session:
+            try:
+                session_id = http.post(f"{base_url}/api/session", timeout=timeout).json().get("session_id")
+            except Exception:
+                session_id = None
+            turns = 0
+        
+        data = {"text": rng.choice(queries)}
+        if session_id:
+            data["session_id"] = session_id
+        start = time.perf_counter()
+        try:
+            response = http.post(f"{base_url}/api/query", data=data, timeout=timeout)
+            elapsed = (time.perf_counter() - start) * 1000
+            error = None
+            if response.status_code == 200:
+                answer = response.json().get("answer", {})
+                # 上游失败时服务端返回降级文案而不是错误码，这里单独统计
+                if answer.get("type") == "error" or answer.get("message", "").startswith(DEGRADED_PREFIX):
+                    error = "answer_error"
+            else:
+                error = f"http_{response.status_code}"
+            result.record(elapsed, response.status_code, error)
+        except requests.exceptions.Timeout:
+            result.record((time.perf_counter() - start) * 1000, error="client_timeout")
+        except requests.exceptions.RequestException as e:
+            result.record((time.perf_counter() - start) * 1000, error=type(e).__name__)
+        turns += 1
+        if think_ms:
+            time.sleep(rng.uniform(0, think_ms) / 1000)
+
+def run_load_test(base_url, users, duration, max_requests=0, turns_per_session=5, timeout=90.0,
+                  think_ms=0.0, query_count=200):
+    queries = generate_queries(query_count)
+    result = LoadResult()
+    counter = {"lock": threading.Lock(), "sent": 0}
+    start = time.monotonic()
+    deadline = start + duration
+    threads = [
+        threading.Thread(target=_user_loop, daemon=True,
+                         args=(base_url, queries, deadline, max_requests, counter, result,
+                               turns_per_session, timeout, think_ms))
+        for _ in range(users)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_s = time.monotonic() - start
+    
+    total = len(result.latencies_ms)
+    error_total = sum(result.errors.values())
+    report = {
+        "meta": {"url": base_url, "users": users, "duration_s": duration, "turns_per_session": turns_per_session},
+        "requests": total,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(total / wall_s, 2) if wall_s > 0 else None,
+        "error_rate": round(error_total / total, 4) if total else None,
+        "status_codes": dict(result.status),
+        "errors": dict(result.errors),
+        "latency": percentiles(result.latencies_ms)
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="web_server 端到端压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=16, help="并发会话数")
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长（秒）")
+    parser.add_argument("--max-requests", type=int, default=0, help="最多发送的请求数，0表示不限制")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话的提问轮数")
+    parser.add_argument("--timeout", type=float, default=90.0, help="客户端超时（秒）")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="两次提问之间的随机思考时间上限（毫秒）")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    args = parser.parse_args()
+    
+    report = run_load_test(args.url.rstrip("/"), args.users, args.duration, args.max_requests,
+                           args.turns, args.timeout, args.think_ms)
+    write_results(report, args.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
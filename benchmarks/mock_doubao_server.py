@@ -0,0 +1,140 @@
+"""本地豆包chat-completions模拟服务
+
+模拟可配置的延迟分布、流式分块输出、429/5xx错误和超时，用于离线压测，
+避免消耗真实的API配额。将配置项 doubao_api_url（或环境变量 DOUBAO_API_URL）
+指向 http://127.0.0.1:9000/api/v3/chat/completions 即可使用。
+测试模型路由时可再启动一个低延迟实例，用 DOUBAO_FAST_API_URL 指向它作为小模型。
+
+用法:
+    python benchmarks/mock_doubao_server.py --port 9000 --latency-ms 800 --dist lognormal \\
+        --rate-429 0.02 --rate-5xx 0.01 --rate-timeout 0.005
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+class LatencyModel:
+    """延迟分布：fixed / uniform / normal / lognormal，均值和抖动单位为毫秒"""
+    
+    def __init__(self, dist="lognormal", mean_ms=800.0, jitter_ms=300.0, seed=None):
+        self.dist = dist
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+    
+    def sample(self):
+        if self.dist == "fixed" or self.jitter_ms <= 0:
+            value = self.mean_ms
+        elif self.dist == "uniform":
+            value = self.rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+        elif self.dist == "normal":
+            value = self.rng.gauss(self.mean_ms, self.jitter_ms)
+        else:
+            # 对数正态分布：长尾，更接近真实大模型接口的延迟
+            import math
+            sigma2 = math.log(1 + (self.jitter_ms / self.mean_ms) ** 2)
+            mu = math.log(self.mean_ms) - sigma2 / 2
+            value = self.rng.lognormvariate(mu, math.sqrt(sigma2))
+        return max(0.0, value) / 1000
+
+def create_app(latency, rate_429=0.0, rate_5xx=0.0, rate_timeout=0.0, timeout_s=60.0,
+               retry_after=1, stream_chunk_ms=30.0, answer_chars=120):
+    app = FastAPI(title="Mock Doubao")
+    stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "timeout": 0, "stream": 0}
+    rng = random.Random()
+    
+    def fake_answer(messages):
+        question = messages[-1]["content"][-40:] if messages else ""
+        body = "1. 登录企业手机银行，进入费控商旅\n2. 点击对应功能菜单\n3. 按页面提示填写信息并提交\n"
+        text = f"（模拟回答）{question}\n{body}"
+        return (text * (answer_chars // len(text) + 1))[:answer_chars]
+    
+    @app.post("/api/v3/chat/completions")
+    async def chat_completions(request: Request):
+        stats["requests"] += 1
+        payload = await request.json()
+        roll = rng.random()
+        if roll < rate_429:
+            stats["429"] += 1
+            return JSONResponse({"error": {"code": "RateLimitExceeded", "message": "mock 429"}},
+                                status_code=429, headers={"Retry-After": str(retry_after)})
+        roll -= rate_429
+        if roll < rate_5xx:
+            stats["5xx"] += 1
+            await asyncio.sleep(latency.sample() / 4)
+            return JSONResponse({"error": {"code": "InternalServiceError", "message": "mock 5xx"}},
+                                status_code=rng.choice([500, 502, 503]))
+        roll -= rate_5xx
+        if roll < rate_timeout:
+            stats["timeout"] += 1
+            await asyncio.sleep(timeout_s)
+        
+        answer = fake_answer(payload.get("messages", []))
+        model = payload.get("model", "mock")
+        created = int(time.time())
+        
+        if payload.get("stream"):
+            stats["stream"] += 1
+            
+            async def event_stream():
+                # 首包延迟按分布采样，之后按固定间隔输出分块
+                await asyncio.sleep(latency.sample())
+                step = 8
+                for i in range(0, len(answer), step):
+                    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": answer[i:i + step]}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(stream_chunk_ms / 1000)
+                yield "data: [DONE]\n\n"
+                stats["ok"] += 1
+            
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+        
+        await asyncio.sleep(latency.sample())
+        stats["ok"] += 1
+        # 按字符数粗略模拟token用量，便于观察各模型路由的费用统计
+        prompt_tokens = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+        return {
+            "id": "mock", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer),
+                      "total_tokens": prompt_tokens + len(answer)}
+        }
+    
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+    
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="本地豆包chat-completions模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--dist", default="lognormal", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="平均延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=300.0, help="延迟抖动/标准差（毫秒）")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="返回5xx的比例")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="挂起直到超时的比例")
+    parser.add_argument("--timeout-s", type=float, default=60.0, help="模拟超时时挂起的秒数")
+    parser.add_argument("--retry-after", type=int, default=1, help="429响应中的Retry-After秒数")
+    parser.add_argument("--stream-chunk-ms", type=float, default=30.0, help="流式输出分块间隔（毫秒）")
+    parser.add_argument("--answer-chars", type=int, default=120, help="回答长度（字符）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    latency = LatencyModel(args.dist, args.latency_ms, args.jitter_ms, args.seed)
+    app = create_app(latency, args.rate_429, args.rate_5xx, args.rate_timeout, args.timeout_s,
+                     args.retry_after, args.stream_chunk_ms, args.answer_chars)
+    print(f"模拟服务地址: http://{args.host}:{args.port}/api/v3/chat/completions")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
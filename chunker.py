@@ -0,0 +1,211 @@
+import re
+from collections import namedtuple
+import numpy as np
+
+# kind: heading / paragraph / list_item / table_row；level: 标题级别（1开始），其他块为0
+Block = namedtuple("Block", ["kind", "text", "level"])
+
+HEADING = "heading"
+PARAGRAPH = "paragraph"
+LIST_ITEM = "list_item"
+TABLE_ROW = "table_row"
+
+# 句末标点（含后随的引号、括号）和换行
+_SENTENCE_END = re.compile(r"[。！？!?；;]+[”’\"）)]*|\n")
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+# 中文编号标题：第一章 / 一、 / （一）
+_CN_HEADINGS = (
+    (re.compile(r"^第[一二三四五六七八九十百\d]+[章部篇]"), 1),
+    (re.compile(r"^第[一二三四五六七八九十百\d]+节"), 2),
+    (re.compile(r"^[一二三四五六七八九十]+、"), 2),
+    (re.compile(r"^[（(][一二三四五六七八九十]+[)）]"), 3),
+)
+_LIST_ITEM = re.compile(r"^(?:[-*+•·]\s+|\d{1,2}[.、．)）]\s*|[（(]\d{1,2}[)）]\s*|[①-⑳]\s*|第[一二三四五六七八九十]+步)")
+_MD_TABLE_RULE = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+_TERMINAL_PUNCT = "。！？!?；;，,：:"
+# 编号标题可能的首字符，其余行只有紧跟空行时才可能是标题
+_HEADING_START = set("#第一二三四五六七八九十（(")
+# 标题的最大长度，更长的行按正文处理
+MAX_HEADING_CHARS = 40
+
+def _heading_level(line, after_blank):
+    """纯文本行是否为标题，返回标题级别，不是标题返回0"""
+    if len(line) > MAX_HEADING_CHARS or (not after_blank and line[0] not in _HEADING_START):
+        return 0
+    match = _MD_HEADING.match(line)
+    if match:
+        return len(match.group(1))
+    for pattern, level in _CN_HEADINGS:
+        if pattern.match(line) and line[-1] not in _TERMINAL_PUNCT:
+            return level
+    # 空行后不带标点的短行视为章节标题，例如“出差申请操作步骤”
+    if after_blank and line[-1] not in _TERMINAL_PUNCT and not _LIST_ITEM.match(line):
+        return 1
+    return 0
+
+def parse_text(text, ext=".txt"):
+    """把纯文本、Markdown或CSV解析为结构块序列"""
+    blocks = []
+    if ext == ".csv":
+        for line in text.splitlines():
+            if line.strip():
+                blocks.append(Block(TABLE_ROW, line.strip(), 0))
+        return blocks
+    
+    after_blank = True
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            after_blank = True
+            continue
+        if line.startswith("|"):
+            if not _MD_TABLE_RULE.match(line):
+                blocks.append(Block(TABLE_ROW, line, 0))
+        elif _LIST_ITEM.match(line):
+            blocks.append(Block(LIST_ITEM, line, 0))
+        else:
+            level = _heading_level(line, after_blank)
+            if level:
+                blocks.append(Block(HEADING, _MD_HEADING.sub(r"\2", line), level))
+            else:
+                blocks.append(Block(PARAGRAPH, line, 0))
+        after_blank = False
+    return blocks
+
+def sentence_bounds(text):
+    """句子结束位置数组（升序），末尾总是包含文本长度"""
+    bounds = np.fromiter((m.end() for m in _SENTENCE_END.finditer(text)), dtype=np.int64)
+    if not len(bounds) or bounds[-1] != len(text):
+        bounds = np.append(bounds, len(text))
+    return bounds
+
+def split_sentences(text, limit, overlap=0):
+    """按句子边界把超长文本切成不超过 limit 的片段，没有合适边界时硬切
+    
+    Args:
+        text: 文本
+        limit: 片段最大长度
+        overlap: 相邻片段的重叠字符数，从句子边界开始重叠
+    """
+    bounds = sentence_bounds(text)
+    pieces = []
+    start = 0
+    length = len(text)
+    while start < length:
+        if length - start <= limit:
+            end = length
+        else:
+            index = np.searchsorted(bounds, start + limit, side="right") - 1
+            end = int(bounds[index]) if index >= 0 and bounds[index] > start else start + limit
+        piece = text[start:end].strip()
+        if piece:
+            pieces.append(piece)
+        if end >= length:
+            break
+        next_start = end
+        if overlap:
+            index = np.searchsorted(bounds, end - overlap, side="left")
+            if index < len(bounds) and start < bounds[index] < end:
+                next_start = int(bounds[index])
+        start = next_start
+    return pieces
+
+def _run_length(blocks, start, kind):
+    """从 start 开始同类块连续出现的总长度"""
+    total = 0
+    for index in range(start, len(blocks)):
+        if blocks[index].kind != kind:
+            break
+        total += len(blocks[index].text) + 1
+    return total
+
+def chunk_blocks(blocks, chunk_size=400, chunk_overlap=50):
+    """按文档结构单次遍历切分，返回 [(文档块文本, 标题路径列表)]
+    
+    - 遇到标题即结束上一个章节，文档块不跨章节
+    - 连续的列表项、表格行整段放得进一个文档块时不拆开，表格续块重复表头
+    - 超长段落按预先计算的句子边界切分
+    - 章节内的续块以标题路径开头，保证每个文档块都能看出所属章节
+    
+    Args:
+        blocks: 结构块序列
+        chunk_size: 文档块最大长度（字符）
+        chunk_overlap: 超长段落切分时相邻片段的重叠长度
+    """
+    chunks = []
+    path = []            # [(级别, 标题)]
+    lines = []           # 当前文档块的行
+    size = 0
+    body = 0             # 当前文档块中标题、续块前缀之外的行数
+    table_header = None
+    
+    def titles():
+        return [title for _, title in path]
+    
+    def add(line, is_body=True):
+        nonlocal size, body
+        lines.append(line)
+        size += len(line) + 1
+        body += is_body
+    
+    def flush():
+        nonlocal lines, size, body
+        if body:
+            chunks.append(("\n".join(lines), titles()))
+        lines, size, body = [], 0, 0
+    
+    def start_continuation(table_row=False):
+        if path:
+            add(" > ".join(titles()), is_body=False)
+        if table_row and table_header is not None:
+            add(table_header, is_body=False)
+    
+    for index, block in enumerate(blocks):
+        if block.kind == HEADING:
+            flush()
+            while path and path[-1][0] >= block.level:
+                path.pop()
+            path.append((block.level, block.text))
+            add(block.text, is_body=False)
+            table_header = None
+            continue
+        
+        previous_kind = blocks[index - 1].kind if index else None
+        run_start = block.kind in (LIST_ITEM, TABLE_ROW) and previous_kind != block.kind
+        if block.kind == TABLE_ROW and run_start:
+            table_header = block.text
+        
+        length = len(block.text) + 1
+        overflow = size + length > chunk_size
+        carry = None
+        if run_start and body:
+            # 列表或表格开头：当前文档块放不下整段、新文档块放得下时，提前换块
+            run = _run_length(blocks, index, block.kind)
+            prefix = len(" > ".join(titles())) + 1 if path else 0
+            if size + run > chunk_size and prefix + run <= chunk_size:
+                overflow = True
+            # 引出列表的说明（以冒号结尾）随列表一起移到新文档块
+            if overflow and body > 1 and lines[-1][-1] in "：:" and prefix + run + len(lines[-1]) < chunk_size:
+                carry = lines.pop()
+                size -= len(carry) + 1
+                body -= 1
+        if overflow and body:
+            flush()
+            start_continuation(block.kind == TABLE_ROW and not run_start)
+            if carry is not None:
+                add(carry)
+        
+        if size + length > chunk_size:
+            # 单个块超长：按句子边界切成多个文档块
+            limit = max(chunk_size - size, chunk_size // 2)
+            for piece in split_sentences(block.text, limit, chunk_overlap):
+                if body:
+                    flush()
+                    start_continuation()
+                add(piece)
+            continue
+        
+        add(block.text)
+    
+    flush()
+    return chunks
@@ -0,0 +1,125 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_config():
+    """加载服务配置，环境变量优先于默认值
+    
+    多进程部署时每个工作进程独立调用该函数，因此配置不能只存在于启动脚本中。
+    """
+    doubao_api_url = os.environ.get("DOUBAO_API_URL", "https://ark.cn-beijing.volces.com/api/v3/chat/completions")
+    doubao_model = os.environ.get("DOUBAO_MODEL", "doubao-seed-1-6-251015")
+    config = {
+        "data_dir": os.environ.get("RAG_DATA_DIR", os.path.join(BASE_DIR, "审核后资料文件夹")),
+        "vector_db_path": os.environ.get("RAG_VECTOR_DB_PATH", os.path.join(BASE_DIR, "vector_db", "faiss_index.bin")),
+        "log_dir": os.environ.get("RAG_LOG_DIR", os.path.join(BASE_DIR, "logs")),
+        "doubao_api_key": os.environ.get("DOUBAO_API_KEY", "1457918f-9107-4ca2-9c0d-bcda415e3830"),
+        # 豆包接口地址和模型，压测时可指向本地模拟服务
+        "doubao_api_url": doubao_api_url,
+        "doubao_model": doubao_model,
+        # 服务监听配置
+        "host": os.environ.get("RAG_HOST", "0.0.0.0"),
+        "port": int(os.environ.get("RAG_PORT", "8000")),
+        # 工作进程数量，大于1时启用多进程模式，各进程共享同一份只读快照
+        "workers": int(os.environ.get("RAG_WORKERS", "1")),
+        # 会话存储：memory（进程内）/ sqlite（向量库目录下的 sessions.db，各工作进程共享）/ auto（多进程时用sqlite）
+        "session_store": os.environ.get("RAG_SESSION_STORE", "auto"),
+        # 启动预热时执行一次检索用的查询
+        "warmup_query": os.environ.get("RAG_WARMUP_QUERY", "如何提交出差申请"),
+        # 后台检查其他进程发布的新快照的间隔和检查资料目录变化的间隔（秒），资料目录检查为0表示不检查
+        "snapshot_poll_s": float(os.environ.get("RAG_SNAPSHOT_POLL_S", "2")),
+        "data_check_interval_s": float(os.environ.get("RAG_DATA_CHECK_INTERVAL_S", "10")),
+        # WebSocket聊天通道：空闲时的心跳间隔和没有收到客户端消息时的关闭超时（秒）
+        "ws_heartbeat_s": float(os.environ.get("RAG_WS_HEARTBEAT_S", "25")),
+        "ws_idle_timeout_s": float(os.environ.get("RAG_WS_IDLE_TIMEOUT_S", "75")),
+        # JSON接口响应体超过该大小（字节）且客户端支持时gzip压缩，0表示不压缩
+        "json_gzip_min_bytes": int(os.environ.get("RAG_JSON_GZIP_MIN_BYTES", "1024")),
+        "json_gzip_level": 5,
+        # 检索融合：rrf（倒数排名融合）或 weighted（归一化加权融合）
+        "fusion_method": os.environ.get("RAG_FUSION_METHOD", "rrf"),
+        "fusion_weights": {"mandatory": 1.0, "keyword": 1.0, "vector": 1.0},
+        "rrf_k": 60,
+        # 向量索引：auto 按规模和目标召回率选择，或直接指定FAISS工厂字符串（如 "IVF256,Flat"、"HNSW32,Flat"）
+        "index_type": os.environ.get("RAG_INDEX_TYPE", "auto"),
+        "index_target_recall": float(os.environ.get("RAG_INDEX_TARGET_RECALL", "0.95")),
+        # 检索参数自动调优时单次查询的延迟预算（毫秒）
+        "index_latency_budget_ms": float(os.environ.get("RAG_INDEX_LATENCY_BUDGET_MS", "2.0")),
+        # 向量压缩：空（float32原始向量）/ sq8（约4倍）/ pq（约16倍）
+        "index_compression": os.environ.get("RAG_INDEX_COMPRESSION") or None,
+        # 压缩索引的精确重排候选数，0表示不重排
+        "index_rerank_top_n": int(os.environ.get("RAG_INDEX_RERANK_TOP_N", "64")),
+        # 检索参数调优用的真实问题文件（每行一个），为空时从语料中抽样留出行
+        "index_tuning_queries": os.environ.get("RAG_INDEX_TUNING_QUERIES") or None,
+        # 解析结果按文件内容哈希缓存到向量库目录，重建时未变化的文件跳过解析
+        "parse_cache": os.environ.get("RAG_PARSE_CACHE", "1") == "1",
+        # 并行解析的进程数，0表示按CPU核数
+        "parse_workers": int(os.environ.get("RAG_PARSE_WORKERS", "0")),
+        # 切分后合并近似重复文档块的Jaccard阈值（字符5-gram），0表示不去重
+        "dedupe_threshold": float(os.environ.get("RAG_DEDUPE_THRESHOLD", "0.95")),
+        # 向量检索微批处理：合并该窗口（毫秒）内到达的并发查询，0表示关闭
+        "retrieval_batch_window_ms": float(os.environ.get("RAG_RETRIEVAL_BATCH_WINDOW_MS", "2.0")),
+        "retrieval_batch_max_size": int(os.environ.get("RAG_RETRIEVAL_BATCH_MAX_SIZE", "32")),
+        # 批量查询：单次最多查询数和同时进行的大模型调用数
+        "batch_max_queries": int(os.environ.get("RAG_BATCH_MAX_QUERIES", "500")),
+        "batch_llm_concurrency": int(os.environ.get("RAG_BATCH_LLM_CONCURRENCY", "8")),
+        # 大模型调用策略：整体截止时间、单次尝试超时和最多尝试次数（秒）
+        "llm_deadline_s": float(os.environ.get("RAG_LLM_DEADLINE_S", "30")),
+        "llm_attempt_timeout_s": float(os.environ.get("RAG_LLM_ATTEMPT_TIMEOUT_S", "20")),
+        "llm_max_attempts": int(os.environ.get("RAG_LLM_MAX_ATTEMPTS", "3")),
+        "llm_backoff_base_s": 0.5,
+        "llm_backoff_max_s": 8.0,
+        # 对冲请求：耗时超过近期p95仍未返回时补发一个相同请求
+        "llm_hedge": os.environ.get("RAG_LLM_HEDGE", "0") == "1",
+        "llm_hedge_quantile": 0.95,
+        # 熔断：连续失败次数阈值和冷却时间（秒）
+        "llm_breaker_threshold": 5,
+        "llm_breaker_reset_s": 30.0,
+        # 模型路由：检索置信度高、问题短、对话浅的请求走小模型，其余走大模型，小模型失败或无法回答时升级
+        "llm_routing": os.environ.get("RAG_LLM_ROUTING", "1") == "1",
+        # 各路由的模型、接口地址（可指向本地模拟服务）和单价（元/千tokens），api_key为空时使用 doubao_api_key
+        "llm_routes": {
+            "large": {
+                "model": doubao_model,
+                "api_url": doubao_api_url,
+                "cost_per_1k_input": 0.0008,
+                "cost_per_1k_output": 0.008
+            },
+            "fast": {
+                "model": os.environ.get("DOUBAO_FAST_MODEL", "doubao-seed-1-6-flash-250828"),
+                "api_url": os.environ.get("DOUBAO_FAST_API_URL", doubao_api_url),
+                "cost_per_1k_input": 0.00015,
+                "cost_per_1k_output": 0.0015
+            }
+        },
+        # 走小模型的条件：最低检索置信度（0-1，问题在最相关文档块中的词面重合度）、最大问题长度和最大对话轮次
+        "route_min_confidence": float(os.environ.get("RAG_ROUTE_MIN_CONFIDENCE", "0.6")),
+        "route_max_query_chars": int(os.environ.get("RAG_ROUTE_MAX_QUERY_CHARS", "40")),
+        "route_max_depth": int(os.environ.get("RAG_ROUTE_MAX_DEPTH", "2")),
+        # 抽取式回答：操作步骤类问题在检索置信度和词面重合度达到阈值时不调用大模型，大模型不可用时也用作降级回答
+        "extractive_answers": os.environ.get("RAG_EXTRACTIVE_ANSWERS", "1") == "1",
+        "extractive_min_confidence": float(os.environ.get("RAG_EXTRACTIVE_MIN_CONFIDENCE", "0.8")),
+        "extractive_min_overlap": float(os.environ.get("RAG_EXTRACTIVE_MIN_OVERLAP", "0.6")),
+        "extractive_min_steps": 2,
+        # 快速路径适用的最大对话轮次，默认只用于会话的第一个问题
+        "extractive_max_depth": 0,
+        # 准入控制：每个工作进程的并发上限、等待队列长度和排队超时（秒）
+        "max_concurrent_requests": int(os.environ.get("RAG_MAX_CONCURRENT_REQUESTS", "32")),
+        "max_queued_requests": int(os.environ.get("RAG_MAX_QUEUED_REQUESTS", "64")),
+        "queue_timeout_s": float(os.environ.get("RAG_QUEUE_TIMEOUT_S", "5.0")),
+        # 令牌桶限流（每秒请求数，0表示不限制）和突发容量，为整个服务的限额，多进程时按进程数平分到各进程
+        "rate_limit_ip_rps": float(os.environ.get("RAG_RATE_LIMIT_IP_RPS", "20")),
+        "rate_limit_ip_burst": int(os.environ.get("RAG_RATE_LIMIT_IP_BURST", "40")),
+        "rate_limit_session_rps": float(os.environ.get("RAG_RATE_LIMIT_SESSION_RPS", "1")),
+        "rate_limit_session_burst": int(os.environ.get("RAG_RATE_LIMIT_SESSION_BURST", "5")),
+        # 受信任的反向代理地址（IP或CIDR，逗号分隔），来自这些地址的请求按 X-Forwarded-For 中的客户端地址限流
+        "trusted_proxies": [value for value in os.environ.get("RAG_TRUSTED_PROXIES", "").split(",") if value.strip()],
+        # 日志配置档：dev / default / production
+        "log_profile": os.environ.get("RAG_LOG_PROFILE", "default")
+    }
+    return config
+
+def ensure_dirs(config):
+    """确保必要的目录存在"""
+    os.makedirs(os.path.dirname(config["vector_db_path"]), exist_ok=True)
+    os.makedirs(config["log_dir"], exist_ok=True)
+    os.makedirs(config["data_dir"], exist_ok=True)
@@ -1,16 +1,32 @@
 import os
 import glob
-import faiss
+import logging
 import numpy as np
 import hashlib
-import psutil
 import gc
-from docx import Document
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
+from collections import Counter
+from snapshot_store import SnapshotStore, DocumentStore
+from extractive import chunk_type
+from dedup import dedupe_documents
+from chunker import parse_text, chunk_blocks
+from parsers import registry as parser_registry, ParseCache, parse_file, parse_file_safe
+from segmenter import Segmenter
+from lexical_index import LexicalIndex
+from metrics import timed
+from logging_setup import get_logger, log_rate_limited
+
+logger = get_logger("data_loader")
+
+# 待解析文件达到该数量才启用进程池，文件少时进程启动开销大于收益
+PARALLEL_PARSE_MIN_FILES = 16
 
 class DataLoader:
-    def __init__(self, data_dir, vector_db_path):
+    def __init__(self, data_dir, vector_db_path, index_type="auto", target_recall=0.95,
+                 search_latency_budget_ms=2.0, compression=None, rerank_top_n=0, dedupe_threshold=0.95,
+                 parse_cache=True, parse_workers=0, tuning_queries=None):
         self.data_dir = data_dir
         self.vector_db_path = vector_db_path
         self.vector_store = None
@@ -18,91 +34,67 @@ class DataLoader:
         self.file_hashes = {}
         self.vector_dim = 128  # 固定向量维度
         self.max_memory_usage = 0.8  # 最大内存使用比例 (80%)
+        self._process = None
+        # 快照存储：多个工作进程共享同一份只读快照，由单一进程负责重建
+        self.snapshot_store = SnapshotStore(os.path.join(os.path.dirname(vector_db_path), "snapshots"))
+        self.generation = None
+        # 索引类型：auto 按规模和目标召回率自动选择，也可直接指定FAISS工厂字符串
+        self.index_type = index_type
+        self.target_recall = target_recall
+        self.search_latency_budget_ms = search_latency_budget_ms
+        # 向量压缩：None / "sq8" / "pq"；rerank_top_n 大于0时用float16原始向量对前N个候选精确重排
+        self.compression = compression
+        self.rerank_top_n = rerank_top_n
+        # 检索参数调优用的真实问题文件（每行一个），为空时从语料中抽样留出行
+        self.tuning_queries = tuning_queries
+        # 近似重复文档块合并的Jaccard阈值，0表示不去重
+        self.dedupe_threshold = dedupe_threshold
+        # 解析结果缓存（按文件内容哈希）和并行解析的进程数（0表示按CPU核数）
+        self.parse_cache = None
+        if parse_cache:
+            self.parse_cache = ParseCache(os.path.join(os.path.dirname(vector_db_path), "parse_cache"))
+        self.parse_workers = parse_workers
+        # 领域分词器（编译后的词典缓存在向量库目录）和文档块的词ID数组
+        self.segmenter = Segmenter(cache_dir=os.path.join(os.path.dirname(vector_db_path), "segmenter"))
+        self.lexical_index = None
+        self.index_info = {}
     
     def _check_memory_usage(self):
         """检查当前内存使用情况"""
-        process = psutil.Process(os.getpid())
+        # 复用进程句柄，避免每个批次重新创建
+        if self._process is None:
+            # psutil 只在入库时用到，服务启动时不导入
+            import psutil
+            self._process = psutil.Process(os.getpid())
+        process = self._process
         memory_info = process.memory_info()
         memory_percent = process.memory_percent()
         
-        print(f"当前内存使用: {memory_info.rss / 1024 / 1024:.2f} MB ({memory_percent:.2f}%)")
+        log_rate_limited(logger, logging.DEBUG, "memory_usage", "当前内存使用: %.2f MB (%.2f%%)",
+                         memory_info.rss / 1024 / 1024, memory_percent)
         
         # 检查是否超过内存限制
         if memory_percent > self.max_memory_usage * 100:
-            print("警告：内存使用超过限制，正在清理内存...")
+            log_rate_limited(logger, logging.WARNING, "memory_limit", "内存使用超过限制，正在清理内存...")
             # 强制垃圾回收
             gc.collect()
             # 再次检查内存使用
             memory_percent = process.memory_percent()
-            print(f"清理后内存使用: {memory_percent:.2f}%")
+            logger.debug("清理后内存使用: %.2f%%", memory_percent)
             return False
         
         return True
     
-    def split_single_text(self, text, chunk_size=400, chunk_overlap=50):
-        """优化的文本切分功能，确保操作步骤完整包含在一个文档块内"""
-        print(f"开始切分文本，长度: {len(text)} 字符")
-        chunks = []
-        start = 0
-        text_length = len(text)
-        max_iterations = (text_length + chunk_size - 1) // (chunk_size - chunk_overlap) + 10
-        iteration_count = 0
-        
-        # 特殊处理：检测并单独分块操作步骤
-        operation_keywords = ["登录企业手机银行", "进入费控商旅", "点击出差申请", "新建出差申请单"]
-        
-        # 检查是否包含操作步骤
-        contains_operation = any(keyword in text for keyword in operation_keywords)
-        
-        if contains_operation:
-            print("检测到操作步骤，使用特殊分块策略")
-            # 尝试找到操作步骤的完整范围
-            operation_start = text.find(operation_keywords[0])
-            if operation_start != -1:
-                # 向后查找操作步骤的结束位置
-                operation_end = text.find("。", operation_start + 100)
-                if operation_end == -1:
-                    operation_end = text.find("\n", operation_start + 100)
-                if operation_end == -1:
-                    operation_end = min(operation_start + 300, text_length)
-                
-                # 提取操作步骤块
-                operation_chunk = text[operation_start:operation_end].strip()
-                if operation_chunk:
-                    chunks.append(operation_chunk)
-                    print(f"提取操作步骤块: {operation_chunk[:150]}...")
-                    start = operation_end
-        
-        while start < text_length and iteration_count < max_iterations:
-            iteration_count += 1
-            end = min(start + chunk_size, text_length)
-            
-            # 简化的句子边界分割
-            if end < text_length:
-                # 只查找最近的几个标点符号，减少计算量
-                punctuation = ['.', '。', '!', '！', '?', '？', ';', '；', '\n']
-                # 从end开始向前搜索最多20个字符
-                search_end = max(start, end - 20)
-                for i in range(end - 1, search_end - 1, -1):
-                    if text[i] in punctuation:
-                        end = i + 1
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # 计算下一个起始位置
-            next_start = end - chunk_overlap
-            # 防止无限循环
-            if next_start <= start:
-                next_start = start + 1
-            start = next_start
-        
-        if iteration_count >= max_iterations:
-            print(f"警告：文本切分达到最大迭代次数 {max_iterations}，可能存在问题")
-        
-        print(f"文本切分完成，生成 {len(chunks)} 个 chunks")
+    def split_single_text(self, content, chunk_size=400, chunk_overlap=50, ext=".txt"):
+        """按文档结构切分，返回 [(文档块文本, 标题路径列表)]
+        
+        Args:
+            content: 纯文本，或解析器给出的结构块列表（如Word文档）
+            ext: 纯文本的文件类型，决定按Markdown/纯文本还是CSV解析
+        """
+        blocks = content if isinstance(content, list) else parse_text(content, ext)
+        chunks = chunk_blocks(blocks, chunk_size, chunk_overlap)
+        logger.debug("文本切分完成，%d 个结构块生成 %d 个 chunks", len(blocks), len(chunks))
         return chunks
     
     def simple_embed(self, text):
@@ -125,131 +117,154 @@ class DataLoader:
         
         return vector
     
+    def embed_batch(self, texts):
+        """批量计算嵌入向量，结果与逐条调用 simple_embed 一致
+        
+        Returns:
+            形状为 (len(texts), vector_dim) 的float32矩阵
+        """
+        matrix = np.zeros((len(texts), self.vector_dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            if not text:
+                continue
+            # Counter 按字符首次出现的顺序保存频率，与 simple_embed 的映射方式相同
+            freqs = list(Counter(text).values())[:self.vector_dim]
+            matrix[row, :len(freqs)] = freqs
+            matrix[row] /= len(text)
+        return matrix
+    
+    @timed("rebuild.load_files")
     def load_files(self):
-        """加载指定目录下的所有文件"""
-        print("开始加载文件...")
-        self._check_memory_usage()
+        """加载指定目录下的所有文件，返回 [(文件路径, 结构块列表)]
         
-        files = glob.glob(os.path.join(self.data_dir, "**/*"), recursive=True)
-        valid_files = []
+        内容未变化的文件直接读取解析缓存；需要解析的文件较多时用多个进程并行解析。
+        """
+        logger.info("开始加载文件...")
+        self._check_memory_usage()
         
+        files = [path for path in glob.glob(os.path.join(self.data_dir, "**/*"), recursive=True)
+                 if os.path.isfile(path)]
+        parsed = {}
+        pending = []    # [(文件路径, 缓存键)]
         for file_path in files:
-            if os.path.isfile(file_path):
-                try:
-                    # 检查内存使用
-                    if not self._check_memory_usage():
-                        print(f"内存不足，跳过文件: {file_path}")
+            parser = parser_registry.for_path(file_path)
+            if parser is None or not parser.available:
+                ext = os.path.splitext(file_path)[1].lower()
+                if parser is None:
+                    log_rate_limited(logger, logging.INFO, f"unsupported:{ext}", "不支持的文件类型: %s", ext)
+                else:
+                    log_rate_limited(logger, logging.WARNING, f"unsupported:{ext}",
+                                     "解析 %s 文件需要安装 %s，已跳过", ext, parser.requires)
+                continue
+            key = None
+            if self.parse_cache is not None:
+                content_hash = self._content_hash(file_path)
+                if content_hash:
+                    key = ParseCache.key(content_hash, parser.name)
+                    blocks = self.parse_cache.get(key)
+                    if blocks is not None:
+                        parsed[file_path] = blocks
                         continue
-                    
-                    content = self._read_file(file_path)
-                    if content:
-                        valid_files.append((file_path, content))
-                except Exception as e:
-                    print(f"无法读取文件 {file_path}: {str(e)}")
-        
-        print(f"文件加载完成，共加载 {len(valid_files)} 个有效文件")
+            pending.append((file_path, key))
+        
+        for (file_path, key), blocks in zip(pending, self._parse_files([path for path, _ in pending])):
+            if blocks is None:
+                continue
+            parsed[file_path] = blocks
+            if key is not None:
+                self.parse_cache.put(key, blocks)
+        
+        valid_files = [(path, parsed[path]) for path in files if parsed.get(path)]
+        if self.parse_cache is not None:
+            # 已修改或删除的文件对应的缓存条目不会再被用到
+            removed = self.parse_cache.prune()
+            logger.info("解析缓存命中 %d 个文件，解析 %d 个文件，清理 %d 个过期条目",
+                        len(files) - len(pending), len(pending), removed)
+        logger.info("文件加载完成，共加载 %d 个有效文件", len(valid_files))
         self._check_memory_usage()
         return valid_files
     
-    def _read_file(self, file_path):
-        """根据文件类型读取文件内容"""
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        if ext == '.txt' or ext == '.md' or ext == '.csv':
-            # 读取文本文件
-            print(f"正在读取文本文件: {file_path}")
-            # 使用生成器方式分批读取
-            content_generator = self._read_large_file(file_path, chunk_size=1024*1024)  # 1MB chunks
-            content = ''.join(content_generator)
-            print(f"读取完成，文本长度: {len(content)} 字符")
-            # 限制文本长度，避免处理过大的文件
-            max_length = 500000  # 500KB
-            if len(content) > max_length:
-                print(f"文本过长，截断到 {max_length} 字符")
-                content = content[:max_length]
-            return content
-        elif ext == '.docx':
-            # 读取Word文档
-            print(f"正在读取Word文档: {file_path}")
-            # 限制Word文档处理规模
-            content = self._read_large_docx(file_path, max_paras=500, max_length=500000)
-            if content:
-                print(f"读取完成，文本长度: {len(content)} 字符")
-            return content
-        else:
-            # 不支持的文件类型
-            print(f"不支持的文件类型: {ext}")
-            return None
+    def _content_hash(self, file_path):
+        """文件内容哈希；修改时间和大小与记录一致时直接使用记录的哈希，不再读取文件"""
+        stored = self.file_hashes.get(file_path)
+        if stored and stored.get('hash'):
+            try:
+                file_stat = os.stat(file_path)
+                if stored['mtime'] == file_stat.st_mtime and stored['size'] == file_stat.st_size:
+                    return stored['hash']
+            except OSError:
+                return None
+        return self._calculate_file_hash(file_path)
     
-    def _read_large_file(self, file_path, chunk_size=1024*1024):
-        """分批读取大文件"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                yield chunk
+    def _parse_files(self, paths):
+        """解析文件列表，返回与 paths 对应的结构块列表（失败或跳过为None）"""
+        workers = min(self.parse_workers or os.cpu_count() or 1, len(paths))
+        results = None
+        if workers > 1 and len(paths) >= PARALLEL_PARSE_MIN_FILES:
+            logger.info("使用 %d 个进程并行解析 %d 个文件", workers, len(paths))
+            try:
+                # spawn启动的子进程不继承服务进程中的线程和锁
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    results = list(pool.map(parse_file_safe, paths, chunksize=max(1, len(paths) // (workers * 4))))
+            except Exception as e:
+                logger.warning("并行解析失败，改为逐个解析: %s", e)
+                results = None
+        if results is None:
+            results = []
+            for file_path in paths:
+                # 检查内存使用
+                if not self._check_memory_usage():
+                    logger.warning("内存不足，跳过文件: %s", file_path)
+                    results.append((None, None))
+                    continue
+                logger.debug("正在解析文件: %s", file_path)
+                results.append(parse_file_safe(file_path))
+        
+        blocks_list = []
+        for file_path, (blocks, error) in zip(paths, results):
+            if error is not None:
+                logger.warning("无法读取文件 %s: %s", file_path, error)
+            blocks_list.append(blocks)
+        return blocks_list
     
-    def _read_large_docx(self, file_path, max_paras=500, max_length=500000):
-        """分批处理大Word文档"""
-        try:
-            doc = Document(file_path)
-            full_text = []
-            para_count = len(doc.paragraphs)
-            print(f"文档包含 {para_count} 个段落")
-            
-            # 限制处理的段落数量
-            actual_paras = min(para_count, max_paras)
-            if para_count > max_paras:
-                print(f"段落过多，只处理前 {actual_paras} 个段落")
-            
-            current_length = 0
-            for i in range(actual_paras):
-                if i % 100 == 0:
-                    print(f"处理段落 {i}/{actual_paras}")
-                
-                para_text = doc.paragraphs[i].text
-                para_length = len(para_text)
-                
-                # 检查是否超过长度限制
-                if current_length + para_length > max_length:
-                    print(f"文本长度达到限制，停止处理")
-                    break
-                
-                full_text.append(para_text)
-                current_length += para_length
-            
-            content = '\n'.join(full_text)
-            return content
-        except Exception as e:
-            print(f"处理Word文档时出错: {str(e)}")
-            return None
+    def _read_file(self, file_path):
+        """按文件类型解析单个文件为结构块列表，不支持的类型返回None"""
+        return parse_file(file_path)
     
+    @timed("rebuild.split_text")
     def split_text(self, files):
         """切分文本为小块"""
         documents = []
-        print(f"开始处理 {len(files)} 个文件的文本切分")
+        logger.info("开始处理 %d 个文件的文本切分", len(files))
         
         for file_path, content in files:
-            print(f"处理文件: {file_path}")
-            chunks = self.split_single_text(content)
-            for i, chunk in enumerate(chunks):
+            logger.debug("处理文件: %s", file_path)
+            chunks = self.split_single_text(content, ext=os.path.splitext(file_path)[1].lower())
+            for i, (chunk, heading_path) in enumerate(chunks):
                 doc = {
                     "page_content": chunk,
                     "metadata": {
                         "source": file_path,
-                        "chunk_index": i
+                        "chunk_index": i,
+                        "chunk_type": chunk_type(chunk),
+                        "heading_path": heading_path
                     }
                 }
                 documents.append(doc)
-            print(f"文件处理完成: {file_path}, 生成 {len(chunks)} 个文档块")
+            logger.debug("文件处理完成: %s, 生成 %d 个文档块", file_path, len(chunks))
+        
+        # 不同文件中重复出现的模板段落只保留一份，metadata["sources"] 记录全部来源
+        if self.dedupe_threshold:
+            documents = dedupe_documents(documents, self.dedupe_threshold)
         
-        print(f"文本切分完成，共生成 {len(documents)} 个文档块")
+        logger.info("文本切分完成，共生成 %d 个文档块", len(documents))
         return documents
     
+    @timed("rebuild.compute_embeddings")
     def compute_embeddings(self, documents):
         """计算文本嵌入向量"""
-        print(f"开始计算 {len(documents)} 个文档的嵌入向量")
+        logger.info("开始计算 %d 个文档的嵌入向量", len(documents))
         self._check_memory_usage()
         
         embeddings = []
@@ -260,14 +275,15 @@ class DataLoader:
         for batch_idx in range(total_batches):
             # 检查内存使用
             if not self._check_memory_usage():
-                print(f"内存不足，减少批次大小")
+                logger.warning("内存不足，减少批次大小")
                 batch_size = max(10, batch_size // 2)  # 减少批次大小
             
             start_idx = batch_idx * batch_size
             end_idx = min((batch_idx + 1) * batch_size, len(documents))
             batch_docs = documents[start_idx:end_idx]
             
-            print(f"处理批次 {batch_idx + 1}/{total_batches}, 文档范围: {start_idx}-{end_idx}")
+            log_rate_limited(logger, logging.DEBUG, "embedding_batches", "处理批次 %d/%d, 文档范围: %d-%d",
+                             batch_idx + 1, total_batches, start_idx, end_idx)
             
             # 处理当前批次
             for doc in batch_docs:
@@ -277,85 +293,172 @@ class DataLoader:
             
             # 每处理完一个批次，清理一次内存
             if (batch_idx + 1) % 5 == 0:
-                print("清理内存...")
+                logger.debug("清理内存...")
                 gc.collect()
                 self._check_memory_usage()
         
-        print(f"嵌入向量计算完成，共生成 {len(embeddings)} 个向量")
+        logger.info("嵌入向量计算完成，共生成 %d 个向量", len(embeddings))
         self._check_memory_usage()
         return np.array(embeddings).astype('float32')
     
+    def _tuning_query_embeddings(self):
+        """读取调参用的真实问题并计算嵌入，未配置或文件不可用时返回None"""
+        if not self.tuning_queries:
+            return None
+        try:
+            with open(self.tuning_queries, "r", encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            logger.warning("读取调参问题文件失败，改为从语料中抽样: %s", e)
+            return None
+        if not queries:
+            return None
+        return np.array([self.simple_embed(query) for query in queries], dtype=np.float32)
+    
+    @timed("rebuild.build_vector_store")
     def build_vector_store(self, documents, embeddings):
         """构建FAISS向量库（优化版本）"""
-        print(f"开始构建向量库，文档数: {len(documents)}, 向量维度: {embeddings.shape[1]}")
+        import faiss
+        import ann_index
+        logger.info("开始构建向量库，文档数: %d, 向量维度: %d", len(documents), embeddings.shape[1])
         
         dimension = embeddings.shape[1]
         
-        # 根据向量数量选择合适的索引类型
-        if len(embeddings) < 1000:
-            # 小数据集使用简单索引
-            print("使用 IndexFlatL2 索引（小数据集）")
-            index = faiss.IndexFlatL2(dimension)
+        # 根据向量数量、目标召回率和压缩方式选择索引类型
+        if self.index_type == "auto":
+            factory = ann_index.choose_factory_string(len(embeddings), dimension, self.target_recall,
+                                                      self.compression)
         else:
-            # 大数据集使用IVF索引加速
-            nlist = min(100, len(embeddings) // 10)
-            print(f"使用 IndexIVFFlat 索引（大数据集），聚类数: {nlist}")
-            quantizer = faiss.IndexFlatL2(dimension)
-            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
-            # IVF索引需要训练
-            print("训练IVF索引...")
-            index.train(embeddings)
-        
-        # 添加向量
-        print("添加向量到索引...")
-        index.add(embeddings)
-        print(f"向量库构建完成，共添加 {index.ntotal} 个向量")
-        
-        # 保存向量库和文档
-        print(f"保存向量库到: {self.vector_db_path}")
-        faiss.write_index(index, self.vector_db_path)
-        
-        # 保存文档信息到磁盘
-        import pickle
-        docs_path = self.vector_db_path.replace('.bin', '_docs.pkl')
-        print(f"保存文档信息到: {docs_path}")
-        with open(docs_path, 'wb') as f:
-            pickle.dump(documents, f)
-        
-        self.vector_store = index
-        self.documents = documents
-        
-        # 更新文件哈希
+            factory = self.index_type
+        logger.info("使用索引 %s，向量数: %d", factory, len(embeddings))
+        index = ann_index.build_index(embeddings, factory)
+        logger.info("向量库构建完成，共添加 %d 个向量", index.ntotal)
+        
+        # 压缩存储时保留一份float16原始向量，检索时对候选精确重排
+        rerank = self.rerank_top_n > 0 and ann_index.is_compressed(factory)
+        vectors_f16 = embeddings.astype(np.float16) if rerank else None
+        search_index = ann_index.RerankIndex(index, vectors_f16, self.rerank_top_n) if rerank else index
+        
+        # 对照精确检索自动调整 nprobe / efSearch，结果随快照保存
+        tuning = ann_index.auto_tune(search_index, embeddings, self.target_recall, self.search_latency_budget_ms,
+                                     queries=self._tuning_query_embeddings())
+        index_info = {"factory": factory, "rerank_top_n": self.rerank_top_n if rerank else 0, **tuning}
+        
+        # 更新文件哈希，随快照一起保存，工作进程加载快照时无需重新计算
         self._update_file_hashes()
-        print("向量库构建和保存完成")
         
+        # 写入新版本快照并原子发布
+        snapshot_dir = self.snapshot_store.begin()
+        try:
+            logger.debug("保存向量库快照到: %s", snapshot_dir)
+            index_path = os.path.join(snapshot_dir, SnapshotStore.INDEX_FILE)
+            faiss.write_index(index, index_path)
+            if rerank:
+                np.save(os.path.join(snapshot_dir, SnapshotStore.VECTORS_FILE), vectors_f16)
+            index_info["index_bytes"] = os.path.getsize(index_path)
+            index_info["bytes_per_vector"] = round(index_info["index_bytes"] / max(1, index.ntotal), 2)
+            DocumentStore.write(snapshot_dir, documents)
+            # 文档块入库时分词一次，词ID数组随快照保存，检索时关键词匹配不再扫描文本
+            index_info["vocab_size"] = LexicalIndex.write(snapshot_dir, [doc["page_content"] for doc in documents],
+                                                          self.segmenter)
+            manifest = {
+                "created_at": time.time(),
+                "document_count": len(documents),
+                "vector_dim": int(dimension),
+                "index": index_info,
+                "file_hashes": self.file_hashes
+            }
+            generation = self.snapshot_store.publish(snapshot_dir, manifest)
+        except Exception:
+            self.snapshot_store.discard(snapshot_dir)
+            raise
+        logger.info("快照发布完成，版本: %d", generation)
+        
+        # 切换到内存映射的快照，释放构建时的内存副本
+        if not self._load_snapshot(generation):
+            self.vector_store = search_index
+            self.documents = documents
+            self.index_info = index_info
+            self.lexical_index = None
+        logger.info("向量库构建和保存完成")
+    
     def load_vector_store(self):
         """加载已有的向量库"""
+        generation = self.snapshot_store.current_generation()
+        if generation is not None and self._load_snapshot(generation):
+            return True
+        
+        # 兼容旧版本的单文件向量库
         if os.path.exists(self.vector_db_path):
             try:
+                import faiss
                 self.vector_store = faiss.read_index(self.vector_db_path)
+                self.lexical_index = None
                 
                 # 尝试从磁盘加载文档信息
                 import pickle
                 docs_path = self.vector_db_path.replace('.bin', '_docs.pkl')
                 if os.path.exists(docs_path):
-                    print(f"从磁盘加载文档信息: {docs_path}")
+                    logger.info("从磁盘加载文档信息: %s", docs_path)
                     with open(docs_path, 'rb') as f:
                         self.documents = pickle.load(f)
-                    print(f"成功加载 {len(self.documents)} 个文档")
+                    logger.info("成功加载 %d 个文档", len(self.documents))
                 else:
                     # 如果没有保存的文档信息，再重新加载
-                    print("没有找到保存的文档信息，重新加载文件...")
+                    logger.warning("没有找到保存的文档信息，重新加载文件...")
                     files = self.load_files()
                     self.documents = self.split_text(files)
                 
                 self._update_file_hashes()
                 return True
             except Exception as e:
-                print(f"加载向量库失败: {str(e)}")
+                logger.error("加载向量库失败: %s", e)
                 return False
         return False
     
+    def _load_snapshot(self, generation):
+        """以内存映射方式加载指定版本的快照"""
+        # faiss 导入较慢，推迟到第一次加载索引（启动预热线程）时
+        import faiss
+        import ann_index
+        snapshot_dir = self.snapshot_store.generation_dir(generation)
+        try:
+            manifest = self.snapshot_store.read_manifest(generation)
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            index = faiss.read_index(os.path.join(snapshot_dir, SnapshotStore.INDEX_FILE),
+                                     mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            documents = DocumentStore(snapshot_dir)
+            lexical_index = LexicalIndex.load(snapshot_dir, documents.get_text)
+            # 应用构建时调优得到的检索参数
+            index_info = manifest.get("index", {})
+            ann_index.apply_search_params(index, index_info.get("search_params"))
+            if index_info.get("rerank_top_n"):
+                vectors = np.load(os.path.join(snapshot_dir, SnapshotStore.VECTORS_FILE), mmap_mode='r')
+                index = ann_index.RerankIndex(index, vectors, index_info["rerank_top_n"])
+        except Exception as e:
+            logger.error("加载快照 %d 失败: %s", generation, e)
+            return False
+        
+        old_documents = self.documents
+        self.documents = documents
+        self.vector_store = index
+        self.lexical_index = lexical_index
+        self.file_hashes = dict(manifest.get("file_hashes", {}))
+        self.index_info = index_info
+        self.generation = generation
+        logger.info("已加载快照版本 %d，文档数: %d", generation, len(documents))
+        
+        # 旧快照的映射交给垃圾回收处理，仍在使用的请求持有各自的引用
+        del old_documents
+        return True
+    
+    def refresh_if_stale(self):
+        """检查是否有其他进程发布了新快照，有则切换，返回是否发生切换"""
+        generation = self.snapshot_store.current_generation()
+        if generation is None or generation == self.generation:
+            return False
+        return self._load_snapshot(generation)
+    
     def _calculate_file_hash(self, file_path, block_size=8192):
         """使用流式读取计算文件哈希值"""
         hasher = hashlib.md5()
@@ -368,12 +471,13 @@ class DataLoader:
                     hasher.update(data)
             return hasher.hexdigest()
         except Exception as e:
-            print(f"计算文件哈希失败 {file_path}: {str(e)}")
+            logger.warning("计算文件哈希失败 %s: %s", file_path, e)
             return None
     
     def _update_file_hashes(self):
-        """更新文件哈希值，用于检测文件变更"""
+        """更新文件哈希值，用于检测文件变更；只保留当前存在的文件，已删除文件的记录随之清除"""
         files = glob.glob(os.path.join(self.data_dir, "**/*"), recursive=True)
+        file_hashes = {}
         for file_path in files:
             if os.path.isfile(file_path):
                 try:
@@ -384,9 +488,10 @@ class DataLoader:
                         'size': file_stat.st_size,
                         'hash': self._calculate_file_hash(file_path)
                     }
-                    self.file_hashes[file_path] = file_info
+                    file_hashes[file_path] = file_info
                 except Exception as e:
-                    print(f"更新文件信息失败 {file_path}: {str(e)}")
+                    logger.warning("更新文件信息失败 %s: %s", file_path, e)
+        self.file_hashes = file_hashes
     
     def check_for_changes(self):
         """检查是否有文件变更"""
@@ -405,34 +510,64 @@ class DataLoader:
                     
                     # 检查文件是否存在于记录中
                     if file_path not in self.file_hashes:
-                        print(f"检测到新增文件: {file_path}")
+                        logger.info("检测到新增文件: %s", file_path)
                         return True
                     
                     # 首先使用修改时间和大小进行初步检测
                     stored_info = self.file_hashes[file_path]
                     if stored_info['mtime'] != current_mtime or stored_info['size'] != current_size:
-                        print(f"检测到文件变更: {file_path}")
+                        logger.info("检测到文件变更: %s", file_path)
                         return True
-                        
+                
                 except Exception as e:
-                    print(f"检查文件变更失败 {file_path}: {str(e)}")
+                    log_rate_limited(logger, logging.WARNING, "check_changes", "检查文件变更失败 %s: %s", file_path, e)
         
         # 检查删除的文件
         for file_path in self.file_hashes:
             if file_path not in current_files:
-                print(f"检测到文件删除: {file_path}")
+                logger.info("检测到文件删除: %s", file_path)
                 return True
         
         return False
     
-    def rebuild_vector_store(self):
-        """重新构建向量库"""
-        print("检测到文件变更，正在重新构建向量库...")
-        files = self.load_files()
-        documents = self.split_text(files)
-        if documents:
-            embeddings = self.compute_embeddings(documents)
-            self.build_vector_store(documents, embeddings)
-            print("向量库重建完成")
-        else:
-            print("没有可处理的文档")
+    def rebuild_vector_store(self, force=False, progress=None):
+        """重新构建向量库
+        
+        多进程部署时，只有获得重建锁的进程执行重建，其余进程直接返回，
+        之后通过refresh_if_stale加载新快照。
+        
+        Args:
+            force: 资料没有变化时也重建
+            progress: 进度回调 progress(阶段, 序号, 总阶段数)，每个阶段开始时调用
+        
+        Returns:
+            bool: 本进程执行了重建返回True，否则返回False
+        """
+        lock = self.snapshot_store.builder_lock()
+        if not lock.acquire(blocking=False):
+            logger.info("其他进程正在重建向量库，跳过")
+            return False
+        
+        with lock:
+            # 等待锁期间其他进程可能已经完成重建
+            self.refresh_if_stale()
+            if not force and self.vector_store is not None and not self.check_for_changes():
+                logger.info("向量库已是最新，无需重建")
+                return False
+            
+            logger.info("检测到文件变更，正在重新构建向量库...")
+            report = progress or (lambda stage, step, total: None)
+            report("load_files", 1, 4)
+            files = self.load_files()
+            report("split_text", 2, 4)
+            documents = self.split_text(files)
+            if documents:
+                report("compute_embeddings", 3, 4)
+                embeddings = self.compute_embeddings(documents)
+                report("build_vector_store", 4, 4)
+                self.build_vector_store(documents, embeddings)
+                logger.info("向量库重建完成")
+                return True
+            else:
+                logger.warning("没有可处理的文档")
+                return False
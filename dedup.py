@@ -0,0 +1,107 @@
+import numpy as np
+from collections import defaultdict
+from logging_setup import get_logger
+
+logger = get_logger("dedup")
+
+# 字符shingle长度
+SHINGLE_SIZE = 5
+# MinHash签名长度 = 分段数 × 每段行数；8×8时相似度约0.77以上的文档块对大概率落入同一个桶
+LSH_BANDS = 8
+LSH_ROWS = 8
+NUM_PERM = LSH_BANDS * LSH_ROWS
+# 签名估计值比阈值低出该值以上的候选直接排除（约3倍标准差）
+ESTIMATE_MARGIN = 0.15
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(20240611)
+# 乘移位哈希的参数，a取奇数
+_PERM_A = _rng.randint(1, 2 ** 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 2 ** 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_BASE = np.uint64(1000003)
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """字符shingle的64位哈希（多项式滚动哈希，向量化计算），去重后返回"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        size = max(1, len(codes))
+    if not len(codes):
+        return np.zeros(1, dtype=np.uint64)
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    # uint64溢出按模2^64回绕，正是需要的行为
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes = hashes * _BASE + codes[offset:offset + count]
+    return np.unique(hashes)
+
+def jaccard(first, second):
+    """两个已排序去重的哈希数组的Jaccard相似度"""
+    common = len(np.intersect1d(first, second, assume_unique=True))
+    return common / (len(first) + len(second) - common)
+
+def find_near_duplicates(texts, threshold=0.95):
+    """MinHash-LSH查找近似重复的文本
+    
+    LSH只用来找候选，候选按shingle集合的精确Jaccard相似度确认；
+    每个文本只和已有的规范文本比较，不会因为传递关系把差异较大的文本串在一起。
+    
+    Args:
+        texts: 文本列表
+        threshold: Jaccard相似度达到该值视为重复
+    
+    Returns:
+        与 texts 等长的列表，每项为其规范文本的下标（自身为规范文本时等于自身下标）
+    """
+    canonical = list(range(len(texts)))
+    if len(texts) < 2:
+        return canonical
+    shingles = [shingle_hashes(text) for text in texts]
+    signatures = np.empty((len(texts), NUM_PERM), dtype=np.uint64)
+    buckets = defaultdict(list)
+    # 签名估计值的标准差约 sqrt(J(1-J)/NUM_PERM)，低于阈值太多的候选不必精确计算
+    estimate_floor = threshold - ESTIMATE_MARGIN
+    for index, hashes in enumerate(shingles):
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) >> np.uint64(32)
+        signature = signatures[index] = permuted.min(axis=0) & _MASK32
+        keys = [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()) for band in range(LSH_BANDS)]
+        
+        # 同一个桶里的规范文本即为候选，按出现顺序逐个确认
+        candidates = sorted({other for key in keys for other in buckets.get(key, ())})
+        for other in candidates:
+            size, other_size = len(hashes), len(shingles[other])
+            # Jaccard相似度不超过两个集合大小之比
+            if min(size, other_size) < threshold * max(size, other_size):
+                continue
+            if np.count_nonzero(signatures[other] == signature) < estimate_floor * NUM_PERM:
+                continue
+            if jaccard(hashes, shingles[other]) >= threshold:
+                canonical[index] = other
+                break
+        else:
+            for key in keys:
+                buckets[key].append(index)
+    return canonical
+
+def dedupe_documents(documents, threshold=0.95):
+    """合并近似重复的文档块，规范文档块的 metadata["sources"] 记录所有出现过的源文件
+    
+    Returns:
+        去重后的文档块列表
+    """
+    canonical = find_near_duplicates([doc["page_content"] for doc in documents], threshold)
+    kept = []
+    sources = {}
+    for index, doc in enumerate(documents):
+        root = canonical[index]
+        source = doc["metadata"].get("source")
+        if root == index:
+            doc["metadata"]["sources"] = sources[index] = [source]
+            kept.append(doc)
+        elif source not in sources[root]:
+            sources[root].append(source)
+    removed = len(documents) - len(kept)
+    if removed:
+        logger.info("近似重复文档块去重: %d -> %d（合并 %d 个）", len(documents), len(kept), removed)
+    return kept
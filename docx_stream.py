@@ -0,0 +1,251 @@
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from chunker import Block, HEADING, PARAGRAPH, LIST_ITEM, TABLE_ROW
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_P = _W + "p"
+_T = _W + "t"
+_TAB = _W + "tab"
+_BR = _W + "br"
+_CR = _W + "cr"
+_TBL = _W + "tbl"
+_TR = _W + "tr"
+_TC = _W + "tc"
+_BODY = _W + "body"
+_P_STYLE = _W + "pStyle"
+_NUM_ID = _W + "numId"
+_ILVL = _W + "ilvl"
+_OUTLINE = _W + "outlineLvl"
+_GRID_SPAN = _W + "gridSpan"
+_V_MERGE = _W + "vMerge"
+_VAL = _W + "val"
+
+# 内置样式名（styles.xml 中为小写）和中文版Word的样式名
+_HEADING_STYLE = re.compile(r"^(?:heading|标题)\s*(\d)$")
+
+class DocxStyles:
+    """styles.xml 和 numbering.xml 中与结构识别有关的信息"""
+    
+    def __init__(self, archive):
+        # 样式ID -> (样式名小写, 大纲级别, 列表编号ID, 基础样式ID)
+        self.styles = {}
+        # 列表编号ID -> {级别: 是否为项目符号}
+        self.bullets = {}
+        self._heading_cache = {}
+        if "word/styles.xml" in archive.namelist():
+            self._read_styles(ET.fromstring(archive.read("word/styles.xml")))
+        if "word/numbering.xml" in archive.namelist():
+            self._read_numbering(ET.fromstring(archive.read("word/numbering.xml")))
+    
+    def _read_styles(self, root):
+        for style in root.iter(_W + "style"):
+            name = style.find(_W + "name")
+            based_on = style.find(_W + "basedOn")
+            outline = style.find(f"{_W}pPr/{_OUTLINE}")
+            num_id = style.find(f"{_W}pPr/{_W}numPr/{_NUM_ID}")
+            self.styles[style.get(_W + "styleId")] = (
+                name.get(_VAL, "").lower() if name is not None else "",
+                int(outline.get(_VAL)) if outline is not None else None,
+                num_id.get(_VAL) if num_id is not None else None,
+                based_on.get(_VAL) if based_on is not None else None
+            )
+    
+    def _read_numbering(self, root):
+        abstract = {}
+        for item in root.iter(_W + "abstractNum"):
+            levels = abstract[item.get(_W + "abstractNumId")] = {}
+            for level in item.iter(_W + "lvl"):
+                num_fmt = level.find(_W + "numFmt")
+                levels[int(level.get(_ILVL, 0))] = num_fmt is not None and num_fmt.get(_VAL) == "bullet"
+        for num in root.iter(_W + "num"):
+            abstract_id = num.find(_W + "abstractNumId")
+            if abstract_id is not None:
+                self.bullets[num.get(_NUM_ID)] = abstract.get(abstract_id.get(_VAL), {})
+    
+    def heading_level(self, style_id, depth=0):
+        """样式对应的标题级别，沿 basedOn 继承，不是标题样式返回0"""
+        if style_id not in self.styles or depth > 10:
+            return 0
+        if depth == 0 and style_id in self._heading_cache:
+            return self._heading_cache[style_id]
+        name, outline, _, based_on = self.styles[style_id]
+        match = _HEADING_STYLE.match(name)
+        if name == "title":
+            level = 1
+        elif match:
+            level = int(match.group(1))
+        elif outline is not None:
+            # 大纲级别从0开始，9表示正文
+            level = outline + 1 if outline < 9 else 0
+        else:
+            level = self.heading_level(based_on, depth + 1)
+        if depth == 0:
+            self._heading_cache[style_id] = level
+        return level
+    
+    def style_name(self, style_id):
+        return self.styles.get(style_id, ("",))[0]
+    
+    def style_num_id(self, style_id, depth=0):
+        """样式自带的列表编号ID（如“列表编号”样式），沿 basedOn 继承"""
+        if style_id not in self.styles or depth > 10:
+            return None
+        _, _, num_id, based_on = self.styles[style_id]
+        return num_id if num_id is not None else self.style_num_id(based_on, depth + 1)
+    
+    def is_bullet(self, num_id, level):
+        levels = self.bullets.get(num_id)
+        if levels is None:
+            return None
+        return levels.get(level, levels.get(0, False))
+
+class _Paragraph:
+    __slots__ = ("parts", "style", "num_id", "level", "outline")
+    
+    def __init__(self):
+        self.parts = []
+        self.style = None
+        self.num_id = None
+        self.level = 0
+        self.outline = None
+
+def iter_docx_blocks(file_path):
+    """流式解析 .docx，按文档顺序逐个产出结构块
+    
+    直接增量解析压缩包中的 word/document.xml，处理完的元素立即释放（表格逐行释放），内存占用与文档大小无关。
+    段落按样式（含 basedOn 继承和大纲级别）识别标题，按编号定义区分编号列表和项目符号列表；
+    表格逐行产出，单元格用 " | " 连接，纵向合并的单元格沿用上方的内容，嵌套表格的文字并入外层单元格。
+    
+    Args:
+        file_path: 文件路径或文件对象
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        styles = DocxStyles(archive)
+        with archive.open("word/document.xml") as stream:
+            yield from _iter_body(stream, styles)
+
+def _iter_body(stream, styles):
+    body = None
+    paragraphs = []      # 嵌套段落（文本框等）各自收集文字
+    table_depth = 0
+    table = None         # 当前最外层表格元素，处理完的行从中摘除
+    row = None           # 当前表格行的单元格文字
+    cell = None          # 当前单元格的段落文字
+    column = 0           # 当前单元格在表格网格中的列号
+    span = 1
+    merged = False
+    merged_above = {}    # 列号 -> 纵向合并起始单元格的文字
+    counters = {}        # (编号ID, 级别) -> 当前序号
+    
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _P:
+                paragraphs.append(_Paragraph())
+            elif tag == _TBL:
+                table_depth += 1
+                if table_depth == 1:
+                    table = elem
+                    merged_above = {}
+            elif tag == _BODY:
+                body = elem
+            elif table_depth == 1:
+                if tag == _TR:
+                    row, column = [], 0
+                elif tag == _TC:
+                    cell, span, merged = [], 1, False
+            continue
+        
+        if tag == _T:
+            if paragraphs and elem.text:
+                paragraphs[-1].parts.append(elem.text)
+        elif tag == _TAB:
+            # 段落属性里的制表位定义也是 w:tab，位于文字之前，首尾空白会被去掉
+            if paragraphs:
+                paragraphs[-1].parts.append("\t")
+        elif tag == _BR or tag == _CR:
+            if paragraphs:
+                paragraphs[-1].parts.append("\n")
+        elif tag == _P_STYLE:
+            if paragraphs:
+                paragraphs[-1].style = elem.get(_VAL)
+        elif tag == _NUM_ID:
+            if paragraphs:
+                paragraphs[-1].num_id = elem.get(_VAL)
+        elif tag == _ILVL:
+            if paragraphs:
+                paragraphs[-1].level = int(elem.get(_VAL, 0))
+        elif tag == _OUTLINE:
+            if paragraphs:
+                paragraphs[-1].outline = int(elem.get(_VAL, 9))
+        elif tag == _GRID_SPAN and table_depth == 1:
+            span = int(elem.get(_VAL, 1))
+        elif tag == _V_MERGE and table_depth == 1:
+            # 没有 val 或 val="continue" 表示延续上方单元格
+            merged = elem.get(_VAL, "continue") == "continue"
+        elif tag == _P:
+            paragraph = paragraphs.pop()
+            text = "".join(paragraph.parts).strip()
+            if table_depth:
+                if text and cell is not None:
+                    cell.append(text)
+            elif text:
+                yield _paragraph_block(paragraph, text, styles, counters)
+            elem.clear()
+        elif table_depth == 1 and tag == _TC:
+            text = " ".join(cell)
+            if merged:
+                text = merged_above.get(column, text)
+            else:
+                merged_above[column] = text
+            # 横向合并的单元格只出现一次，与相邻重复内容一起去重
+            if not row or row[-1] != text:
+                row.append(text)
+            column += span
+            cell = None
+        elif table_depth == 1 and tag == _TR:
+            line = " | ".join(row)
+            row = None
+            # 行处理完即从表格中摘除，纵向合并只依赖 merged_above，不再读取之前的行
+            table.remove(elem)
+            if line.strip(" |"):
+                yield Block(TABLE_ROW, line, 0)
+        elif tag == _TBL:
+            table_depth -= 1
+            if table_depth == 0:
+                table = None
+        
+        if body is not None and table_depth == 0 and tag in (_P, _TBL):
+            # 正文的直接子元素处理完后从树上摘除，保持内存恒定
+            body.clear()
+
+def _paragraph_block(paragraph, text, styles, counters):
+    """把一个段落转换为结构块"""
+    level = styles.heading_level(paragraph.style)
+    if paragraph.outline is not None and paragraph.outline < 9:
+        level = paragraph.outline + 1
+    if level:
+        # 文档块不跨章节，列表序号在新章节重新开始，与切分结果一致
+        counters.clear()
+        return Block(HEADING, text, level)
+    
+    num_id = paragraph.num_id or styles.style_num_id(paragraph.style)
+    if num_id == "0":
+        # numId 为0表示取消样式自带的编号
+        num_id = None
+    name = styles.style_name(paragraph.style)
+    if num_id is None and not name.startswith("list"):
+        return Block(PARAGRAPH, text, 0)
+    
+    bullet = styles.is_bullet(num_id, paragraph.level)
+    if bullet is None:
+        bullet = "number" not in name
+    if bullet:
+        return Block(LIST_ITEM, f"- {text}", 0)
+    # 编号由Word渲染，文本中没有，按同一编号定义下的序号补上；上级编号前进时下级重新计数
+    key = (num_id, paragraph.level)
+    counters[key] = counters.get(key, 0) + 1
+    for other in [other for other in counters if other[0] == num_id and other[1] > paragraph.level]:
+        del counters[other]
+    return Block(LIST_ITEM, f"{counters[key]}. {text}", 0)
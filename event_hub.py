@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import threading
+from metrics import registry
+from logging_setup import get_logger, log_rate_limited
+
+logger = get_logger("event_hub")
+
+class _Subscriber:
+    """一个WebSocket连接的事件队列及其所属的事件循环"""
+    
+    __slots__ = ("loop", "queue")
+    
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+
+class EventHub:
+    """服务端推送事件（快照版本切换、重建进度）的广播中心
+    
+    publish 可以在任意线程调用（重建在后台线程中执行），事件通过 call_soon_threadsafe
+    放入各连接的有界队列；客户端读得太慢、队列已满时丢弃该连接的这条事件，不阻塞发布方。
+    """
+    
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+    
+    def subscribe(self):
+        """在事件循环中调用，返回该连接的事件队列"""
+        subscriber = _Subscriber(asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue))
+        with self._lock:
+            self._subscribers.add(subscriber)
+            count = len(self._subscribers)
+        registry.set_gauge("rag_ws_connections", count, "WebSocket连接数")
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            count = len(self._subscribers)
+        registry.set_gauge("rag_ws_connections", count, "WebSocket连接数")
+    
+    def __len__(self):
+        return len(self._subscribers)
+    
+    def publish(self, event):
+        """向所有连接广播事件（线程安全）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(self._offer, subscriber.queue, event)
+            except RuntimeError:
+                # 事件循环已关闭，连接随之结束
+                self.unsubscribe(subscriber)
+    
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            registry.inc("rag_ws_events_dropped_total", 1, help_text="因客户端读取过慢丢弃的推送事件数")
+            log_rate_limited(logger, logging.WARNING, "event_hub.dropped", "WebSocket连接事件队列已满，丢弃事件: %s",
+                             event.get("type"))
@@ -0,0 +1,134 @@
+import re
+from model_router import ModelRouter, query_overlap
+from metrics import registry
+from logging_setup import get_logger
+
+logger = get_logger("extractive")
+
+# 编号步骤：1. / 1、 / (1) / ① / 第一步
+_NUMBERED_STEP = re.compile(r"(?:^|(?<=[\n。；;：:]))\s*(?:第[一二三四五六七八九十]+步[：:，,]?|\d{1,2}[.、．)）]|[（(]\d{1,2}[)）]|[①-⑩])\s*")
+# 未编号的操作步骤：以操作动词开头、用逗号或箭头连接的短句
+_CLAUSE_SPLIT = re.compile(r"[，,。；;：:\n→>]+")
+_ACTION_VERB = re.compile(r"^(?:先|再|然后|最后|并)?(?:登录|进入|点击|选择|填写|输入|新建|提交|上传|确认|打开|返回|勾选|查看|"
+                          r"添加|导入|扫描|拍照|保存|发起|关联|核对|下载|切换|搜索|选中|录入|完成)")
+# 询问操作方法的问句
+_HOW_TO = re.compile(r"怎么|怎样|如何|步骤|流程|操作|在哪|哪里|入口")
+_STEP_TRAILING = "，,。；;：: "
+
+NO_LLM_NOTICE = "（系统繁忙，以上内容摘自相关资料，如需进一步帮助请转人工客服。）"
+
+def extract_steps(text):
+    """从文本块中提取操作步骤列表，不是操作步骤时返回空列表"""
+    # 1. 带编号的步骤，每步只取到行尾，避免把后面的说明文字并入最后一步
+    parts = [part.split("\n", 1)[0].strip().rstrip(_STEP_TRAILING) for part in _NUMBERED_STEP.split(text)]
+    numbered = [part for part in parts[1:] if part]
+    if len(numbered) >= 2:
+        return _unique(numbered)
+    
+    # 2. 连续的操作短句，取最长的一段
+    best, run = [], []
+    for clause in _CLAUSE_SPLIT.split(text):
+        clause = clause.strip()
+        if clause and _ACTION_VERB.match(clause):
+            run.append(clause)
+        elif clause:
+            if len(run) > len(best):
+                best = run
+            run = []
+    if len(run) > len(best):
+        best = run
+    best = _unique(best)
+    return best if len(best) >= 2 else []
+
+def _unique(steps):
+    """去掉重复出现的步骤，保持顺序"""
+    seen = set()
+    return [step for step in steps if not (step in seen or seen.add(step))]
+
+def chunk_type(text):
+    """文本块类型：procedure（操作步骤）或 text"""
+    return "procedure" if extract_steps(text) else "text"
+
+def format_steps(steps):
+    return "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+
+class ExtractiveAnswerer:
+    """抽取式回答：不调用大模型，直接把检索到的操作步骤整理成回答
+    
+    - 快速路径：问题在问操作方法、检索置信度达到阈值、前几个文档块中有操作步骤且步骤与问题的词面重合度
+      （字二元组和三元组，见 query_overlap 的 strict）达到阈值时使用，拿不准时交给大模型
+    - 降级路径：大模型不可用或超过截止时间时，放宽条件从前几个文档块中摘取内容
+    """
+    
+    def __init__(self, min_confidence=0.8, min_overlap=0.6, min_steps=2, max_depth=0, top_n=3,
+                 degraded_min_overlap=0.3):
+        """
+        Args:
+            min_confidence: 快速路径要求的最低检索置信度（0-1）
+            min_overlap: 快速路径要求的查询与操作步骤的最低词面重合度（0-1）
+            min_steps: 快速路径要求的最少步骤数
+            max_depth: 快速路径适用的最大对话轮次，多轮追问通常需要结合上下文，交给大模型
+            top_n: 从排名前几的文档块中挑选
+            degraded_min_overlap: 降级回答要求的最低词面重合度，低于该值时不摘录，避免答非所问
+        """
+        self.min_confidence = min_confidence
+        self.min_overlap = min_overlap
+        self.min_steps = min_steps
+        self.max_depth = max_depth
+        self.top_n = top_n
+        self.degraded_min_overlap = degraded_min_overlap
+    
+    @staticmethod
+    def _steps(doc):
+        # 切分时已标注类型的文档块直接跳过非操作步骤
+        if doc.get("metadata", {}).get("chunk_type", "procedure") != "procedure":
+            return []
+        return extract_steps(doc["page_content"])
+    
+    def answer(self, query, relevant_docs, conversation_depth=0):
+        """满足快速路径条件时返回抽取式回答文本，否则返回None"""
+        if not relevant_docs or conversation_depth > self.max_depth or not _HOW_TO.search(query):
+            return None
+        if ModelRouter.retrieval_confidence(query, relevant_docs) < self.min_confidence:
+            return None
+        
+        # 重合度只按步骤本身计算，避免文档块里的说明文字碰巧包含查询词
+        best, best_overlap = None, self.min_overlap
+        for doc in relevant_docs[:self.top_n]:
+            steps = self._steps(doc)
+            if len(steps) < self.min_steps:
+                continue
+            overlap = query_overlap(query, "\n".join(steps), strict=True)
+            if overlap >= best_overlap:
+                best, best_overlap = steps, overlap
+        if best is None:
+            return None
+        registry.inc("rag_extractive_answers_total", help_text="不调用大模型的抽取式回答数", mode="fast")
+        return format_steps(best)
+    
+    def degraded_answer(self, query, relevant_docs):
+        """大模型不可用时的降级回答：优先取操作步骤，其次摘录最相关文档块的开头，没有资料时返回None"""
+        if not relevant_docs:
+            return None
+        overlap, best = max(((query_overlap(query, doc["page_content"]), index)
+                             for index, doc in enumerate(relevant_docs[:self.top_n])), key=lambda item: item[0])
+        if overlap < self.degraded_min_overlap:
+            return None
+        best = relevant_docs[best]
+        steps = self._steps(best)
+        if steps:
+            message = format_steps(steps)
+        else:
+            message = self._excerpt(best["page_content"])
+        registry.inc("rag_extractive_answers_total", help_text="不调用大模型的抽取式回答数", mode="degraded")
+        logger.info("大模型不可用，返回抽取式降级回答")
+        return f"{message}\n\n{NO_LLM_NOTICE}"
+    
+    @staticmethod
+    def _excerpt(text, max_chars=200):
+        """截取开头，尽量在句末断开"""
+        text = text.strip()
+        if len(text) <= max_chars:
+            return text
+        cut = max(text.rfind(mark, 0, max_chars) for mark in "。！？；\n")
+        return text[:cut + 1] if cut > 0 else text[:max_chars] + "..."
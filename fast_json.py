@@ -0,0 +1,53 @@
+import gzip
+import json
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时使用标准库，输出格式相同
+    orjson = None
+
+# 小于该大小（字节）的响应体不压缩，压缩收益抵不上CPU开销
+GZIP_MIN_BYTES = 1024
+# gzip压缩级别：5级的压缩率与9级相差很小，耗时约为一半
+GZIP_LEVEL = 5
+
+def dumps(obj):
+    """序列化为UTF-8编码的紧凑JSON字节串；numpy数值和数组按普通数字和列表输出"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def _default(obj):
+    # 标准库不认识的numpy类型
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def accepts_gzip(request):
+    """请求是否接受gzip编码（q=0 表示明确拒绝）"""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+def json_response(request, content, status_code=200, headers=None, min_size=None, level=None):
+    """返回JSON响应：用 dumps 序列化（不经过 jsonable_encoder），响应体较大且客户端支持时gzip压缩
+    
+    Args:
+        request: 当前请求，用于判断是否接受gzip
+        content: 可JSON序列化的对象
+        min_size: 压缩阈值（字节），为空时使用 GZIP_MIN_BYTES，0表示不压缩
+        level: gzip压缩级别，为空时使用 GZIP_LEVEL
+    """
+    body = dumps(content)
+    headers = dict(headers or {})
+    min_size = GZIP_MIN_BYTES if min_size is None else min_size
+    if min_size and len(body) >= min_size:
+        headers["Vary"] = "Accept-Encoding"
+        if request is not None and accepts_gzip(request):
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,80 @@
+import numpy as np
+
+# 各检索器的默认融合权重
+DEFAULT_WEIGHTS = {"mandatory": 1.0, "keyword": 1.0, "vector": 1.0}
+
+def _empty():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+def _top_k(unique_ids, fused, top_k):
+    """用argpartition选出得分最高的top_k个，再只对这部分排序"""
+    if len(fused) > top_k:
+        part = np.argpartition(-fused, top_k - 1)[:top_k]
+    else:
+        part = np.arange(len(fused))
+    # 得分相同时按文档块ID升序，保证结果稳定
+    order = np.lexsort((unique_ids[part], -fused[part]))
+    selected = part[order]
+    return unique_ids[selected], fused[selected]
+
+def _accumulate(id_parts, score_parts, top_k):
+    if not id_parts:
+        return _empty()
+    all_ids = np.concatenate(id_parts)
+    all_scores = np.concatenate(score_parts)
+    # 按文档块ID去重并累加各检索器的贡献
+    unique_ids, inverse = np.unique(all_ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=all_scores, minlength=len(unique_ids))
+    return _top_k(unique_ids, fused, top_k)
+
+def reciprocal_rank_fusion(candidates, weights=None, top_k=8, k=60):
+    """倒数排名融合（RRF）
+    
+    Args:
+        candidates: {检索器名称: (文档块ID数组, 得分数组)}，ID按相关度从高到低排列
+        weights: {检索器名称: 权重}
+        top_k: 返回数量
+        k: RRF平滑常数
+    
+    Returns:
+        (文档块ID数组, 融合得分数组)，按融合得分降序
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    id_parts, score_parts = [], []
+    for name, (ids, _) in candidates.items():
+        weight = weights.get(name, 0.0)
+        if len(ids) == 0 or weight <= 0:
+            continue
+        ranks = np.arange(1, len(ids) + 1, dtype=np.float64)
+        id_parts.append(np.asarray(ids, dtype=np.int64))
+        score_parts.append(weight / (k + ranks))
+    return _accumulate(id_parts, score_parts, top_k)
+
+def weighted_score_fusion(candidates, weights=None, top_k=8):
+    """加权得分融合：各检索器得分先做min-max归一化，再按权重求和
+    
+    参数和返回值同 reciprocal_rank_fusion。
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    id_parts, score_parts = [], []
+    for name, (ids, scores) in candidates.items():
+        weight = weights.get(name, 0.0)
+        if len(ids) == 0 or weight <= 0:
+            continue
+        scores = np.asarray(scores, dtype=np.float64)
+        low, high = scores.min(), scores.max()
+        if high > low:
+            normalized = (scores - low) / (high - low)
+        else:
+            normalized = np.ones_like(scores)
+        id_parts.append(np.asarray(ids, dtype=np.int64))
+        score_parts.append(weight * normalized)
+    return _accumulate(id_parts, score_parts, top_k)
+
+def fuse(candidates, method="rrf", weights=None, top_k=8, rrf_k=60):
+    """按配置选择融合方法"""
+    if method == "weighted":
+        return weighted_score_fusion(candidates, weights, top_k)
+    if method != "rrf":
+        raise ValueError(f"不支持的融合方法: {method}")
+    return reciprocal_rank_fusion(candidates, weights, top_k, rrf_k)
@@ -0,0 +1,183 @@
+import os
+import json
+import threading
+import re
+import numpy as np
+from logging_setup import get_logger
+
+logger = get_logger("lexical_index")
+# 入库时只含空白和标点的词被丢弃，这些字符不能用于筛选候选文档块
+_WORD = re.compile(r"\w")
+
+class LexicalIndex:
+    """文档块的词ID数组，关键词匹配先在整数数组上完成，再只对少量候选文档块比较原文
+    
+    入库时每个文档块分词一次，去重排序后的词ID按文档块顺序拼接（CSR格式），随快照保存：
+    tokens.npy（int32词ID）、token_offsets.npy（int64偏移）、vocab.json（词表）。
+    关键词命中与原先的子串匹配完全一致：文档块中有包含该关键词的词时直接命中；
+    关键词跨越词边界（如“进入费控”被切成“进入/费控商旅”）时，词覆盖了关键词全部字符的
+    文档块才读取原文确认。因此命中结果与分词词典无关，运行时新增的关键词同样适用。
+    关键词匹配与查询无关，结果按关键词列表缓存，关键词库不变时每次查询直接复用。
+    """
+    
+    VOCAB_FILE = "vocab.json"
+    TOKENS_FILE = "tokens.npy"
+    TOKEN_OFFSETS_FILE = "token_offsets.npy"
+    
+    def __init__(self, vocab, tokens, offsets, get_text=None):
+        """
+        Args:
+            vocab: 词表
+            tokens: 各文档块去重排序后的词ID拼接数组
+            offsets: 各文档块在 tokens 中的起始偏移
+            get_text: 按文档块ID读取原文，用于确认跨越词边界的匹配；为空时只按词匹配
+        """
+        self.vocab = vocab
+        self.token_ids = {word: i for i, word in enumerate(vocab)}
+        self.tokens = tokens
+        self.offsets = offsets
+        self.get_text = get_text
+        self.document_count = len(offsets) - 1
+        # 每个词ID位置所属的文档块
+        self.doc_ids = np.repeat(np.arange(self.document_count, dtype=np.int32), np.diff(offsets))
+        self._char_tokens = None
+        self._char_masks = {}
+        self._term_tokens = {}
+        self._contains_masks = {}
+        self._keyword_cache = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def write(cls, snapshot_dir, texts, segmenter):
+        """对文档块分词并写入快照目录，返回词表大小"""
+        token_ids = {}
+        chunks = []
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        for i, text in enumerate(texts):
+            ids = {token_ids.setdefault(word, len(token_ids)) for word in segmenter.cut_uncached(text)}
+            chunks.append(np.fromiter(sorted(ids), dtype=np.int32, count=len(ids)))
+            offsets[i + 1] = offsets[i] + len(ids)
+        tokens = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int32)
+        np.save(os.path.join(snapshot_dir, cls.TOKENS_FILE), tokens)
+        np.save(os.path.join(snapshot_dir, cls.TOKEN_OFFSETS_FILE), offsets)
+        with open(os.path.join(snapshot_dir, cls.VOCAB_FILE), 'w', encoding='utf-8') as f:
+            json.dump(list(token_ids), f, ensure_ascii=False)
+        return len(token_ids)
+    
+    @classmethod
+    def load(cls, snapshot_dir, get_text=None):
+        """加载快照中的词ID数组，旧版本快照没有时返回None"""
+        vocab_path = os.path.join(snapshot_dir, cls.VOCAB_FILE)
+        if not os.path.exists(vocab_path):
+            return None
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        tokens = np.load(os.path.join(snapshot_dir, cls.TOKENS_FILE), mmap_mode='r')
+        offsets = np.load(os.path.join(snapshot_dir, cls.TOKEN_OFFSETS_FILE))
+        return cls(vocab, tokens, offsets, get_text)
+    
+    def _char_index(self):
+        """字符 -> 包含该字符的词ID数组（升序），第一次使用时遍历一次词表建立"""
+        if self._char_tokens is None:
+            postings = {}
+            for i, word in enumerate(self.vocab):
+                for char in set(word):
+                    postings.setdefault(char, []).append(i)
+            self._char_tokens = {char: np.array(ids, dtype=np.int32) for char, ids in postings.items()}
+        return self._char_tokens
+    
+    def term_tokens(self, term):
+        """包含该词的所有词ID（升序）：先用字符倒排求交，只对候选词比较字符串"""
+        ids = self._term_tokens.get(term)
+        if ids is None:
+            postings = self._char_index()
+            candidates = [postings.get(char) for char in set(term)]
+            if not term or any(posting is None for posting in candidates):
+                ids = np.empty(0, dtype=np.int32)
+            else:
+                candidates.sort(key=len)
+                ids = candidates[0]
+                for posting in candidates[1:]:
+                    ids = np.intersect1d(ids, posting, assume_unique=True)
+                ids = np.array([i for i in ids if term in self.vocab[i]], dtype=np.int32)
+            self._term_tokens[term] = ids
+        return ids
+    
+    def _tokens_mask(self, token_ids):
+        """每个文档块是否包含这些词中的任一个（布尔数组）"""
+        vocab_mask = np.zeros(len(self.vocab), dtype=bool)
+        vocab_mask[token_ids] = True
+        doc_mask = np.zeros(self.document_count, dtype=bool)
+        doc_mask[self.doc_ids[vocab_mask[self.tokens]]] = True
+        return doc_mask
+    
+    def term_mask(self, term):
+        """每个文档块是否有包含该词的词（布尔数组）"""
+        return self._tokens_mask(self.term_tokens(term))
+    
+    def _char_mask(self, char):
+        """每个文档块的词是否包含该字符，结果缓存"""
+        mask = self._char_masks.get(char)
+        if mask is None:
+            posting = self._char_index().get(char)
+            mask = self._tokens_mask(posting) if posting is not None else np.zeros(self.document_count, dtype=bool)
+            self._char_masks[char] = mask
+        return mask
+    
+    def _contains_masks_for(self, terms):
+        """每个词对应的“文档块原文包含该词”布尔数组，与子串匹配结果一致"""
+        masks = []
+        pending = {}
+        for index, term in enumerate(terms):
+            mask = self._contains_masks.get(term)
+            if mask is None:
+                mask = self.term_mask(term)
+                if self.get_text is not None and term:
+                    # 跨越词边界的出现：文档块的词覆盖了该词的全部字符时才可能存在
+                    # 标点和空白不进入索引，不参与筛选
+                    candidates = ~mask
+                    for char in set(term):
+                        if _WORD.match(char):
+                            candidates &= self._char_mask(char)
+                    for doc_id in np.flatnonzero(candidates):
+                        pending.setdefault(int(doc_id), []).append(index)
+            masks.append(mask)
+        
+        # 每个候选文档块只读取一次原文
+        for doc_id, indexes in pending.items():
+            text = self.get_text(doc_id)
+            for index in indexes:
+                if terms[index] in text:
+                    masks[index][doc_id] = True
+        for term, mask in zip(terms, masks):
+            self._contains_masks[term] = mask
+        return masks
+    
+    def contains_mask(self, term):
+        """每个文档块原文是否包含该词（布尔数组），结果缓存"""
+        return self._contains_masks_for([term])[0]
+    
+    def keyword_hits(self, keywords):
+        """关键词命中情况，结果按关键词列表缓存
+        
+        Returns:
+            (每个文档块命中的关键词数数组, 命中对的文档块ID数组, 命中对的关键词下标数组)，命中对按文档块ID排序
+        """
+        key = tuple(keywords)
+        with self._lock:
+            cached = self._keyword_cache
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        
+        masks = self._contains_masks_for(list(key))
+        if masks:
+            matrix = np.stack(masks, axis=1)
+        else:
+            matrix = np.zeros((self.document_count, 0), dtype=bool)
+        # 同一文档块里同一关键词只计一次
+        hit_docs, hit_keywords = np.nonzero(matrix)
+        counts = matrix.sum(axis=1)
+        result = (counts, hit_docs.astype(np.int64), hit_keywords.astype(np.int64))
+        with self._lock:
+            self._keyword_cache = (key, result)
+        return result
@@ -0,0 +1,285 @@
+import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import registry
+from logging_setup import get_logger
+
+logger = get_logger("llm_client")
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """大模型调用失败"""
+
+class DeadlineExceeded(LLMError):
+    """请求在截止时间内没有完成"""
+
+class CircuitOpen(LLMError):
+    """熔断器打开，上游不健康，快速失败"""
+
+class UpstreamError(LLMError):
+    """上游返回错误状态码"""
+    
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"上游返回 {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却期内直接拒绝；
+    冷却期结束进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+    # allow 放行半开状态的探测请求时的返回值（真值），调用结束后必须交给 release
+    PROBE = "probe"
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name="llm"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning("熔断器 %s 状态变化: %d -> %d", self.name, self.state, state)
+        self.state = state
+        registry.set_gauge("rag_llm_circuit_state", state, "大模型熔断器状态（0关闭/1打开/2半开）",
+                           upstream=self.name)
+    
+    def allow(self):
+        """是否放行本次调用：拒绝返回False，正常放行返回True，放行探测请求返回 PROBE"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            # 半开状态只放行一个探测请求
+            if self._probing:
+                return False
+            self._probing = True
+            return self.PROBE
+    
+    def release(self, ticket):
+        """调用结束（无论结果如何）时释放探测名额，避免探测请求没有记录结果时一直卡在半开状态"""
+        if ticket == self.PROBE:
+            with self._lock:
+                self._probing = False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(self.CLOSED)
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+class LatencyWindow:
+    """最近成功请求的耗时，用于计算对冲请求的触发延迟"""
+    
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+    
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def quantile(self, q, min_samples=20):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class LLMClient:
+    """大模型HTTP调用策略层
+    
+    - 每个请求有截止时间，每次尝试的超时不超过剩余时间
+    - 超时、连接错误、429和5xx按带抖动的指数退避重试，Retry-After优先
+    - 可选对冲：请求耗时超过近期p95仍未返回时，再发一个相同请求，先返回者胜出
+    - 熔断：连续失败达到阈值后快速失败，冷却后用单个请求探测
+    """
+    
+    def __init__(self, api_url, api_key, deadline_s=30.0, attempt_timeout_s=20.0, max_attempts=3,
+                 backoff_base_s=0.5, backoff_max_s=8.0, hedge=False, hedge_quantile=0.95, hedge_min_delay_s=0.5,
+                 breaker_threshold=5, breaker_reset_s=30.0, pool_size=32, name="llm"):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.deadline_s = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_s, name)
+        self.latency = LatencyWindow()
+        # 复用连接，避免每次调用重新建立TLS连接
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size))
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm-hedge") if hedge else None
+    
+    @classmethod
+    def from_config(cls, config, api_url, api_key, name="llm"):
+        """按服务配置中的 llm_* 调用策略创建客户端"""
+        return cls(api_url, api_key,
+                   deadline_s=config.get("llm_deadline_s", 30.0),
+                   attempt_timeout_s=config.get("llm_attempt_timeout_s", 20.0),
+                   max_attempts=config.get("llm_max_attempts", 3),
+                   backoff_base_s=config.get("llm_backoff_base_s", 0.5),
+                   backoff_max_s=config.get("llm_backoff_max_s", 8.0),
+                   hedge=config.get("llm_hedge", False),
+                   hedge_quantile=config.get("llm_hedge_quantile", 0.95),
+                   breaker_threshold=config.get("llm_breaker_threshold", 5),
+                   breaker_reset_s=config.get("llm_breaker_reset_s", 30.0),
+                   name=name)
+    
+    def deadline(self, seconds=None):
+        """计算截止时间（monotonic）"""
+        return time.monotonic() + (self.deadline_s if seconds is None else seconds)
+    
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+    
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+    
+    def _send(self, body, timeout, stream):
+        """发送一次请求，成功返回响应，失败抛出异常"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        start = time.monotonic()
+        response = self.session.post(self.api_url, headers=headers, data=body, timeout=timeout, stream=stream)
+        if response.status_code >= 400:
+            retry_after = self._retry_after(response)
+            response.close()
+            raise UpstreamError(response.status_code, retry_after)
+        self.latency.add(time.monotonic() - start)
+        return response
+    
+    def _send_hedged(self, body, timeout):
+        """对冲发送：主请求超过p95耗时仍未返回时补发一个，取先成功的结果"""
+        delay = self.latency.quantile(self.hedge_quantile)
+        if delay is None or delay >= timeout:
+            return self._send(body, timeout, False)
+        delay = max(delay, self.hedge_min_delay_s)
+        futures = {self._hedge_pool.submit(self._send, body, timeout, False)}
+        done, pending = wait(futures, timeout=delay)
+        if not done:
+            registry.inc("rag_llm_hedged_total", help_text="发出的对冲请求数")
+            futures.add(self._hedge_pool.submit(self._send, body, max(0.1, timeout - delay), False))
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 另一个请求稍后返回时关闭其连接
+                    for other in pending:
+                        other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    def post(self, data, stream=False, deadline=None):
+        """按策略发送chat-completions请求，返回成功的响应对象
+        
+        Args:
+            data: 请求体（字典）
+            stream: 是否流式响应；流式请求只在收到响应头之前重试，不做对冲
+            deadline: 截止时间（time.monotonic()），为空时使用默认时长
+        """
+        deadline = deadline or self.deadline()
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        last_error = None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ticket = self.breaker.allow()
+            if not ticket:
+                registry.inc("rag_llm_fast_failures_total", help_text="熔断器打开时快速失败的调用数")
+                raise CircuitOpen("大模型服务暂不可用")
+            timeout = min(self.attempt_timeout_s, remaining)
+            retry_after = None
+            try:
+                if self.hedge and not stream:
+                    response = self._send_hedged(body, timeout)
+                else:
+                    response = self._send(body, timeout, stream)
+                self.breaker.record_success()
+                return response
+            except UpstreamError as e:
+                last_error = e
+                retry_after = e.retry_after
+                registry.inc("rag_llm_upstream_errors_total", help_text="大模型上游错误数", kind=str(e.status_code))
+                if e.status_code not in RETRYABLE_STATUS:
+                    # 4xx是请求本身的问题，重试无意义，也不代表上游不健康
+                    self.breaker.record_success()
+                    raise
+                # 429只是限流，不计入连续失败；但探测请求被限流说明上游仍未恢复
+                if e.status_code != 429 or ticket == CircuitBreaker.PROBE:
+                    self.breaker.record_failure()
+            except requests.exceptions.RequestException as e:
+                last_error = e
+                if isinstance(e, requests.exceptions.Timeout):
+                    kind = "timeout"
+                elif isinstance(e, requests.exceptions.ConnectionError):
+                    kind = "connection"
+                else:
+                    kind = "request"
+                registry.inc("rag_llm_upstream_errors_total", help_text="大模型上游错误数", kind=kind)
+                self.breaker.record_failure()
+            finally:
+                self.breaker.release(ticket)
+            
+            if attempt == self.max_attempts - 1:
+                break
+            delay = self._backoff(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            registry.inc("rag_llm_retries_total", help_text="大模型调用重试次数")
+            logger.warning("API调用失败: %s，%.2f秒后重试 (尝试 %d/%d)", last_error, delay, attempt + 1,
+                           self.max_attempts)
+            time.sleep(delay)
+        
+        if last_error is None or time.monotonic() >= deadline:
+            registry.inc("rag_llm_deadline_exceeded_total", help_text="超过截止时间的大模型调用数")
+            raise DeadlineExceeded("大模型调用超过截止时间") from last_error
+        raise last_error
+    
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.session.close()
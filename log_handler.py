@@ -1,49 +1,195 @@
 import os
+import gzip
+import json
+import logging
+import queue
+import shutil
 import datetime
+import threading
+from logging_setup import get_logger, log_rate_limited
+
+logger = get_logger("log_handler")
 
 class LogHandler:
-    def __init__(self, log_dir):
+    """问答日志记录器
+    
+    请求线程只把结构化记录放入有界队列，由后台线程批量序列化为JSON Lines写入文件，
+    并按日期轮转、压缩前一天的日志。队列满时直接丢弃并计数，不阻塞请求。
+    多进程部署时每个进程写自己的文件（文件名带进程号），各自轮转和压缩，
+    避免一个进程压缩并删除前一天的文件时其他进程还在向其追加。
+    """
+    
+    def __init__(self, log_dir, max_queue_size=10000, batch_size=200, flush_interval=1.0, compress=True,
+                 per_process=False):
+        """
+        Args:
+            log_dir: 日志目录
+            max_queue_size: 待写入记录的队列长度上限
+            batch_size: 每次最多写入的记录数
+            flush_interval: 队列为空时检查轮转的间隔（秒）
+            compress: 是否压缩轮转后的日志
+            per_process: 文件名是否带进程号，多进程部署时开启
+        """
         self.log_dir = log_dir
+        self.per_process = per_process
         # 确保日志目录存在
         os.makedirs(self.log_dir, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
         # 生成日志文件名（按日期）
-        self.log_file = os.path.join(log_dir, f"rag_chat_{datetime.datetime.now().strftime('%Y%m%d')}.txt")
-    
-    def log_chat(self, query, answer, relevant_docs):
-        """记录问答对话"""
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.log_date = datetime.date.today()
+        self.log_file = self._log_file_for(self.log_date)
         
-        # 构建日志内容
-        log_content = f"[{timestamp}]\n"
-        log_content += f"问题: {query}\n"
-        log_content += f"回答: {answer}\n"
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # 丢弃计数在请求线程中累加，需要加锁
+        self._dropped_lock = threading.Lock()
+        self.dropped_count = 0
+        self.written_count = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-log-writer", daemon=True)
+        self._writer.start()
+    
+    def _log_file_for(self, date):
+        suffix = f"-{os.getpid()}" if self.per_process else ""
+        return os.path.join(self.log_dir, f"rag_chat_{date.strftime('%Y%m%d')}{suffix}.jsonl")
+    
+    def log_chat(self, query, answer, relevant_docs, session_id=None, latencies=None):
+        """记录问答对话（非阻塞），队列已满时丢弃并返回False"""
+        if self._closed:
+            return False
         
-        if relevant_docs:
-            log_content += "检索片段:\n"
-            for i, doc in enumerate(relevant_docs):
-                log_content += f"  [{i+1}] 来源: {doc['metadata']['source']}\n"
-                log_content += f"     内容: {doc['page_content'][:200]}...\n"
-                log_content += f"     相似度: {doc.get('distance', 'N/A')}\n"
+        if isinstance(answer, dict):
+            answer_type = answer.get("type")
+            answer_text = answer.get("message", "")
         else:
-            log_content += "检索片段: 无\n"
+            answer_type = None
+            answer_text = answer
+        
+        # 只提取少量字段，序列化在后台线程完成
+        chunks = []
+        for doc in relevant_docs or []:
+            metadata = doc.get("metadata", {})
+            chunks.append({
+                "chunk_id": doc.get("chunk_id"),
+                "source": metadata.get("source"),
+                "chunk_index": metadata.get("chunk_index"),
+                "mandatory_score": doc.get("mandatory_score"),
+                "keyword_score": doc.get("keyword_score"),
+                "similarity_score": doc.get("similarity_score"),
+                "distance": doc.get("distance")
+            })
         
-        log_content += "-" * 80 + "\n"
+        record = {
+            "ts": datetime.datetime.now().isoformat(timespec='milliseconds'),
+            "session_id": session_id,
+            "query": query,
+            "answer_type": answer_type,
+            "answer": answer_text,
+            "chunks": chunks,
+            "latencies": latencies or {}
+        }
         
-        # 写入日志文件
         try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_content)
+            self._queue.put_nowait(record)
             return True
-        except Exception as e:
-            print(f"日志写入失败: {str(e)}")
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped_count += 1
             return False
     
+    def _writer_loop(self):
+        """后台写入线程：批量取出记录，按日期写入对应文件"""
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.rotate_log()
+                continue
+            
+            if record is None:
+                break
+            batch = [record]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            
+            self._write_batch(batch)
+            if stop:
+                break
+    
+    def _write_batch(self, batch):
+        self.rotate_log()
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            except Exception as e:
+                logger.warning("日志序列化失败: %s", e)
+        if not lines:
+            return
+        
+        # 整批一次写入
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            self.written_count += len(lines)
+        except Exception as e:
+            log_rate_limited(logger, logging.ERROR, "chat_log_write", "日志写入失败: %s", e)
+    
     def get_log_path(self):
         """获取当前日志文件路径"""
         return self.log_file
     
+    def get_stats(self):
+        """获取日志队列统计信息"""
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written_count,
+            "dropped": self.dropped_count
+        }
+    
     def rotate_log(self):
-        """按日期轮转日志文件"""
-        new_log_file = os.path.join(self.log_dir, f"rag_chat_{datetime.datetime.now().strftime('%Y%m%d')}.txt")
-        if new_log_file != self.log_file:
-            self.log_file = new_log_file
+        """按日期轮转日志文件，并压缩前一天的日志"""
+        today = datetime.date.today()
+        if today == self.log_date:
+            return
+        previous_file = self.log_file
+        self.log_date = today
+        self.log_file = self._log_file_for(today)
+        if self.compress:
+            self._compress_file(previous_file)
+    
+    def _compress_file(self, path):
+        """压缩轮转后的日志文件，已存在压缩文件时跳过"""
+        gz_path = path + ".gz"
+        if not os.path.exists(path) or os.path.exists(gz_path):
+            return
+        tmp_path = gz_path + f".tmp-{os.getpid()}"
+        try:
+            with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, gz_path)
+            os.remove(path)
+        except Exception as e:
+            logger.error("日志压缩失败: %s", e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def close(self, timeout=5.0):
+        """停止后台线程，写出队列中剩余的记录"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._writer.join(timeout=timeout)
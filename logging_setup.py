@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+
+# 日志配置档：dev 输出全部诊断信息；production 只保留生命周期事件，逐请求信息抽样、逐块信息限流
+PROFILES = {
+    "dev": {"level": "DEBUG", "rate_limit_interval": 0.0, "sample_rate": 1.0},
+    "default": {"level": "INFO", "rate_limit_interval": 5.0, "sample_rate": 1.0},
+    "production": {"level": "INFO", "rate_limit_interval": 30.0, "sample_rate": 0.01}
+}
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_settings = dict(PROFILES["default"])
+_configured = False
+
+def configure_logging(profile=None, level=None):
+    """配置日志子系统
+    
+    Args:
+        profile: 日志配置档（dev/default/production），默认读取环境变量 RAG_LOG_PROFILE
+        level: 覆盖配置档中的日志级别，默认读取环境变量 RAG_LOG_LEVEL
+    """
+    global _configured
+    profile = profile or os.environ.get("RAG_LOG_PROFILE", "default")
+    if profile not in PROFILES:
+        profile = "default"
+    _settings.update(PROFILES[profile])
+    level = level or os.environ.get("RAG_LOG_LEVEL") or _settings["level"]
+    _settings["level"] = level
+    
+    root = logging.getLogger("rag")
+    root.setLevel(level)
+    if not _configured:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False
+        _configured = True
+    return profile
+
+def get_logger(name):
+    """获取模块日志记录器，统一挂在 rag 命名空间下"""
+    return logging.getLogger(f"rag.{name}")
+
+class RateLimiter:
+    """按消息键限流，间隔内的重复消息被抑制并计数，下次输出时附带抑制数量"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [上次输出时间, 被抑制次数]
+        self._state = {}
+    
+    def allow(self, key, interval):
+        """判断该键当前是否允许输出，返回(是否允许, 之前被抑制的次数)"""
+        if interval <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= interval:
+                suppressed = state[1] if state else 0
+                self._state[key] = [now, 0]
+                return True, suppressed
+            state[1] += 1
+            return False, 0
+
+_rate_limiter = RateLimiter()
+
+def log_rate_limited(logger, level, key, msg, *args, interval=None):
+    """限流输出：同一键在间隔内只输出一次，适用于逐块、逐批次的诊断信息"""
+    if not logger.isEnabledFor(level):
+        return
+    allowed, suppressed = _rate_limiter.allow(key, _settings["rate_limit_interval"] if interval is None else interval)
+    if not allowed:
+        return
+    if suppressed:
+        msg = f"{msg}（期间抑制 {suppressed} 条同类消息）"
+    logger.log(level, msg, *args)
+
+def log_sampled(logger, level, msg, *args, rate=None):
+    """抽样输出：按比例输出，适用于逐请求的诊断信息"""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _settings["sample_rate"] if rate is None else rate
+    if rate >= 1.0 or random.random() < rate:
+        logger.log(level, msg, *args)
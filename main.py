@@ -4,6 +4,7 @@ import json
 from data_loader import DataLoader
 from rag_core import RAGCore
 from log_handler import LogHandler
+from logging_setup import configure_logging
 
 class RAGAgent:
     def __init__(self):
@@ -84,9 +85,13 @@ class RAGAgent:
             print("\n程序被用户中断，再见！")
         except Exception as e:
             print(f"程序运行出错: {str(e)}")
+        finally:
+            # 写出日志队列中剩余的记录
+            self.log_handler.close()
 
 def main():
     """主函数"""
+    configure_logging()
     agent = RAGAgent()
     agent.run()
 
@@ -0,0 +1,154 @@
+import time
+import bisect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# 默认直方图分桶（秒），覆盖从亚毫秒级的分词到数十秒的大模型调用
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """累积分桶直方图"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        pos = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[pos] += 1
+            self.sum += value
+            self.count += 1
+    
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class MetricsRegistry:
+    """进程内指标注册表，支持计数器、仪表和带标签的直方图
+    
+    多进程部署时每个工作进程各自维护一份指标，由采集端按实例汇总。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> {"type", "help", "series": {labels_tuple: value}}
+        self._metrics = {}
+    
+    def _series(self, name, metric_type, help_text, labels, factory):
+        key = tuple(sorted(labels.items())) if labels else ()
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, {"type": metric_type, "help": help_text, "series": {}})
+        series = metric["series"]
+        value = series.get(key)
+        if value is None:
+            with self._lock:
+                value = series.setdefault(key, factory())
+        return key, series, value
+    
+    def observe(self, name, value, help_text="", **labels):
+        """记录一次直方图观测值"""
+        _, _, histogram = self._series(name, "histogram", help_text, labels, Histogram)
+        histogram.observe(value)
+    
+    def inc(self, name, amount=1, help_text="", **labels):
+        """计数器累加"""
+        key, series, _ = self._series(name, "counter", help_text, labels, lambda: 0)
+        with self._lock:
+            series[key] += amount
+    
+    def set_gauge(self, name, value, help_text="", **labels):
+        """设置仪表值"""
+        key, series, _ = self._series(name, "gauge", help_text, labels, lambda: 0)
+        series[key] = value
+    
+    def render_prometheus(self):
+        """以Prometheus文本格式输出全部指标"""
+        lines = []
+        with self._lock:
+            metrics = [(name, dict(m, series=dict(m["series"]))) for name, m in sorted(self._metrics.items())]
+        for name, metric in metrics:
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in sorted(metric["series"].items()):
+                if metric["type"] == "histogram":
+                    counts, total, count = value.snapshot()
+                    cumulative = 0
+                    for bound, bucket_count in zip(value.buckets + (float("inf"),), counts):
+                        cumulative += bucket_count
+                        bucket_labels = _format_labels(labels + (("le", _format_value(float(bound))),))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# 全局注册表
+registry = MetricsRegistry()
+
+STAGE_METRIC = "rag_stage_duration_seconds"
+STAGE_HELP = "各处理阶段耗时（秒）"
+
+# 当前请求的分阶段耗时（毫秒），由request_trace设置
+_current_trace = contextvars.ContextVar("rag_request_trace", default=None)
+
+@contextmanager
+def span(stage):
+    """记录一个处理阶段的耗时，同时计入全局直方图和当前请求的耗时明细"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe(STAGE_METRIC, elapsed, STAGE_HELP, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace[stage] = round(trace.get(stage, 0.0) + elapsed * 1000, 3)
+
+def timed(stage):
+    """span的装饰器形式"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def request_trace():
+    """开启一次请求级的耗时跟踪，返回记录各阶段耗时（毫秒）的字典"""
+    trace = {}
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace():
+    """获取当前请求的耗时明细，不在请求上下文中时返回None"""
+    return _current_trace.get()
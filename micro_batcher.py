@@ -0,0 +1,90 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from metrics import registry
+from logging_setup import get_logger
+
+logger = get_logger("micro_batcher")
+
+class MicroBatcher:
+    """微批处理器
+    
+    收集在很短时间窗口内到达的请求，合并成一批调用一次批处理函数，
+    再把结果分别交给各自的调用方。调用方的接口不变，只是多了至多一个窗口的等待。
+    """
+    
+    def __init__(self, batch_fn, max_wait_ms=2.0, max_batch_size=32, name="batch"):
+        """
+        Args:
+            batch_fn: 批处理函数，接收请求列表，返回等长的结果列表
+            max_wait_ms: 收到第一个请求后最多等待多久凑批（毫秒）
+            max_batch_size: 单批最大请求数，凑满立即执行
+            name: 指标标签
+        """
+        self.batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"micro-batcher-{name}", daemon=True)
+        self._thread.start()
+    
+    def submit(self, item):
+        """提交一个请求，返回Future"""
+        if self._closed:
+            raise RuntimeError("微批处理器已关闭")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def __call__(self, item, timeout=None):
+        """提交请求并等待结果"""
+        return self.submit(item).result(timeout)
+    
+    def _collect(self):
+        """阻塞等待第一个请求，然后在窗口内继续收集，直到超时或凑满一批"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # 关闭信号：处理完当前批次后退出
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            registry.inc("rag_microbatch_batches_total", help_text="微批处理执行的批次数", batcher=self.name)
+            registry.inc("rag_microbatch_items_total", len(items), help_text="微批处理合并的请求数", batcher=self.name)
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                logger.exception("微批处理失败: %s", e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+    
+    def close(self, timeout=1.0):
+        """停止后台线程，已提交的请求会先处理完"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,226 @@
+import re
+import time
+import threading
+from llm_client import LLMClient
+from metrics import registry
+from logging_setup import get_logger
+
+logger = get_logger("model_router")
+
+# 计算词面重合度时忽略的疑问词和标点
+_QUERY_NOISE = re.compile(r"怎么|怎样|如何|是多少|有哪些|有什么|什么|哪里|在哪|可以|能否|是否|请问|一下|我想|我要|需要|吗|呢|啊|的|了|[\s\W_]+")
+
+def _ngrams(query, n):
+    grams = set()
+    for segment in _QUERY_NOISE.split(query):
+        # 比n短的片段整体作为一项
+        if len(segment) >= 2:
+            grams.update(segment[i:i + n] for i in range(max(1, len(segment) - n + 1)))
+    return grams
+
+def query_overlap(query, text, strict=False):
+    """查询的字二元组在文本块中出现的比例（0-1），忽略疑问词和标点
+    
+    Args:
+        strict: 同时计算字三元组的比例并取平均，查询词分散出现在文本中（如“撤回”“出差申请”
+            各自出现在讲新建申请的步骤里）时得分明显低于连续出现
+    """
+    bigrams = _ngrams(query, 2)
+    if not bigrams:
+        return 0.0
+    overlap = sum(1 for gram in bigrams if gram in text) / len(bigrams)
+    if strict:
+        trigrams = _ngrams(query, 3)
+        overlap = (overlap + sum(1 for gram in trigrams if gram in text) / len(trigrams)) / 2
+    return overlap
+
+class ModelRoute:
+    """一个模型路由：模型名、调用客户端和单价（元/千tokens）"""
+    
+    def __init__(self, name, model, client, cost_per_1k_input=0.0, cost_per_1k_output=0.0):
+        self.name = name
+        self.model = model
+        self.client = client
+        self.cost_per_1k_input = cost_per_1k_input
+        self.cost_per_1k_output = cost_per_1k_output
+    
+    def cost(self, usage):
+        """按返回的token用量估算费用"""
+        return (usage.get("prompt_tokens", 0) * self.cost_per_1k_input +
+                usage.get("completion_tokens", 0) * self.cost_per_1k_output) / 1000
+
+class RouteStats:
+    """单个路由的累计统计，供 /api/status 展示"""
+    
+    __slots__ = ("requests", "errors", "escalations", "tokens", "cost", "latency_total")
+    
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.escalations = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self.latency_total = 0.0
+    
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "escalations": self.escalations,
+            "tokens": self.tokens,
+            "cost": round(self.cost, 6),
+            "avg_latency_ms": round(self.latency_total * 1000 / self.requests, 1) if self.requests else None
+        }
+
+class ModelRouter:
+    """按检索置信度、问题长度和对话轮次选择模型
+    
+    检索结果可信、问题短、对话浅的请求走小模型，其余走大模型；
+    小模型调用失败或回答“无法回答”时升级到大模型重新回答。
+    """
+    
+    FAST = "fast"
+    LARGE = "large"
+    
+    def __init__(self, routes, min_confidence=0.6, max_query_chars=40, max_depth=2):
+        """
+        Args:
+            routes: {路由名: ModelRoute}，必须包含 large，包含 fast 时才会分流
+            min_confidence: 走小模型所需的最低检索置信度（0-1）
+            max_query_chars: 走小模型的最大问题长度（字符）
+            max_depth: 走小模型的最大对话轮次
+        """
+        self.routes = routes
+        self.min_confidence = min_confidence
+        self.max_query_chars = max_query_chars
+        self.max_depth = max_depth
+        self._stats = {name: RouteStats() for name in routes}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, config, large_client=None):
+        """按配置中的 llm_routes 创建路由，每个路由使用独立的调用客户端（各自重试和熔断）
+        
+        Args:
+            config: 服务配置
+            large_client: 大模型路由复用的客户端，为空时新建
+        """
+        route_configs = dict(config.get("llm_routes") or {})
+        if not config.get("llm_routing", True):
+            route_configs.pop(cls.FAST, None)
+        
+        routes = {}
+        for name, options in route_configs.items():
+            api_url = options.get("api_url") or config.get("doubao_api_url")
+            api_key = options.get("api_key") or config["doubao_api_key"]
+            if name == cls.LARGE and large_client is not None:
+                client = large_client
+            else:
+                client = LLMClient.from_config(config, api_url, api_key, name=f"llm_{name}")
+            routes[name] = ModelRoute(name, options.get("model") or config.get("doubao_model"), client,
+                                      options.get("cost_per_1k_input", 0.0), options.get("cost_per_1k_output", 0.0))
+        if cls.LARGE not in routes:
+            client = large_client or LLMClient.from_config(config, config.get("doubao_api_url"),
+                                                           config["doubao_api_key"])
+            routes[cls.LARGE] = ModelRoute(cls.LARGE, config.get("doubao_model"), client)
+        
+        return cls(routes,
+                   min_confidence=config.get("route_min_confidence", 0.6),
+                   max_query_chars=config.get("route_max_query_chars", 40),
+                   max_depth=config.get("route_max_depth", 2))
+    
+    @staticmethod
+    def retrieval_confidence(query, relevant_docs):
+        """检索置信度（0-1）：查询词在向量检索排名第一的文档块中出现的比例
+        
+        强制检索和关键词匹配的结果与查询无关，向量相似度对任何查询都接近，二者都不能说明检索结果切题，
+        因此只看与查询直接相关的词面重合度；没有向量检索结果时取融合后排名第一的文档块。
+        """
+        if not relevant_docs:
+            return 0.0
+        top = max(relevant_docs, key=lambda doc: doc.get("similarity_score", -1.0))
+        return query_overlap(query, top["page_content"])
+    
+    def choose(self, query_length, relevant_docs, depth=0, query=""):
+        """选择路由
+        
+        Args:
+            query_length: 用户本轮问题的长度
+            relevant_docs: 检索结果
+            depth: 已有的对话轮次
+            query: 用户本轮问题，用于计算检索置信度
+        
+        Returns:
+            (路由名, 原因)
+        """
+        if self.FAST not in self.routes:
+            route, reason = self.LARGE, "no_fast_route"
+        elif depth > self.max_depth:
+            route, reason = self.LARGE, "deep_conversation"
+        elif query_length > self.max_query_chars:
+            route, reason = self.LARGE, "long_query"
+        elif self.retrieval_confidence(query, relevant_docs) < self.min_confidence:
+            route, reason = self.LARGE, "low_confidence"
+        else:
+            route, reason = self.FAST, "simple"
+        registry.inc("rag_llm_route_decisions_total", help_text="模型路由决策次数", route=route, reason=reason)
+        return route, reason
+    
+    def escalation_for(self, route_name):
+        """升级目标路由，已是大模型时返回None"""
+        return self.LARGE if route_name != self.LARGE else None
+    
+    def post(self, route_name, data, stream=False, deadline=None):
+        """通过指定路由的客户端发送请求，记录耗时和成败；流式请求记录的是收到响应头的耗时"""
+        route = self.routes[route_name]
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = route.client.post(data, stream=stream, deadline=deadline)
+            ok = True
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.observe("rag_llm_route_duration_seconds", elapsed, "各模型路由的调用耗时（秒）", route=route_name)
+            registry.inc("rag_llm_route_requests_total", help_text="各模型路由的调用次数", route=route_name,
+                         outcome="ok" if ok else "error")
+            with self._lock:
+                stats = self._stats[route_name]
+                stats.requests += 1
+                stats.latency_total += elapsed
+                if not ok:
+                    stats.errors += 1
+    
+    def record_usage(self, route_name, usage):
+        """记录响应中的token用量和估算费用"""
+        if not usage:
+            return
+        cost = self.routes[route_name].cost(usage)
+        tokens = usage.get("total_tokens", 0)
+        registry.inc("rag_llm_route_tokens_total", tokens, help_text="各模型路由消耗的tokens", route=route_name)
+        registry.inc("rag_llm_route_cost_total", cost, help_text="各模型路由的估算费用（元）", route=route_name)
+        with self._lock:
+            stats = self._stats[route_name]
+            stats.tokens += tokens
+            stats.cost += cost
+    
+    def record_escalation(self, from_route, to_route, reason):
+        logger.info("模型路由升级: %s -> %s (%s)", from_route, to_route, reason)
+        registry.inc("rag_llm_route_escalations_total", help_text="从小模型升级到大模型的次数",
+                     from_route=from_route, to_route=to_route, reason=reason)
+        with self._lock:
+            self._stats[from_route].escalations += 1
+    
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(self._stats[name].to_dict(), model=route.model)
+                for name, route in self.routes.items()
+            }
+    
+    def close(self):
+        closed = set()
+        for route in self.routes.values():
+            if id(route.client) not in closed:
+                closed.add(id(route.client))
+                route.client.close()
@@ -0,0 +1,297 @@
+import os
+import json
+import mimetypes
+import importlib.util
+from html.parser import HTMLParser
+from chunker import Block, HEADING, PARAGRAPH, LIST_ITEM, TABLE_ROW, parse_text
+from docx_stream import iter_docx_blocks
+from logging_setup import get_logger
+
+logger = get_logger("parsers")
+
+# 解析结果格式版本，解析逻辑变化时加1，旧的缓存自动失效
+PARSER_VERSION = 1
+# 纯文本文件的最大读取长度（字符），避免处理过大的文件
+MAX_TEXT_CHARS = 500000
+
+class Parser:
+    """一种文件格式的解析器：把文件解析为结构块列表"""
+    
+    def __init__(self, name, func, extensions, mime_types=(), requires=None):
+        """
+        Args:
+            name: 解析器名称，参与缓存键
+            func: func(file_path, ext) -> [Block]
+            extensions: 处理的扩展名（小写，带点）
+            mime_types: 处理的MIME类型，扩展名不认识时按MIME查找
+            requires: 依赖的可选第三方包名，未安装时解析器不可用
+        """
+        self.name = name
+        self.func = func
+        self.extensions = tuple(extensions)
+        self.mime_types = tuple(mime_types)
+        self.requires = requires
+        self.available = requires is None or importlib.util.find_spec(requires) is not None
+    
+    def parse(self, file_path, ext):
+        return self.func(file_path, ext)
+
+class ParserRegistry:
+    """按扩展名或MIME类型查找解析器"""
+    
+    def __init__(self):
+        self._by_ext = {}
+        self._by_mime = {}
+    
+    def register(self, parser):
+        for ext in parser.extensions:
+            self._by_ext[ext] = parser
+        for mime_type in parser.mime_types:
+            self._by_mime[mime_type] = parser
+        return parser
+    
+    def for_path(self, file_path):
+        """文件对应的解析器，没有时返回None；依赖未安装的解析器也会返回，由调用方检查 available"""
+        ext = os.path.splitext(file_path)[1].lower()
+        parser = self._by_ext.get(ext)
+        if parser is None:
+            mime_type, _ = mimetypes.guess_type(file_path)
+            parser = self._by_mime.get(mime_type)
+        return parser
+    
+    def extensions(self):
+        return sorted(ext for ext, parser in self._by_ext.items() if parser.available)
+
+def _read_text(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read(MAX_TEXT_CHARS + 1)
+    if len(content) > MAX_TEXT_CHARS:
+        logger.warning("文本过长，截断到 %d 字符: %s", MAX_TEXT_CHARS, file_path)
+        content = content[:MAX_TEXT_CHARS]
+    return content
+
+def parse_text_file(file_path, ext):
+    """纯文本、Markdown、CSV"""
+    return parse_text(_read_text(file_path), ext)
+
+def parse_docx_file(file_path, ext):
+    return list(iter_docx_blocks(file_path))
+
+def parse_pdf_file(file_path, ext):
+    """PDF文本层（扫描件没有文本层，解析结果为空）；按页提取后用纯文本规则识别标题和列表"""
+    from pypdf import PdfReader
+    blocks = []
+    for page in PdfReader(file_path).pages:
+        blocks.extend(parse_text(page.extract_text() or ""))
+    return blocks
+
+class _HTMLBlockParser(HTMLParser):
+    """把HTML转换为结构块：h1-h6为标题，li为列表项，tr为表格行，其余块级元素为段落"""
+    
+    SKIP = {"script", "style", "head", "noscript", "template", "svg", "nav", "footer"}
+    BLOCK = {"p", "div", "section", "article", "blockquote", "pre", "br", "dd", "dt", "caption", "main", "header"}
+    HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._parts = []
+        self._skip = 0
+        self._heading = 0
+        self._lists = []      # 嵌套列表：有序列表为当前序号，无序列表为None
+        self._in_item = False
+        self._row = None
+        self._cell = None
+    
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        self._parts = []
+        if not text:
+            return
+        if self._cell is not None:
+            self._cell.append(text)
+        elif self._heading:
+            self.blocks.append(Block(HEADING, text, self._heading))
+        elif self._in_item and self._lists:
+            number = self._lists[-1]
+            self.blocks.append(Block(LIST_ITEM, f"{number}. {text}" if number else f"- {text}", 0))
+        else:
+            self.blocks.append(Block(PARAGRAPH, text, 0))
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif tag in self.HEADINGS:
+            self._flush()
+            self._heading = self.HEADINGS[tag]
+        elif tag in ("ul", "ol"):
+            self._flush()
+            self._lists.append(0 if tag == "ol" else None)
+        elif tag == "li":
+            self._flush()
+            if self._lists and self._lists[-1] is not None:
+                self._lists[-1] += 1
+            self._in_item = True
+        elif tag == "tr":
+            self._flush()
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._flush()
+            self._cell = []
+        elif tag in self.BLOCK:
+            self._flush()
+    
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif self._skip:
+            return
+        elif tag in self.HEADINGS:
+            self._flush()
+            self._heading = 0
+        elif tag in ("ul", "ol"):
+            self._flush()
+            if self._lists:
+                self._lists.pop()
+            self._in_item = False
+        elif tag == "li":
+            self._flush()
+            self._in_item = False
+        elif tag in ("td", "th") and self._cell is not None:
+            self._flush()
+            self._row.append(" ".join(self._cell))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            line = " | ".join(self._row)
+            if line.strip(" |"):
+                self.blocks.append(Block(TABLE_ROW, line, 0))
+            self._row = None
+        elif tag in self.BLOCK:
+            self._flush()
+    
+    def handle_data(self, data):
+        if not self._skip:
+            self._parts.append(data)
+    
+    def close(self):
+        super().close()
+        self._flush()
+
+def parse_html_file(file_path, ext):
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        parser = _HTMLBlockParser()
+        parser.feed(f.read())
+    parser.close()
+    return parser.blocks
+
+def parse_xlsx_file(file_path, ext):
+    """Excel工作簿：每个工作表为一个章节，非空行为表格行"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    blocks = []
+    try:
+        for sheet in workbook.worksheets:
+            rows = []
+            for values in sheet.iter_rows(values_only=True):
+                cells = ["" if value is None else str(value).strip() for value in values]
+                while cells and not cells[-1]:
+                    cells.pop()
+                if any(cells):
+                    rows.append(Block(TABLE_ROW, " | ".join(cells), 0))
+            if rows:
+                blocks.append(Block(HEADING, sheet.title, 1))
+                blocks.extend(rows)
+    finally:
+        workbook.close()
+    return blocks
+
+registry = ParserRegistry()
+registry.register(Parser("text", parse_text_file, (".txt", ".md", ".markdown", ".csv"),
+                         ("text/plain", "text/markdown", "text/csv")))
+registry.register(Parser("docx", parse_docx_file, (".docx",),
+                         ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",)))
+registry.register(Parser("html", parse_html_file, (".html", ".htm", ".xhtml"), ("text/html", "application/xhtml+xml")))
+registry.register(Parser("pdf", parse_pdf_file, (".pdf",), ("application/pdf",), requires="pypdf"))
+registry.register(Parser("xlsx", parse_xlsx_file, (".xlsx", ".xlsm"),
+                         ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",), requires="openpyxl"))
+
+def parse_file(file_path):
+    """用默认注册表解析文件，返回结构块列表；不支持的格式返回None"""
+    parser = registry.for_path(file_path)
+    if parser is None or not parser.available:
+        return None
+    return parser.parse(file_path, os.path.splitext(file_path)[1].lower())
+
+def parse_file_safe(file_path):
+    """供进程池调用：返回 (结构块列表, 错误信息)，异常不跨进程抛出"""
+    try:
+        return parse_file(file_path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+class ParseCache:
+    """解析结果的磁盘缓存，按文件内容哈希和解析器寻址，文件未变化时跳过解析
+    
+    每个条目是一个JSON文件（结构块的 [类型, 文本, 级别] 列表），先写临时文件再原子替换。
+    """
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+    
+    @staticmethod
+    def key(content_hash, parser_name):
+        return f"{content_hash}-{parser_name}-v{PARSER_VERSION}"
+    
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                blocks = [Block(*item) for item in json.load(f)]
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("解析缓存损坏，重新解析 %s: %s", path, e)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.add(key)
+        return blocks
+    
+    def put(self, key, blocks):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([list(block) for block in blocks], f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            self._used.add(key)
+        except OSError as e:
+            logger.warning("写入解析缓存失败 %s: %s", path, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def prune(self):
+        """删除本次加载没有用到的条目（对应的文件已修改或删除），返回删除数量"""
+        removed = 0
+        if not os.path.isdir(self.cache_dir):
+            return removed
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".json") and name[:-5] not in self._used:
+                    try:
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        self._used = set()
+        return removed
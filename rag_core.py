@@ -1,29 +1,105 @@
-import requests
 import json
+import time
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from keyword_manager import KeywordManager
-import jieba
+from metrics import span, timed
+from fusion import fuse, DEFAULT_WEIGHTS
+from micro_batcher import MicroBatcher
+from single_flight import SingleFlight, request_key
+from llm_client import LLMClient
+from extractive import ExtractiveAnswerer
+from logging_setup import get_logger
+
+logger = get_logger("rag_core")
+
+def _when_all_done(futures, callback):
+    """所有 future 结束（完成、失败或被取消）后调用一次 callback"""
+    if not futures:
+        callback()
+        return
+    lock = threading.Lock()
+    remaining = [len(futures)]
+    
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+    
+    for future in futures:
+        future.add_done_callback(done)
 
 class RAGCore:
-    def __init__(self, data_loader, doubao_api_key):
+    DEFAULT_API_URL = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
+    DEFAULT_MODEL = "doubao-seed-1-6-251015"
+    
+    def __init__(self, data_loader, doubao_api_key, api_url=None, model=None,
+                 fusion_method="rrf", fusion_weights=None, rrf_k=60,
+                 batch_window_ms=0.0, batch_max_size=32, llm_client=None, router=None, extractive=None):
         self.data_loader = data_loader
         self.doubao_api_key = doubao_api_key
-        self.api_url = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
-        self.default_model = "doubao-seed-1-6-251015"
+        # 压测时可指向本地模拟服务（benchmarks/mock_doubao_server.py）
+        self.api_url = api_url or self.DEFAULT_API_URL
+        self.default_model = model or self.DEFAULT_MODEL
+        # 多路检索结果的融合方式和权重
+        self.fusion_method = fusion_method
+        self.fusion_weights = dict(DEFAULT_WEIGHTS, **(fusion_weights or {}))
+        self.rrf_k = rrf_k
+        # 向量检索微批处理：窗口大于0时，并发请求的查询向量合并成一次检索
+        self.vector_batcher = None
+        if batch_window_ms > 0:
+            self.vector_batcher = MicroBatcher(self._vector_search_micro_batch, batch_window_ms,
+                                               batch_max_size, name="vector_search")
+        # 大模型调用策略：截止时间、退避重试、对冲请求和熔断
+        self.llm_client = llm_client or LLMClient(self.api_url, doubao_api_key)
+        # 模型路由：为空时所有请求使用 llm_client 和默认模型
+        self.router = router
+        # 抽取式回答：高置信度的操作步骤问题不调用大模型，大模型不可用时作为降级回答；传入False关闭
+        self.extractive = extractive if extractive is not None else ExtractiveAnswerer()
+        # 相同提示词的并发请求只调用一次大模型
+        self.single_flight = SingleFlight()
         self.keyword_manager = KeywordManager()
-        # 初始化jieba分词
-        self._init_jieba()
+        # 领域分词器（关键词库和领域词编译进词典），与入库分词共用同一个实例
+        self.segmenter = data_loader.segmenter
     
-    def _init_jieba(self):
-        """初始化jieba分词"""
-        # 加载自定义词典
-        # 这里可以添加行业特定词汇
-        pass
+    def warmup(self, query="如何提交出差申请"):
+        """启动预热：加载分词词典、计算关键词命中、执行一次向量检索
+        
+        只调用只读的内部步骤，不学习关键词、不更新关键词权重。
+        
+        Returns:
+            {阶段: 耗时毫秒}
+        """
+        timings = {}
+        start = time.perf_counter()
+        # 分词词典在第一次分词时才加载（有缓存时约0.3秒，否则约1秒），提前完成
+        self.segmenter.cut(query)
+        timings["jieba"] = round((time.perf_counter() - start) * 1000, 1)
+        
+        if self.data_loader.vector_store:
+            start = time.perf_counter()
+            lexical_index = self._lexical_index()
+            if lexical_index is not None:
+                # 关键词命中结果与查询无关，提前算好并缓存
+                lexical_index.keyword_hits(self.keyword_manager.get_keywords())
+            else:
+                # 旧版本快照逐个扫描文档块文本，预先读入页缓存
+                for _ in self._iter_texts():
+                    pass
+            timings["documents"] = round((time.perf_counter() - start) * 1000, 1)
+            start = time.perf_counter()
+            self._search_vectors([query], 8)
+            timings["vector_search"] = round((time.perf_counter() - start) * 1000, 1)
+        return timings
     
+    @timed("keyword_extraction")
     def extract_keywords(self, text, top_n=5):
         """从文本中提取关键词"""
-        # 使用jieba分词
-        words = jieba.cut(text)
+        # 领域分词，相同文本的分词结果走LRU缓存
+        words = self.segmenter.cut(text)
         
         # 过滤停用词
         stop_words = {
@@ -46,147 +122,259 @@ class RAGCore:
         # 返回前top_n个关键词
         return [word for word, _ in sorted_words[:top_n]]
     
-    def retrieve_relevant_docs(self, query, top_k=8):
-        """检索与查询相关的文档"""
-        if not self.data_loader.vector_store:
-            return []
-        
-        # 从查询中提取关键词并添加到关键词库
-        extracted_keywords = self.extract_keywords(query)
-        
-        # 添加新关键词到关键词库
-        if extracted_keywords:
-            self.keyword_manager.add_keywords(extracted_keywords)
+    def _lexical_index(self):
+        """当前快照的词ID数组；旧版本快照或与文档块不对应（切换快照过程中）时返回None，走文本扫描"""
+        lexical_index = self.data_loader.lexical_index
+        if lexical_index is None or lexical_index.document_count != len(self.data_loader.documents):
+            return None
+        return lexical_index
+    
+    def _mandatory_triggered(self, query):
+        """查询是否命中关键词库，命中时触发强制检索"""
+        return any(keyword in query for keyword in self.keyword_manager.get_keywords())
+    
+    @timed("mandatory_scan")
+    def _mandatory_candidates(self):
+        """强制检索：收集包含关键词的文档，结果与具体查询无关，批量检索时只扫描一次
         
-        # 1. 强制检索规则（优先执行）
-        mandatory_docs = []
+        Returns:
+            (文档块ID数组, 得分数组)
+        """
+        mandatory_ids = []
         
         # 从关键词管理器获取触发关键词
         trigger_keywords = self.keyword_manager.get_keywords()
         
-        # 检查是否触发强制检索
-        trigger_found = any(keyword in query for keyword in trigger_keywords)
+        # 限制强制检索的文档数量，提高性能
+        max_docs = 20  # 限制处理的文档数量
         
-        if trigger_found:
-            # 限制强制检索的文档数量，提高性能
-            doc_count = 0
-            max_docs = 20  # 限制处理的文档数量
+        lexical_index = self._lexical_index()
+        if lexical_index is not None:
+            # 包含登录企业手机银行相关内容，或包含关键词库中的关键词
+            matched = lexical_index.keyword_hits(trigger_keywords)[0] > 0
+            matched |= lexical_index.contains_mask("登录企业手机银行") & lexical_index.contains_mask("进入费控商旅")
+            mandatory_ids = np.flatnonzero(matched)[:max_docs].astype(np.int64)
+            return mandatory_ids, np.ones(len(mandatory_ids), dtype=np.float32)
+        
+        for doc_id, content in enumerate(self._iter_texts()):
+            if len(mandatory_ids) >= max_docs:
+                break
             
-            for doc in self.data_loader.documents:
-                if doc_count >= max_docs:
-                    break
-                    
-                content = doc["page_content"]
-                # 检查是否包含相关内容
-                content_has_relevant = False
-                
-                # 检查是否包含登录企业手机银行相关内容
-                if "登录企业手机银行" in content and "进入费控商旅" in content:
-                    content_has_relevant = True
-                
-                # 检查是否包含关键词库中的关键词
-                for keyword in trigger_keywords:
-                    if keyword in content:
-                        content_has_relevant = True
-                        break
-                
-                if content_has_relevant:
-                    doc["mandatory_score"] = 0.6  # 强制得分权重设为0.6
-                    mandatory_docs.append(doc)
-                    doc_count += 1
+            # 检查是否包含登录企业手机银行相关内容，或包含关键词库中的关键词
+            if ("登录企业手机银行" in content and "进入费控商旅" in content) or \
+                    any(keyword in content for keyword in trigger_keywords):
+                mandatory_ids.append(doc_id)
         
-        # 2. 关键词匹配
+        return np.array(mandatory_ids, dtype=np.int64), np.ones(len(mandatory_ids), dtype=np.float32)
+    
+    def _mandatory_scan(self, query):
+        """强制检索：查询命中关键词库时，收集包含关键词的文档"""
+        if not self._mandatory_triggered(query):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._mandatory_candidates()
+    
+    @timed("keyword_scan")
+    def _keyword_scan(self, repeat=1):
+        """关键词匹配：按命中的关键词数量计算得分
+        
+        Args:
+            repeat: 本次扫描代表的查询数量，批量检索时一次扫描按查询数累加关键词权重
+        
+        Returns:
+            (文档块ID数组, 得分数组)，按得分降序
+        """
         # 从关键词管理器获取匹配关键词
         keywords = self.keyword_manager.get_keywords()
-        keyword_matches = []
+        keyword_ids = []
+        keyword_counts = []
         
         # 查找包含关键词的文档，限制数量
-        doc_count = 0
         max_docs = 15  # 限制处理的文档数量
         
-        for doc in self.data_loader.documents:
-            if doc_count >= max_docs:
+        lexical_index = self._lexical_index()
+        if lexical_index is not None:
+            counts, hit_docs, hit_keywords = lexical_index.keyword_hits(keywords)
+            ids = np.flatnonzero(counts)[:max_docs].astype(np.int64)
+            # 更新命中文档块中各关键词的权重（每个文档块每个关键词一次）
+            selected = np.isin(hit_docs, ids)
+            keyword_docs = np.bincount(hit_keywords[selected], minlength=len(keywords))
+            for index in np.flatnonzero(keyword_docs):
+                self.keyword_manager.update_weight(keywords[index], increment=0.1 * repeat * int(keyword_docs[index]))
+            scores = counts[ids].astype(np.float32)
+            order = np.argsort(-scores, kind="stable")
+            return ids[order], scores[order]
+        
+        for doc_id, content in enumerate(self._iter_texts()):
+            if len(keyword_ids) >= max_docs:
                 break
-                
-            content = doc["page_content"]
+            
             match_count = 0
             for keyword in keywords:
                 if keyword in content:
                     match_count += 1
                     # 更新关键词权重
-                    self.keyword_manager.update_weight(keyword)
+                    self.keyword_manager.update_weight(keyword, increment=0.1 * repeat)
             if match_count > 0:
-                # 计算关键词匹配得分
-                doc["keyword_score"] = match_count * 0.3  # 关键词匹配得分0.3
-                keyword_matches.append(doc)
-                doc_count += 1
+                keyword_ids.append(doc_id)
+                keyword_counts.append(match_count)
         
-        # 3. 向量相似度检索
-        # 计算查询向量
-        query_embedding = self.data_loader.simple_embed(query)
-        query_embedding = np.array([query_embedding]).astype('float32')
+        ids = np.array(keyword_ids, dtype=np.int64)
+        scores = np.array(keyword_counts, dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+    
+    @timed("vector_search")
+    def _vector_search_batch(self, queries, top_k):
+        """批量向量检索：一次计算全部查询向量，一次多行FAISS检索
+        
+        Returns:
+            每个查询对应的 (文档块ID数组, 相似度得分数组, 距离数组)，按相似度降序
+        """
+        return self._search_vectors(queries, top_k)
+    
+    def _search_vectors(self, queries, top_k):
+        # 计算查询向量矩阵
+        query_embeddings = self.data_loader.embed_batch(queries)
         
         # 检索最相似的文档
-        distances, indices = self.data_loader.vector_store.search(query_embedding, top_k)
-        
-        similarity_docs = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.data_loader.documents):
-                doc = self.data_loader.documents[idx]
-                doc["distance"] = float(distances[0][i])  # 转换为Python原生float类型
-                # 计算向量相似度得分
-                doc["similarity_score"] = (1.0 / (1.0 + doc["distance"])) * 0.1  # 向量相似度0.1
-                similarity_docs.append(doc)
-        
-        # 4. 合并结果
-        # 去重
-        seen_content = set()
-        unique_docs = []
-        
-        # 先添加强制文档
-        for doc in mandatory_docs:
-            content = doc["page_content"]
-            if content not in seen_content:
-                seen_content.add(content)
-                unique_docs.append(doc)
-        
-        # 再添加关键词匹配的文档
-        for doc in keyword_matches:
-            content = doc["page_content"]
-            if content not in seen_content:
-                seen_content.add(content)
-                unique_docs.append(doc)
-        
-        # 最后添加相似度高的文档
-        for doc in similarity_docs:
-            content = doc["page_content"]
-            if content not in seen_content:
-                seen_content.add(content)
-                unique_docs.append(doc)
-        
-        # 5. 排序
-        # 优先按强制得分排序，然后按关键词匹配得分排序，最后按相似度排序
-        def sort_key(doc):
-            # 强制得分（默认0）
-            mandatory_score = doc.get("mandatory_score", 0)
-            # 关键词匹配得分（默认0）
-            keyword_score = doc.get("keyword_score", 0)
-            # 相似度得分（默认0）
-            similarity_score = doc.get("similarity_score", 0)
-            return (mandatory_score, keyword_score, similarity_score)
-        
-        unique_docs.sort(key=sort_key, reverse=True)  # 降序排序
-        
-        # 保留前8个文档
-        relevant_docs = unique_docs[:8]
+        distances, indices = self.data_loader.vector_store.search(query_embeddings, top_k)
+        
+        results = []
+        document_count = len(self.data_loader.documents)
+        for row in range(len(queries)):
+            # 过滤FAISS返回的-1占位和越界ID
+            valid = (indices[row] >= 0) & (indices[row] < document_count)
+            ids = indices[row][valid].astype(np.int64)
+            row_distances = distances[row][valid]
+            # 计算向量相似度得分
+            scores = 1.0 / (1.0 + row_distances)
+            results.append((ids, scores, row_distances))
+        return results
+    
+    def _vector_search(self, query, top_k):
+        """向量相似度检索，启用微批处理时与同一时间窗口内的其他查询合并检索"""
+        if self.vector_batcher is None:
+            return self._vector_search_batch([query], top_k)[0]
+        with span("vector_search"):
+            return self.vector_batcher((query, top_k))
+    
+    def _vector_search_micro_batch(self, requests_batch):
+        """微批处理函数：按批内最大top_k检索一次，再截取各自需要的数量"""
+        queries = [query for query, _ in requests_batch]
+        max_k = max(top_k for _, top_k in requests_batch)
+        results = self._search_vectors(queries, max_k)
+        return [
+            (ids[:top_k], scores[:top_k], distances[:top_k])
+            for (_, top_k), (ids, scores, distances) in zip(requests_batch, results)
+        ]
+    
+    def _iter_texts(self):
+        """遍历文档块文本；快照存储只解码文本，不解析元数据"""
+        documents = self.data_loader.documents
+        get_text = getattr(documents, "get_text", None)
+        if get_text is not None:
+            return (get_text(i) for i in range(len(documents)))
+        return (doc["page_content"] for doc in documents)
+    
+    def _learn_keywords(self, query):
+        """从查询中提取关键词并添加到关键词库"""
+        extracted_keywords = self.extract_keywords(query)
+        
+        # 添加新关键词到关键词库
+        if extracted_keywords:
+            self.keyword_manager.add_keywords(extracted_keywords)
+            # 新关键词加入分词词典，保证后续查询整体切出
+            for keyword in extracted_keywords:
+                self.segmenter.add_word(keyword)
+    
+    def _fuse_candidates(self, mandatory, keyword, vector, top_k):
+        """融合三路检索结果，组装带各检索器得分的文档列表"""
+        mandatory_ids, mandatory_scores = mandatory
+        keyword_ids, keyword_scores = keyword
+        vector_ids, vector_scores, distances = vector
+        
+        with span("fusion"):
+            candidates = {
+                "mandatory": (mandatory_ids, mandatory_scores),
+                "keyword": (keyword_ids, keyword_scores),
+                "vector": (vector_ids, vector_scores)
+            }
+            fused_ids, fused_scores = fuse(candidates, self.fusion_method, self.fusion_weights,
+                                           top_k=top_k, rrf_k=self.rrf_k)
+        
+        # 附带各检索器的得分便于日志分析
+        keyword_score_map = dict(zip(keyword_ids.tolist(), keyword_scores.tolist()))
+        vector_score_map = dict(zip(vector_ids.tolist(), zip(vector_scores.tolist(), distances.tolist())))
+        mandatory_set = set(mandatory_ids.tolist())
+        
+        relevant_docs = []
+        for doc_id, score in zip(fused_ids.tolist(), fused_scores.tolist()):
+            # 复制一份，避免修改共享的文档列表
+            doc = dict(self.data_loader.documents[doc_id])
+            doc["chunk_id"] = doc_id
+            doc["fusion_score"] = score
+            if doc_id in mandatory_set:
+                doc["mandatory_score"] = 1.0
+            if doc_id in keyword_score_map:
+                doc["keyword_score"] = keyword_score_map[doc_id]
+            if doc_id in vector_score_map:
+                doc["similarity_score"], doc["distance"] = vector_score_map[doc_id]
+            relevant_docs.append(doc)
         
         return relevant_docs
     
-    def generate_answer(self, query, relevant_docs):
-        """基于检索到的文档生成回答"""
-        if not relevant_docs:
-            return {"type": "no_info", "message": "抱歉，我无法回答这个问题，请转人工客服处理。"}
+    @timed("retrieval")
+    def retrieve_relevant_docs(self, query, top_k=8):
+        """检索与查询相关的文档
+        
+        强制检索、关键词匹配和向量检索分别给出候选文档块ID及得分，
+        再按配置的融合方法（RRF或加权融合）合并，按文档块ID去重后取前top_k个。
+        """
+        if not self.data_loader.vector_store:
+            return []
+        
+        self._learn_keywords(query)
+        
+        # 1. 强制检索规则
+        mandatory = self._mandatory_scan(query)
         
+        # 2. 关键词匹配
+        keyword = self._keyword_scan()
+        
+        # 3. 向量相似度检索
+        vector = self._vector_search(query, top_k)
+        
+        # 4. 融合排序
+        return self._fuse_candidates(mandatory, keyword, vector, top_k)
+    
+    @timed("retrieval_batch")
+    def retrieve_relevant_docs_batch(self, queries, top_k=8):
+        """批量检索：向量检索合并为一次矩阵计算，关键词扫描整批只做一次
+        
+        Returns:
+            与 queries 一一对应的文档列表
+        """
+        if not self.data_loader.vector_store or not queries:
+            return [[] for _ in queries]
+        
+        for query in queries:
+            self._learn_keywords(query)
+        
+        # 强制检索和关键词匹配的文档扫描与查询无关，整批共用一次扫描结果
+        triggered = [self._mandatory_triggered(query) for query in queries]
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        mandatory = self._mandatory_candidates() if any(triggered) else empty
+        keyword = self._keyword_scan(repeat=len(queries))
+        vectors = self._vector_search_batch(queries, top_k)
+        
+        return [
+            self._fuse_candidates(mandatory if hit else empty, keyword, vector, top_k)
+            for hit, vector in zip(triggered, vectors)
+        ]
+    
+    @timed("prompt_build")
+    def _build_prompt(self, query, relevant_docs):
+        """基于检索到的文档构建提示词"""
         # 构建提示词，限制文档内容长度
         max_context_length = 1500  # 限制上下文长度
         context_parts = []
@@ -215,124 +403,268 @@ class RAGCore:
         prompt += "4. 不要提及'根据资料'、'资料显示'等引导性短语，直接给出答案\n"
         prompt += "5. 对于操作步骤，使用换行符分隔每个步骤，提高可读性\n"
         prompt += "6. 对于多个功能或要点，使用换行符分隔，使回答更加清晰\n"
+        return prompt
+    
+    def _chat_payload(self, system_content, prompt, temperature, stream=False):
+        """构建豆包chat-completions请求体"""
+        data = {
+            "model": self.default_model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_content
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": temperature,
+            "max_tokens": 500
+        }
+        if stream:
+            data["stream"] = True
+        return data
+    
+    def _post_chat(self, data, stream=False, deadline=None, route=None):
+        """按调用策略（截止时间、退避重试、对冲、熔断）发送请求，指定路由时使用该路由的客户端"""
+        with span("llm_call"):
+            if route is None:
+                return self.llm_client.post(data, stream=stream, deadline=deadline)
+            return self.router.post(route, data, stream=stream, deadline=deadline)
+    
+    def _routed_payload(self, data, route):
+        if route is None:
+            return data
+        return dict(data, model=self.router.routes[route].model)
+    
+    def _chat(self, data, deadline=None, route=None):
+        """调用大模型并返回回答文本；相同请求同时进行时只调用一次"""
+        data = self._routed_payload(data, route)
         
-        try:
-            # 调用豆包API，添加重试机制
-            import time
-            max_retries = 3
-            retry_delay = 2
-            
-            for attempt in range(max_retries):
-                try:
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.doubao_api_key}"
-                    }
-                    
-                    data = {
-                        "model": self.default_model,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的客户服务助手，严格基于提供的资料回答问题。"
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "temperature": 0.1,
-                        "max_tokens": 500
-                    }
-                    
-                    response = requests.post(self.api_url, headers=headers, data=json.dumps(data, ensure_ascii=False), timeout=20)
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    answer = result["choices"][0]["message"]["content"]
-                    
-                    return {"type": "info", "message": answer}
-                    
-                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                    if attempt < max_retries - 1:
-                        print(f"API调用失败，{retry_delay}秒后重试... (尝试 {attempt+1}/{max_retries})")
-                        time.sleep(retry_delay)
+        def call():
+            result = self._post_chat(data, deadline=deadline, route=route).json()
+            if route is not None:
+                self.router.record_usage(route, result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+        
+        return self.single_flight.do(request_key(data), call, deadline)
+    
+    def _chat_stream(self, data, deadline=None, route=None):
+        """流式调用大模型，逐块产出回答文本；相同请求同时进行时共享同一个上游流"""
+        data = self._routed_payload(data, route)
+        
+        def call():
+            response = self._post_chat(data, stream=True, deadline=deadline, route=route)
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
                         continue
-                    else:
-                        raise
-            
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
+                    content = line[len("data:"):].strip()
+                    if content == "[DONE]":
+                        break
+                    delta = json.loads(content)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        
+        return self.single_flight.stream(request_key(data), call, deadline)
+    
+    def _choose_route(self, query, relevant_docs, conversation_depth=0, query_length=None):
+        """选择模型路由，未配置路由时返回None"""
+        if self.router is None:
+            return None
+        if query_length is None:
+            query_length = len(query)
+        # 多轮对话时 query 以会话历史开头，用户本轮问题在末尾
+        route, _ = self.router.choose(query_length, relevant_docs, conversation_depth, query=query[-query_length:])
+        return route
+    
+    def _escalate(self, route, reason, deadline):
+        """返回升级后的路由；已是大模型或已超过截止时间时返回None"""
+        if route is None or time.monotonic() >= deadline:
+            return None
+        target = self.router.escalation_for(route)
+        if target is not None:
+            self.router.record_escalation(route, target, reason)
+        return target
+    
+    def _chat_routed(self, data, deadline, route):
+        """按路由调用大模型；小模型调用失败或回答无法回答时升级到大模型"""
+        while True:
+            try:
+                answer = self._chat(data, deadline, route)
+            except Exception as e:
+                target = self._escalate(route, "error", deadline)
+                if target is None:
+                    raise
+                logger.warning("模型路由 %s 调用失败: %s", route, e)
+                route = target
+                continue
+            if answer.strip() == "抱歉，我无法回答这个问题，请转人工客服处理。":
+                target = self._escalate(route, "no_info", deadline)
+                if target is not None:
+                    route = target
+                    continue
+            return answer
+    
+    @timed("extractive_answer")
+    def _extractive_answer(self, query, relevant_docs, conversation_depth=0):
+        """快速路径：满足阈值时直接返回整理好的操作步骤，不调用大模型"""
+        if not self.extractive:
+            return None
+        return self.extractive.answer(query, relevant_docs, conversation_depth)
+    
+    def _degraded_answer(self, query, relevant_docs):
+        """大模型调用失败（熔断、超过截止时间等）时，尽量用检索到的资料回答"""
+        message = self.extractive.degraded_answer(query, relevant_docs) if self.extractive else None
+        if message is None:
             return {"type": "error", "message": "抱歉，系统暂时无法回答您的问题，请稍后再试。"}
+        return {"type": "extractive", "message": message, "degraded": True}
+    
+    @timed("answer_generation")
+    def generate_answer(self, query, relevant_docs, deadline=None, conversation_depth=0, query_length=None):
+        """基于检索到的文档生成回答
+        
+        Args:
+            deadline: 截止时间（time.monotonic()），小模型和升级后的大模型共用，为空时从现在开始计算
+            conversation_depth: 会话中已有的用户轮次，用于模型路由
+            query_length: 用户本轮问题的长度，为空时取 query 的长度
+        """
+        if not relevant_docs:
+            return {"type": "no_info", "message": "抱歉，我无法回答这个问题，请转人工客服处理。"}
+        deadline = deadline or self.request_deadline()
+        
+        extractive = self._extractive_answer(query, relevant_docs, conversation_depth)
+        if extractive is not None:
+            return {"type": "extractive", "message": extractive}
+        
+        prompt = self._build_prompt(query, relevant_docs)
+        data = self._chat_payload("你是一个专业的客户服务助手，严格基于提供的资料回答问题。", prompt, 0.1)
+        route = self._choose_route(query, relevant_docs, conversation_depth, query_length)
+        
+        try:
+            answer = self._chat_routed(data, deadline, route)
+            return {"type": "info", "message": answer}
+        except Exception as e:
+            logger.exception("调用大模型失败: %s", e)
+            return self._degraded_answer(query, relevant_docs)
     
-    def generate_general_answer(self, query):
-        """调用豆包大模型自由回答问题"""
+    def generate_answer_stream(self, query, relevant_docs, deadline=None, conversation_depth=0, query_length=None):
+        """流式生成回答，逐块产出文本；失败时产出降级文案
+        
+        小模型在产出第一块之前失败时升级到大模型；已经开始输出后不再切换模型。
+        参数同 generate_answer，所有路由共用同一个截止时间。
+        
+        Returns:
+            生成器的返回值是完整的回答字典，类型（info / extractive / error 等）和降级标记与 generate_answer 一致
+        """
+        if not relevant_docs:
+            answer = {"type": "no_info", "message": "抱歉，我无法回答这个问题，请转人工客服处理。"}
+            yield answer["message"]
+            return answer
+        deadline = deadline or self.request_deadline()
+        
+        extractive = self._extractive_answer(query, relevant_docs, conversation_depth)
+        if extractive is not None:
+            yield extractive
+            return {"type": "extractive", "message": extractive}
+        
+        prompt = self._build_prompt(query, relevant_docs)
+        data = self._chat_payload("你是一个专业的客户服务助手，严格基于提供的资料回答问题。", prompt, 0.1,
+                                  stream=True)
+        route = self._choose_route(query, relevant_docs, conversation_depth, query_length)
+        
+        chunks = []
+        while True:
+            try:
+                for chunk in self._chat_stream(data, deadline, route):
+                    chunks.append(chunk)
+                    yield chunk
+                return {"type": "info", "message": "".join(chunks)}
+            except Exception as e:
+                target = None if chunks else self._escalate(route, "error", deadline)
+                if target is not None:
+                    logger.warning("模型路由 %s 流式调用失败: %s", route, e)
+                    route = target
+                    continue
+                logger.exception("流式调用大模型失败: %s", e)
+                if chunks:
+                    # 已经输出了一部分，回答不完整
+                    return {"type": "info", "message": "".join(chunks), "degraded": True}
+                answer = self._degraded_answer(query, relevant_docs)
+                yield answer["message"]
+                return answer
+    
+    def generate_general_answer(self, query, deadline=None):
+        """调用豆包大模型自由回答问题；deadline 为空时从现在开始计算"""
+        deadline = deadline or self.request_deadline()
         # 构建提示词
         prompt = f"你是一个专业的客户服务助手，请自由回答以下问题：\n\n"
         prompt += f"问题：{query}\n\n"
         prompt += "要求：\n1. 用简洁明了的语言回答\n"
         prompt += "2. 提供准确、有用的信息\n"
         prompt += "3. 不要提及任何关于资料的内容\n"
+        data = self._chat_payload("你是一个专业的客户服务助手，自由回答用户的问题。", prompt, 0.7)
+        
+        # 自由回答没有检索结果可以判断难度，固定使用大模型
+        route = self.router.LARGE if self.router is not None else None
         
         try:
-            # 调用豆包API，添加重试机制
-            import time
-            max_retries = 3
-            retry_delay = 2
-            
-            for attempt in range(max_retries):
-                try:
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.doubao_api_key}"
-                    }
-                    
-                    data = {
-                        "model": self.default_model,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的客户服务助手，自由回答用户的问题。"
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 500
-                    }
-                    
-                    response = requests.post(self.api_url, headers=headers, data=json.dumps(data), timeout=20)
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    answer = result["choices"][0]["message"]["content"]
-                    
-                    return {"type": "general", "message": answer}
-                    
-                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                    if attempt < max_retries - 1:
-                        print(f"API调用失败，{retry_delay}秒后重试... (尝试 {attempt+1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        raise
-            
+            answer = self._chat(data, deadline, route)
+            return {"type": "general", "message": answer}
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("调用大模型失败: %s", e)
             return {"type": "error", "message": "抱歉，系统暂时无法回答您的问题，请稍后再试。"}
     
-    def process_query(self, query):
-        """处理用户查询的完整流程"""
+    def request_deadline(self):
+        """请求的整体截止时间（time.monotonic()），请求到达时计算一次，检索和所有大模型调用（包括路由升级）共用"""
+        return self.llm_client.deadline()
+    
+    def process_query(self, query, conversation_depth=0, query_length=None, deadline=None):
+        """处理用户查询的完整流程
+        
+        Args:
+            query: 查询（可能已拼接会话历史）
+            conversation_depth: 会话中已有的用户轮次，用于模型路由
+            query_length: 用户本轮问题的长度，为空时取 query 的长度
+            deadline: 请求的截止时间，为空时从现在开始计算
+        """
+        deadline = deadline or self.request_deadline()
         # 检索相关文档
         relevant_docs = self.retrieve_relevant_docs(query)
         
         # 生成回答
-        answer = self.generate_answer(query, relevant_docs)
+        answer = self.generate_answer(query, relevant_docs, deadline=deadline, conversation_depth=conversation_depth,
+                                      query_length=query_length)
+        
+        return self._finish_answer(query, answer, relevant_docs), relevant_docs
+    
+    def process_query_stream(self, query, conversation_depth=0, query_length=None, deadline=None):
+        """流式处理查询：先产出检索片段，再逐块产出回答文本，最后产出完整回答
         
+        参数同 process_query。
+        
+        Yields:
+            ("sources", 检索片段)、("token", 文本块)...、("answer", 回答字典，同 process_query)
+        """
+        deadline = deadline or self.request_deadline()
+        relevant_docs = self.retrieve_relevant_docs(query)
+        yield "sources", relevant_docs
+        
+        stream = self.generate_answer_stream(query, relevant_docs, deadline=deadline,
+                                             conversation_depth=conversation_depth, query_length=query_length)
+        while True:
+            try:
+                chunk = next(stream)
+            except StopIteration as stop:
+                # 回答类型以生成时的结果为准（抽取式、降级等），与 process_query 一致
+                answer = stop.value
+                break
+            yield "token", chunk
+        yield "answer", self._finish_answer(query, answer, relevant_docs)
+    
+    def _finish_answer(self, query, answer, relevant_docs):
+        """统一无资料时的回答，并更新查询中关键词的权重"""
         # 如果资料中没有相关信息，修改回答类型为no_info
         if len(relevant_docs) == 0 or answer.get("message") == "抱歉，我无法回答这个问题，请转人工客服处理。":
             answer = {"type": "no_info", "message": "抱歉，我无法回答这个问题，请转人工客服处理。"}
@@ -342,10 +674,42 @@ class RAGCore:
         for keyword in extracted_keywords:
             self.keyword_manager.update_weight(keyword)
         
-        return answer, relevant_docs
+        return answer
+    
+    def process_queries_batch(self, queries, max_concurrency=8, on_drained=None):
+        """批量处理查询：整批检索一次，再以有限并发调用大模型
+        
+        Args:
+            queries: 查询列表
+            max_concurrency: 同时进行的大模型调用数量上限
+            on_drained: 所有已开始的查询结束后调用一次（包括生成器中途被关闭的情况），用于归还准入名额
+        
+        Yields:
+            (查询序号, 回答, 检索片段)，按完成顺序逐个产出
+        """
+        pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+        futures = []
+        try:
+            all_docs = self.retrieve_relevant_docs_batch(queries)
+            
+            def answer_one(index):
+                # 每条查询在真正开始时计算自己的截止时间，排队等待并发名额的时间不计入
+                answer = self.generate_answer(queries[index], all_docs[index], self.request_deadline())
+                return index, self._finish_answer(queries[index], answer, all_docs[index])
+            
+            futures = [pool.submit(answer_one, index) for index in range(len(queries))]
+            for future in as_completed(futures):
+                index, answer = future.result()
+                yield index, answer, all_docs[index]
+        finally:
+            # 客户端断开（GeneratorExit）或出错时取消还没开始的查询，不阻塞等待进行中的调用
+            pool.shutdown(wait=False, cancel_futures=True)
+            if on_drained is not None:
+                _when_all_done(futures, on_drained)
     
-    def process_general_query(self, query):
-        """处理通用查询，调用豆包大模型自由回答"""
+    def process_general_query(self, query, deadline=None):
+        """处理通用查询，调用豆包大模型自由回答；deadline 为请求的截止时间，为空时从现在开始计算"""
+        deadline = deadline or self.request_deadline()
         # 提取关键词并添加到关键词库
         extracted_keywords = self.extract_keywords(query)
         if extracted_keywords:
@@ -355,6 +719,6 @@ class RAGCore:
                 self.keyword_manager.update_weight(keyword)
         
         # 生成通用回答
-        answer = self.generate_general_answer(query)
+        answer = self.generate_general_answer(query, deadline)
         
         return answer
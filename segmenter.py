@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import marshal
+import hashlib
+import threading
+from functools import lru_cache
+from logging_setup import get_logger
+
+logger = get_logger("segmenter")
+
+# 关键词库之外的领域词，保证切分结果一致（例如“费控商旅”不会被切成“费控/商旅”）
+DOMAIN_TERMS = (
+    "费控商旅", "企业手机银行", "出差申请", "出差申请单", "报销单", "借款单", "还款单", "差旅标准",
+    "发票导入", "票据夹", "报销明细", "收款账户", "审批流", "电子发票", "增值税发票", "行程单",
+    "差旅报销", "费用报销", "商旅预订", "费用类型", "成本中心", "审批人", "撤回", "驳回"
+)
+# 只含空白和标点的词不进入索引
+_WORD = re.compile(r"\w")
+
+class Segmenter:
+    """领域分词器：关键词库和领域词编译进jieba词典，编译结果缓存在磁盘上
+    
+    - 词典内容（jieba版本、关键词、领域词）不变时直接加载缓存的前缀词典，不再逐词计算词频
+    - 查询分词结果放在LRU缓存中
+    - 入库时对每个文档块分词一次，见 lexical_index.LexicalIndex
+    """
+    
+    def __init__(self, cache_dir=None, keyword_file="keyword_library.json", extra_terms=DOMAIN_TERMS, cache_size=4096):
+        """
+        Args:
+            cache_dir: 编译后词典的缓存目录，为空时不缓存
+            keyword_file: 关键词库文件
+            extra_terms: 额外的领域词
+            cache_size: 查询分词LRU缓存的条目数
+        """
+        self.cache_dir = cache_dir
+        self.keyword_file = keyword_file
+        self.extra_terms = tuple(extra_terms)
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        # jieba 分词读取 FREQ/total，add_word 修改它们，两者互斥
+        self._words_lock = threading.Lock()
+        # 词典版本号是缓存键的一部分，新增词之前开始的分词结果即使晚于清空缓存写入也不会再命中
+        self._version = 0
+        self._cached_cut = lru_cache(maxsize=cache_size)(self._cut_version)
+    
+    def _user_words(self):
+        words = []
+        if os.path.exists(self.keyword_file):
+            try:
+                with open(self.keyword_file, 'r', encoding='utf-8') as f:
+                    words = [word for word in json.load(f) if isinstance(word, str)]
+            except (OSError, ValueError) as e:
+                logger.warning("读取关键词库失败，只使用领域词: %s", e)
+        return list(dict.fromkeys(word.strip() for word in words + list(self.extra_terms) if word.strip()))
+    
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = self._load()
+        return self._tokenizer
+    
+    def _load(self):
+        """加载或编译词典"""
+        import jieba
+        tokenizer = jieba.Tokenizer()
+        words = self._user_words()
+        digest = hashlib.md5("\n".join([jieba.__version__] + words).encode("utf-8")).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, f"dict-{digest}.marshal") if self.cache_dir else None
+        
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    tokenizer.FREQ, tokenizer.total = marshal.load(f)
+                tokenizer.initialized = True
+                logger.info("已加载分词词典缓存: %s（%d 个自定义词）", cache_path, len(words))
+                return tokenizer
+            except (OSError, ValueError, EOFError, TypeError) as e:
+                logger.warning("分词词典缓存损坏，重新编译: %s", e)
+        
+        tokenizer.initialize()
+        for word in words:
+            # 不指定词频时jieba会计算一个足以让该词整体切出的词频
+            tokenizer.add_word(word)
+        if cache_path:
+            self._save(cache_path, tokenizer)
+        logger.info("分词词典编译完成，%d 个自定义词", len(words))
+        return tokenizer
+    
+    def _save(self, cache_path, tokenizer):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                marshal.dump((tokenizer.FREQ, tokenizer.total), f)
+            os.replace(tmp_path, cache_path)
+            # 关键词库变化后旧的编译结果不会再用到
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("dict-") and name.endswith(".marshal") and name != os.path.basename(cache_path):
+                    os.remove(os.path.join(self.cache_dir, name))
+        except OSError as e:
+            logger.warning("写入分词词典缓存失败: %s", e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def cut(self, text):
+        """查询分词，结果经过LRU缓存"""
+        return self._cached_cut(text, self._version)
+    
+    def _cut_version(self, text, version):
+        return self._cut(text)
+    
+    def _cut(self, text):
+        tokenizer = self.tokenizer
+        with self._words_lock:
+            words = tokenizer.lcut(text)
+        return tuple(word for word in words if _WORD.search(word))
+    
+    def cut_uncached(self, text):
+        """文档块分词，不经过LRU缓存（入库时每个文档块只分词一次）"""
+        return self._cut(text)
+    
+    def add_word(self, word):
+        """运行中新增的关键词加入词典，已有的词忽略；下次启动时随关键词库一起编译进缓存"""
+        tokenizer = self.tokenizer
+        with self._words_lock:
+            if tokenizer.FREQ.get(word):
+                return False
+            tokenizer.add_word(word)
+            self._version += 1
+        self._cached_cut.cache_clear()
+        return True
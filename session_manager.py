@@ -1,19 +1,81 @@
+import os
 import uuid
-from datetime import datetime, timedelta
+import time
+import heapq
+import sqlite3
+import threading
+from collections import deque
 from typing import Dict, Optional, List, Any
+from logging_setup import get_logger
+
+logger = get_logger("session_manager")
+
+class SessionRecord:
+    """会话记录，使用__slots__紧凑存储，时间统一为单调时钟秒数"""
+    
+    __slots__ = ("created_at", "last_accessed", "history")
+    
+    def __init__(self, now: float, max_history: int):
+        self.created_at = now
+        self.last_accessed = now
+        self.history = deque(maxlen=max_history)
 
 class SessionManager:
     """会话管理器，处理用户会话的创建、查询和删除"""
     
-    def __init__(self, session_timeout: int = 3600):
+    def __init__(self, session_timeout: int = 3600, cleanup_interval: float = 30.0,
+                 max_history: int = 50, start_cleanup_thread: bool = True):
         """
         初始化会话管理器
         
         Args:
             session_timeout: 会话超时时间（秒），默认3600秒（1小时）
+            cleanup_interval: 后台清理过期会话的间隔（秒），默认30秒
+            max_history: 每个会话最多保留的历史消息数量，默认50条
+            start_cleanup_thread: 是否启动后台清理线程
         """
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.sessions: Dict[str, SessionRecord] = {}
         self.session_timeout = session_timeout
+        self.cleanup_interval = cleanup_interval
+        self.max_history = max_history
+        
+        # 过期堆：(过期时间, 会话ID)，采用惰性删除
+        # 会话被访问时不更新堆，弹出时再根据记录中的最后访问时间判断是否真正过期
+        self._expiry_heap: List[tuple] = []
+        self._lock = threading.Lock()
+        
+        self._stop_event = threading.Event()
+        self._cleanup_thread = None
+        if start_cleanup_thread:
+            self.start_cleanup_thread()
+    
+    def start_cleanup_thread(self):
+        """启动后台过期清理线程"""
+        if self._cleanup_thread and self._cleanup_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._cleanup_thread = threading.Thread(
+            target=self._cleanup_loop, name="session-cleanup", daemon=True
+        )
+        self._cleanup_thread.start()
+    
+    def stop_cleanup_thread(self):
+        """停止后台过期清理线程"""
+        self._stop_event.set()
+        if self._cleanup_thread:
+            self._cleanup_thread.join(timeout=self.cleanup_interval)
+            self._cleanup_thread = None
+    
+    def _cleanup_loop(self):
+        """后台线程：按固定间隔清理过期会话"""
+        while not self._stop_event.wait(self.cleanup_interval):
+            try:
+                self.cleanup_expired_sessions()
+            except Exception as e:
+                logger.exception("清理过期会话失败: %s", e)
+    
+    def _is_expired(self, session: SessionRecord, now: float) -> bool:
+        return now - session.last_accessed > self.session_timeout
     
     def create_session(self) -> str:
         """
@@ -23,36 +85,37 @@ class SessionManager:
             str: 会话ID
         """
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            "created_at": datetime.now(),
-            "last_accessed": datetime.now(),
-            "history": []
-        }
+        now = time.monotonic()
+        with self._lock:
+            self.sessions[session_id] = SessionRecord(now, self.max_history)
+            heapq.heappush(self._expiry_heap, (now + self.session_timeout, session_id))
         return session_id
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+    def get_session(self, session_id: str) -> Optional[SessionRecord]:
         """
         获取会话信息
         
         Args:
             session_id: 会话ID
-            
+        
         Returns:
-            Optional[Dict[str, Any]]: 会话信息，如果会话不存在或已超时返回None
+            Optional[SessionRecord]: 会话记录，如果会话不存在或已超时返回None
         """
-        if session_id not in self.sessions:
-            return None
-        
-        # 检查会话是否超时
-        session = self.sessions[session_id]
-        if (datetime.now() - session["last_accessed"]).total_seconds() > self.session_timeout:
-            # 会话超时，删除会话
-            del self.sessions[session_id]
-            return None
-        
-        # 更新最后访问时间
-        session["last_accessed"] = datetime.now()
-        return session
+        now = time.monotonic()
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            
+            # 检查会话是否超时
+            if self._is_expired(session, now):
+                # 会话超时，删除会话（堆中的条目在弹出时惰性丢弃）
+                del self.sessions[session_id]
+                return None
+            
+            # 更新最后访问时间
+            session.last_accessed = now
+            return session
     
     def get_history(self, session_id: str) -> List[Dict[str, str]]:
         """
@@ -60,13 +123,13 @@ class SessionManager:
         
         Args:
             session_id: 会话ID
-            
+        
         Returns:
             List[Dict[str, str]]: 会话历史
         """
         session = self.get_session(session_id)
         if session:
-            return session.get("history", [])
+            return list(session.history)
         return []
     
     def add_message(self, session_id: str, role: str, content: str) -> bool:
@@ -77,7 +140,7 @@ class SessionManager:
             session_id: 会话ID
             role: 角色，"user"或"assistant"
             content: 消息内容
-            
+        
         Returns:
             bool: 添加成功返回True，否则返回False
         """
@@ -85,16 +148,13 @@ class SessionManager:
         if not session:
             return False
         
-        session["history"].append({
+        # deque设置了maxlen，超过上限时自动丢弃最早的消息
+        session.history.append({
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": time.time()
         })
         
-        # 限制历史消息数量，最多保留50条
-        if len(session["history"]) > 50:
-            session["history"] = session["history"][-50:]
-        
         return True
     
     def delete_session(self, session_id: str) -> bool:
@@ -103,45 +163,162 @@ class SessionManager:
         
         Args:
             session_id: 会话ID
-            
+        
         Returns:
             bool: 删除成功返回True，否则返回False
         """
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
+        with self._lock:
+            if session_id in self.sessions:
+                del self.sessions[session_id]
+                return True
         return False
     
     def cleanup_expired_sessions(self) -> int:
         """
         清理过期会话
         
+        只弹出过期时间已到的堆顶条目，复杂度与过期会话数量相关，而不是与活跃会话总数相关。
+        
         Returns:
             int: 清理的会话数量
         """
-        expired_sessions = []
-        current_time = datetime.now()
-        
-        for session_id, session in self.sessions.items():
-            if (current_time - session["last_accessed"]).total_seconds() > self.session_timeout:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
-        
-        return len(expired_sessions)
+        removed = 0
+        now = time.monotonic()
+        with self._lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                _, session_id = heapq.heappop(heap)
+                session = self.sessions.get(session_id)
+                if session is None:
+                    # 会话已被删除，丢弃陈旧条目
+                    continue
+                if self._is_expired(session, now):
+                    del self.sessions[session_id]
+                    removed += 1
+                else:
+                    # 会话期间被访问过，按最新访问时间重新入堆
+                    heapq.heappush(heap, (session.last_accessed + self.session_timeout, session_id))
+        return removed
     
     def get_session_count(self) -> int:
         """
         获取当前活跃会话数量
         
+        过期会话由后台线程定期清理，这里不再进行全量扫描。
+        
         Returns:
             int: 活跃会话数量
         """
-        # 先清理过期会话
-        self.cleanup_expired_sessions()
         return len(self.sessions)
 
+class SharedSessionManager(SessionManager):
+    """基于SQLite的会话管理器，多个工作进程共享同一个数据库文件
+    
+    多进程部署时后续请求可能由任意工作进程处理，会话必须存放在进程之外；
+    数据库使用WAL模式，读写互不阻塞。接口与 SessionManager 相同，时间使用墙钟秒数。
+    """
+    
+    def __init__(self, db_path: str, session_timeout: int = 3600, cleanup_interval: float = 30.0,
+                 max_history: int = 50, start_cleanup_thread: bool = True):
+        """
+        Args:
+            db_path: SQLite数据库文件路径，所有工作进程使用同一个路径
+            其余参数同 SessionManager
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                         "id TEXT PRIMARY KEY, created_at REAL NOT NULL, last_accessed REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS messages ("
+                         "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                         "role TEXT NOT NULL, content TEXT NOT NULL, timestamp REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)")
+        super().__init__(session_timeout, cleanup_interval, max_history, start_cleanup_thread)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def create_session(self) -> str:
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO sessions (id, created_at, last_accessed) VALUES (?, ?, ?)",
+                         (session_id, now, now))
+        return session_id
+    
+    def _touch(self, conn: sqlite3.Connection, session_id: str, now: float) -> bool:
+        """会话存在且未超时时更新最后访问时间；超时的会话删除"""
+        row = conn.execute("SELECT last_accessed FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return False
+        if now - row[0] > self.session_timeout:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return False
+        conn.execute("UPDATE sessions SET last_accessed = ? WHERE id = ?", (now, session_id))
+        return True
+    
+    def _history(self, conn: sqlite3.Connection, session_id: str) -> List[Dict[str, Any]]:
+        rows = conn.execute("SELECT role, content, timestamp FROM messages WHERE session_id = ? "
+                            "ORDER BY seq DESC LIMIT ?", (session_id, self.max_history)).fetchall()
+        return [{"role": role, "content": content, "timestamp": timestamp} for role, content, timestamp in reversed(rows)]
+    
+    def get_session(self, session_id: str) -> Optional[SessionRecord]:
+        now = time.time()
+        with self._connect() as conn:
+            if not self._touch(conn, session_id, now):
+                return None
+            created_at = conn.execute("SELECT created_at FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            session = SessionRecord(now, self.max_history)
+            session.created_at = created_at
+            session.history.extend(self._history(conn, session_id))
+        return session
+    
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._connect() as conn:
+            if not self._touch(conn, session_id, time.time()):
+                return []
+            return self._history(conn, session_id)
+    
+    def add_message(self, session_id: str, role: str, content: str) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            if not self._touch(conn, session_id, now):
+                return False
+            conn.execute("INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                         (session_id, role, content, now))
+            # 只保留最近 max_history 条消息
+            conn.execute("DELETE FROM messages WHERE session_id = ? AND seq <= ("
+                         "SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                         (session_id, session_id, self.max_history))
+        return True
+    
+    def delete_session(self, session_id: str) -> bool:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+    
+    def cleanup_expired_sessions(self) -> int:
+        cutoff = time.time() - self.session_timeout
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id IN (SELECT id FROM sessions WHERE last_accessed < ?)",
+                         (cutoff,))
+            return conn.execute("DELETE FROM sessions WHERE last_accessed < ?", (cutoff,)).rowcount
+    
+    def get_session_count(self) -> int:
+        cutoff = time.time() - self.session_timeout
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions WHERE last_accessed >= ?", (cutoff,)).fetchone()[0]
+
 # 测试代码
 if __name__ == "__main__":
     manager = SessionManager(session_timeout=30)  # 测试用，设置30秒超时
@@ -0,0 +1,149 @@
+import json
+import hashlib
+import time
+import threading
+import contextvars
+from metrics import registry
+from llm_client import DeadlineExceeded
+from logging_setup import get_logger
+
+logger = get_logger("single_flight")
+
+def request_key(payload):
+    """按最终请求内容（提示词和模型参数）计算去重键"""
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def _remaining(deadline):
+    """距截止时间的剩余秒数，没有截止时间时返回None（无限等待）"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+class _Call:
+    """一次进行中的普通调用"""
+    
+    __slots__ = ("done", "result", "error")
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _StreamCall:
+    """一次进行中的流式调用，已产生的分块全部保留，后加入的订阅者从头回放"""
+    
+    __slots__ = ("chunks", "finished", "error", "cond")
+    
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.cond = threading.Condition()
+
+class SingleFlight:
+    """进行中请求去重
+    
+    相同键的请求同时到达时只有第一个真正执行，其余等待并共享同一结果；
+    调用结束即移除，之后的请求重新执行，不存在缓存过期问题。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+    
+    def do(self, key, fn, deadline=None):
+        """执行 fn 或等待相同键的进行中调用，返回结果（异常同样共享）
+        
+        deadline 为等待者自己的截止时间（time.monotonic()），到期仍未完成时抛出 DeadlineExceeded，
+        不会因为领头请求的截止时间更晚而被拖住。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        
+        if not leader:
+            registry.inc("rag_llm_coalesced_total", help_text="合并到进行中请求的大模型调用数", mode="unary")
+            if not call.done.wait(timeout=_remaining(deadline)):
+                registry.inc("rag_llm_coalesced_timeouts_total", help_text="等待进行中请求超时的次数", mode="unary")
+                raise DeadlineExceeded("等待进行中的相同请求超时")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+    
+    def stream(self, key, fn, deadline=None):
+        """流式版本：fn 返回分块迭代器，所有订阅者按顺序收到完整的分块序列
+        
+        分块由后台线程读取，订阅者中途断开不影响其他订阅者；
+        订阅者在自己的 deadline 之前没有等到首块或结束时抛出 DeadlineExceeded。
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _StreamCall()
+        
+        if leader:
+            # 复制上下文，使上游调用的耗时记入发起请求的追踪
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._pump, key, call, fn),
+                             name="single-flight-stream", daemon=True).start()
+        else:
+            registry.inc("rag_llm_coalesced_total", help_text="合并到进行中请求的大模型调用数", mode="stream")
+        return self._subscribe(call, deadline)
+    
+    def _pump(self, key, call, fn):
+        try:
+            for chunk in fn():
+                with call.cond:
+                    call.chunks.append(chunk)
+                    call.cond.notify_all()
+        except Exception as e:
+            logger.warning("流式调用失败: %s", e)
+            call.error = e
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            with call.cond:
+                call.finished = True
+                call.cond.notify_all()
+    
+    @staticmethod
+    def _subscribe(call, deadline=None):
+        position = 0
+        while True:
+            with call.cond:
+                while position >= len(call.chunks) and not call.finished:
+                    # 截止时间只约束首块，与上游调用一致；开始输出后等到流结束
+                    timeout = _remaining(deadline) if position == 0 else None
+                    if not call.cond.wait(timeout=timeout):
+                        registry.inc("rag_llm_coalesced_timeouts_total", help_text="等待进行中请求超时的次数",
+                                     mode="stream")
+                        raise DeadlineExceeded("等待进行中的相同流式请求超时")
+                chunks = call.chunks[position:]
+                finished = call.finished
+            for chunk in chunks:
+                yield chunk
+            position += len(chunks)
+            if finished and position >= len(call.chunks):
+                if call.error is not None:
+                    raise call.error
+                return
+    
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._streams)
@@ -0,0 +1,238 @@
+import os
+import json
+import mmap
+import time
+import shutil
+import numpy as np
+
+class DocumentStore:
+    """基于内存映射的只读文档块存储
+    
+    文本和元数据分别以UTF-8拼接写入二进制文件，偏移量数组保存为.npy。
+    多个工作进程映射同一份快照文件，由操作系统页缓存共享物理内存。
+    每次访问返回新的字典，调用方修改返回值不会影响共享数据。
+    """
+    
+    TEXT_FILE = "texts.bin"
+    TEXT_OFFSETS_FILE = "text_offsets.npy"
+    META_FILE = "meta.bin"
+    META_OFFSETS_FILE = "meta_offsets.npy"
+    
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self._text_offsets = np.load(os.path.join(snapshot_dir, self.TEXT_OFFSETS_FILE), mmap_mode='r')
+        self._meta_offsets = np.load(os.path.join(snapshot_dir, self.META_OFFSETS_FILE), mmap_mode='r')
+        self._files = []
+        self._texts = self._map(os.path.join(snapshot_dir, self.TEXT_FILE))
+        self._meta = self._map(os.path.join(snapshot_dir, self.META_FILE))
+    
+    def _map(self, path):
+        """只读映射文件，空文件无法映射时返回空字节串"""
+        f = open(path, 'rb')
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    @classmethod
+    def write(cls, snapshot_dir, documents):
+        """将文档列表写入快照目录"""
+        text_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        meta_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        with open(os.path.join(snapshot_dir, cls.TEXT_FILE), 'wb') as tf, \
+                open(os.path.join(snapshot_dir, cls.META_FILE), 'wb') as mf:
+            text_pos = 0
+            meta_pos = 0
+            for i, doc in enumerate(documents):
+                text_bytes = doc["page_content"].encode('utf-8')
+                meta_bytes = json.dumps(doc.get("metadata", {}), ensure_ascii=False).encode('utf-8')
+                tf.write(text_bytes)
+                mf.write(meta_bytes)
+                text_pos += len(text_bytes)
+                meta_pos += len(meta_bytes)
+                text_offsets[i + 1] = text_pos
+                meta_offsets[i + 1] = meta_pos
+        np.save(os.path.join(snapshot_dir, cls.TEXT_OFFSETS_FILE), text_offsets)
+        np.save(os.path.join(snapshot_dir, cls.META_OFFSETS_FILE), meta_offsets)
+    
+    def get_text(self, idx):
+        """只读取文档块文本，不解析元数据"""
+        start, end = self._text_offsets[idx], self._text_offsets[idx + 1]
+        return self._texts[start:end].decode('utf-8')
+    
+    def get_metadata(self, idx):
+        start, end = self._meta_offsets[idx], self._meta_offsets[idx + 1]
+        return json.loads(self._meta[start:end].decode('utf-8'))
+    
+    def __len__(self):
+        return len(self._text_offsets) - 1
+    
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        return {
+            "page_content": self.get_text(idx),
+            "metadata": self.get_metadata(idx)
+        }
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def close(self):
+        for m in (self._texts, self._meta):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+class BuilderLock:
+    """跨进程的非阻塞文件锁，用于在多个工作进程中选举唯一的重建进程"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+    
+    def acquire(self, blocking=False):
+        """获取锁，成功返回True；非阻塞模式下锁被占用时返回False"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(fd, mode, 1)
+            else:
+                import fcntl
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(fd, flags)
+        except OSError:
+            os.close(fd)
+            return False
+        # 记录持有者进程号，便于排查
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+    
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class SnapshotStore:
+    """向量库快照管理
+    
+    每次重建发布一个新的版本目录（gen-000001、gen-000002 ...），
+    发布完成后原子更新CURRENT文件中的版本号。工作进程只需要stat该文件
+    即可发现新版本，代价远低于重新检查资料目录。
+    """
+    
+    CURRENT_FILE = "CURRENT"
+    MANIFEST_FILE = "manifest.json"
+    INDEX_FILE = "index.bin"
+    # 压缩索引精确重排使用的float16原始向量
+    VECTORS_FILE = "vectors.f16.npy"
+    
+    def __init__(self, root_dir, keep_generations=3):
+        self.root_dir = root_dir
+        self.keep_generations = keep_generations
+        self.current_file = os.path.join(root_dir, self.CURRENT_FILE)
+        os.makedirs(root_dir, exist_ok=True)
+        self._current_stat = None
+        self._current_generation = None
+    
+    def generation_dir(self, generation):
+        return os.path.join(self.root_dir, f"gen-{generation:06d}")
+    
+    def builder_lock(self):
+        return BuilderLock(os.path.join(self.root_dir, "builder.lock"))
+    
+    def _list_generations(self):
+        generations = []
+        for name in os.listdir(self.root_dir):
+            if name.startswith("gen-") and name[4:].isdigit():
+                generations.append(int(name[4:]))
+        return sorted(generations)
+    
+    def current_generation(self):
+        """读取当前版本号，CURRENT文件未变化时直接返回缓存值"""
+        try:
+            st = os.stat(self.current_file)
+        except FileNotFoundError:
+            return None
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat_key != self._current_stat:
+            try:
+                with open(self.current_file, 'r', encoding='utf-8') as f:
+                    self._current_generation = int(f.read().strip())
+            except (OSError, ValueError):
+                return None
+            self._current_stat = stat_key
+        return self._current_generation
+    
+    def begin(self):
+        """创建临时目录用于写入新快照"""
+        tmp_dir = os.path.join(self.root_dir, f"tmp-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(tmp_dir)
+        return tmp_dir
+    
+    def publish(self, tmp_dir, manifest):
+        """发布快照：重命名为新版本目录，并原子更新CURRENT"""
+        for _ in range(10):
+            existing = self._list_generations()
+            generation = (existing[-1] if existing else 0) + 1
+            manifest["generation"] = generation
+            with open(os.path.join(tmp_dir, self.MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            try:
+                os.rename(tmp_dir, self.generation_dir(generation))
+                break
+            except OSError:
+                # 其他进程抢先发布了同一版本号，重新分配
+                continue
+        else:
+            raise RuntimeError("分配快照版本号失败")
+        
+        current = self.current_generation()
+        if current is None or generation > current:
+            tmp_current = self.current_file + f".tmp-{os.getpid()}"
+            with open(tmp_current, 'w', encoding='utf-8') as f:
+                f.write(str(generation))
+            os.replace(tmp_current, self.current_file)
+        
+        self._prune(generation)
+        return generation
+    
+    def discard(self, tmp_dir):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def _prune(self, latest):
+        """删除过旧的版本；仍被其他进程映射的文件在Windows上会删除失败，忽略即可"""
+        for generation in self._list_generations():
+            if generation <= latest - self.keep_generations:
+                shutil.rmtree(self.generation_dir(generation), ignore_errors=True)
+    
+    def read_manifest(self, generation):
+        with open(os.path.join(self.generation_dir(generation), self.MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
@@ -1,13 +1,16 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // 加载系统状态
-    loadStatus();
-    
-    // 会话ID管理
+    // 会话ID管理；没有会话时由服务端在第一个问题时创建并返回
     let sessionId = localStorage.getItem('sessionId');
-    if (!sessionId) {
-        // 创建新会话
-        createSession();
-    }
+    
+    // WebSocket聊天通道：问题和回答分块走同一个长连接，服务端推送快照版本和重建进度；
+    // 连接不可用时回退到HTTP接口
+    let socket = null;
+    let socketOpened = false;
+    let reconnectDelay = 1000;
+    let nextQueryId = 1;
+    const pendingQueries = {};
+    let systemStatus = {};
+    connectSocket();
     
     // 绑定查询表单提交事件
     document.getElementById('query-form').addEventListener('submit', async function(e) {
@@ -77,6 +80,14 @@ document.addEventListener('DOMContentLoaded', function() {
         // 保存进度更新的引用
         window.loadingProgressInterval = progressInterval;
         
+        // 通过WebSocket发送，回答分块到达后逐步显示
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            const queryId = nextQueryId++;
+            pendingQueries[queryId] = {text: '', sources: [], messageDiv: null};
+            socket.send(JSON.stringify({type: 'query', id: queryId, text: query, session_id: sessionId}));
+            return;
+        }
+        
         try {
             // 发送查询
             const response = await fetch('/api/query', {
@@ -102,36 +113,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 localStorage.setItem('sessionId', sessionId);
             }
             
-            // 清除进度更新定时器
-            clearInterval(window.loadingProgressInterval);
-            
-            // 更新为100%
-            const loadingIndicator = document.getElementById('loading-indicator');
-            if (loadingIndicator) {
-                const loadingProgress = loadingIndicator.querySelector('.loading-progress');
-                const loadingText = loadingIndicator.querySelector('.loading-text');
-                if (loadingProgress && loadingText) {
-                    loadingProgress.style.width = '100%';
-                    loadingText.textContent = '处理完成！ 100%';
-                }
-                
-                // 延迟移除加载状态
-                setTimeout(() => {
-                    loadingIndicator.remove();
-                }, 500);
-            }
+            // 加载状态更新为100%
+            completeLoading();
             
             // 添加机器人回复
             addMessage('bot', data.answer, data.sources);
         } catch (error) {
-            // 清除进度更新定时器
-            clearInterval(window.loadingProgressInterval);
-            
             // 移除加载状态
-            const loadingIndicator = document.getElementById('loading-indicator');
-            if (loadingIndicator) {
-                loadingIndicator.remove();
-            }
+            removeLoading();
             
             // 显示错误消息
             addMessage('bot', '抱歉，处理您的请求时出错，请稍后重试。');
@@ -139,6 +128,163 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // 加载状态更新为100%后延迟移除
+    function completeLoading() {
+        // 清除进度更新定时器
+        clearInterval(window.loadingProgressInterval);
+        
+        const loadingIndicator = document.getElementById('loading-indicator');
+        if (loadingIndicator) {
+            const loadingProgress = loadingIndicator.querySelector('.loading-progress');
+            const loadingText = loadingIndicator.querySelector('.loading-text');
+            if (loadingProgress && loadingText) {
+                loadingProgress.style.width = '100%';
+                loadingText.textContent = '处理完成！ 100%';
+            }
+            
+            // 延迟移除加载状态
+            loadingIndicator.removeAttribute('id');
+            setTimeout(() => {
+                loadingIndicator.remove();
+            }, 500);
+        }
+    }
+    
+    // 出错时直接移除加载状态
+    function removeLoading() {
+        // 清除进度更新定时器
+        clearInterval(window.loadingProgressInterval);
+        
+        const loadingIndicator = document.getElementById('loading-indicator');
+        if (loadingIndicator) {
+            loadingIndicator.remove();
+        }
+    }
+    
+    // 建立WebSocket连接，断开后按指数退避重连
+    function connectSocket() {
+        if (!('WebSocket' in window)) {
+            loadStatus();
+            return;
+        }
+        
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const params = sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : '';
+        socket = new WebSocket(`${protocol}//${window.location.host}/ws/chat${params}`);
+        
+        socket.addEventListener('open', function() {
+            socketOpened = true;
+            reconnectDelay = 1000;
+        });
+        
+        socket.addEventListener('message', function(e) {
+            handleSocketEvent(JSON.parse(e.data));
+        });
+        
+        socket.addEventListener('close', function() {
+            socket = null;
+            // 进行中的问题无法继续接收回答，按出错处理
+            Object.keys(pendingQueries).forEach(queryId => failQuery(queryId));
+            // 从未连上（例如服务端不支持WebSocket）时通过HTTP接口加载一次状态
+            if (!socketOpened && !systemStatus.data_dir) {
+                loadStatus();
+            }
+            setTimeout(connectSocket, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        });
+    }
+    
+    // 处理服务端推送的事件
+    function handleSocketEvent(event) {
+        const pending = pendingQueries[event.id];
+        switch (event.type) {
+            case 'status':
+                systemStatus = event;
+                renderStatus();
+                break;
+            case 'generation':
+                // 新快照已加载
+                systemStatus.vector_store_status = 'loaded';
+                systemStatus.document_count = event.document_count;
+                systemStatus.generation = event.generation;
+                renderStatus();
+                break;
+            case 'rebuild':
+                systemStatus.rebuild = (event.stage === 'done' || event.stage === 'failed') ? null : event;
+                renderStatus();
+                break;
+            case 'session':
+                sessionId = event.session_id;
+                localStorage.setItem('sessionId', sessionId);
+                break;
+            case 'sources':
+                if (pending) {
+                    pending.sources = event.sources;
+                }
+                break;
+            case 'token':
+                if (pending) {
+                    appendToken(pending, event.text);
+                }
+                break;
+            case 'done':
+                if (pending) {
+                    finishQuery(event.id, event.answer);
+                }
+                break;
+            case 'error':
+                if (pending) {
+                    failQuery(event.id);
+                }
+                console.error('WebSocket错误:', event.detail);
+                break;
+            case 'ping':
+                // 回应服务端心跳，连接保持活跃
+                socket.send(JSON.stringify({type: 'pong'}));
+                break;
+        }
+    }
+    
+    // 收到回答分块：第一块到达时移除加载状态，之后逐块追加显示
+    function appendToken(pending, text) {
+        if (!pending.messageDiv) {
+            completeLoading();
+            const chatContainer = document.getElementById('chat-container');
+            pending.messageDiv = document.createElement('div');
+            pending.messageDiv.className = 'message bot-message';
+            pending.contentDiv = document.createElement('div');
+            pending.contentDiv.className = 'message-content';
+            pending.messageDiv.appendChild(pending.contentDiv);
+            chatContainer.appendChild(pending.messageDiv);
+        }
+        pending.text += text;
+        pending.contentDiv.innerHTML = pending.text.replace(/\n/g, '<br>');
+        const chatContainer = document.getElementById('chat-container');
+        chatContainer.scrollTop = chatContainer.scrollHeight;
+    }
+    
+    // 回答完成：用完整回答替换流式显示的内容，无资料时不显示参考资料
+    function finishQuery(queryId, answer) {
+        const pending = pendingQueries[queryId];
+        delete pendingQueries[queryId];
+        if (pending.messageDiv) {
+            pending.messageDiv.remove();
+        } else {
+            completeLoading();
+        }
+        addMessage('bot', answer, answer.type === 'no_info' ? [] : pending.sources);
+    }
+    
+    function failQuery(queryId) {
+        const pending = pendingQueries[queryId];
+        delete pendingQueries[queryId];
+        if (pending && pending.messageDiv) {
+            pending.messageDiv.remove();
+        }
+        removeLoading();
+        addMessage('bot', '抱歉，处理您的请求时出错，请稍后重试。');
+    }
+    
     // 绑定上传表单提交事件
     document.getElementById('upload-form').addEventListener('submit', async function(e) {
         e.preventDefault();
@@ -180,8 +326,10 @@ document.addEventListener('DOMContentLoaded', function() {
             // 重置文件输入
             fileInput.value = '';
             
-            // 重新加载状态
-            loadStatus();
+            // 重新加载状态；WebSocket连接可用时重建进度和新快照由服务端推送
+            if (!socket || socket.readyState !== WebSocket.OPEN) {
+                loadStatus();
+            }
         } catch (error) {
             uploadStatus.textContent = '上传失败: ' + error.message;
             console.error(error);
@@ -441,39 +589,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('获取状态失败');
             }
             
-            const data = await response.json();
-            const statusInfo = document.getElementById('status-info');
-            
-            statusInfo.innerHTML = `
-                <p>向量库状态: ${data.vector_store_status}</p>
-                <p>文档数量: ${data.document_count}</p>
-                <p>资料目录: ${data.data_dir}</p>
-            `;
+            systemStatus = await response.json();
+            renderStatus();
         } catch (error) {
             console.error('加载状态失败:', error);
         }
     }
     
-    // 创建新会话
-    async function createSession() {
-        try {
-            const response = await fetch('/api/session', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                }
-            });
-            
-            if (!response.ok) {
-                throw new Error('创建会话失败');
-            }
-            
-            const data = await response.json();
-            sessionId = data.session_id;
-            localStorage.setItem('sessionId', sessionId);
-            console.log('创建新会话:', sessionId);
-        } catch (error) {
-            console.error('创建会话失败:', error);
-        }
+    // 显示系统状态，重建进行中时显示当前阶段
+    function renderStatus() {
+        const statusInfo = document.getElementById('status-info');
+        const rebuild = systemStatus.rebuild;
+        
+        statusInfo.innerHTML = `
+            <p>向量库状态: ${systemStatus.vector_store_status}</p>
+            <p>文档数量: ${systemStatus.document_count}</p>
+            <p>资料目录: ${systemStatus.data_dir}</p>
+            ${rebuild ? `<p>向量库更新中: 第${rebuild.step}/${rebuild.total}步 (${rebuild.stage})</p>` : ''}
+        `;
     }
 });
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from starlette.responses import Response
+from logging_setup import get_logger
+
+logger = get_logger("static_assets")
+
+# 小于该大小（字节）的文件不预压缩
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# URL带内容版本号（?v=哈希）的资源内容不会变化，可以长期缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# 入口页面和不带版本号的请求每次向服务端确认，ETag命中时返回304
+REVALIDATE_CACHE = "no-cache"
+# 页面中引用静态资源的属性，加载时追加版本号
+_ASSET_REF = re.compile(r'(?P<attr>(?:src|href)=")(?P<prefix>/?static/)(?P<path>[^"?#]+)"')
+
+class Asset:
+    """内存中的一个静态文件：原始内容、预压缩的各编码版本和内容哈希"""
+    
+    __slots__ = ("body", "media_type", "version", "encoded")
+    
+    def __init__(self, body, media_type, encoders):
+        self.body = body
+        self.media_type = media_type
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.encoded = {}
+        if len(body) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding, compress in encoders:
+                compressed = compress(body)
+                # 压缩后没有变小的编码不保留
+                if len(compressed) < len(body):
+                    self.encoded[encoding] = compressed
+    
+    def etag(self, encoding=None):
+        # 不同编码是不同的表示，强ETag需要区分
+        return f'"{self.version}-{encoding}"' if encoding else f'"{self.version}"'
+
+class StaticAssets:
+    """启动时把静态目录读入内存并预压缩（gzip，安装了brotli时同时生成br）
+    
+    - 每个文件按内容哈希生成ETag，If-None-Match 命中时返回304
+    - HTML中对 static/ 下资源的引用追加 ?v=内容哈希，带版本号的请求长期缓存，
+      文件修改后哈希变化，浏览器自动请求新版本
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+        self.load()
+    
+    @staticmethod
+    def _encoders():
+        encoders = []
+        try:
+            import brotli
+            encoders.append(("br", lambda body: brotli.compress(body, quality=11)))
+        except ImportError:
+            pass
+        encoders.append(("gzip", lambda body: gzip.compress(body, compresslevel=9, mtime=0)))
+        return encoders
+    
+    def load(self):
+        encoders = self._encoders()
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, self.directory).replace(os.sep, "/")] = f.read()
+        
+        assets = {}
+        # 先处理被引用的资源，HTML改写引用后再计算自身的哈希
+        for rel_path in sorted(files, key=lambda path: path.endswith((".html", ".htm"))):
+            body = files[rel_path]
+            media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+            if media_type == "text/html":
+                body = self._version_refs(body, assets)
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            assets[rel_path] = Asset(body, media_type, encoders)
+        self.assets = assets
+        logger.info("已加载 %d 个静态文件，原始 %d 字节，预压缩编码: %s", len(assets),
+                    sum(len(asset.body) for asset in assets.values()), [name for name, _ in encoders])
+    
+    @staticmethod
+    def _version_refs(body, assets):
+        def replace(match):
+            asset = assets.get(match.group("path"))
+            if asset is None:
+                return match.group(0)
+            return f'{match.group("attr")}{match.group("prefix")}{match.group("path")}?v={asset.version}"'
+        return _ASSET_REF.sub(replace, body.decode("utf-8")).encode("utf-8")
+    
+    def get(self, path):
+        return self.assets.get(path)
+    
+    @staticmethod
+    def _choose_encoding(asset, accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(","):
+            name, _, params = part.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in asset.encoded and (encoding in accepted or "*" in accepted):
+                return encoding
+        return None
+    
+    def response(self, path, request, version=None):
+        """静态文件响应；文件不存在时返回None
+        
+        Args:
+            path: 相对于静态目录的路径
+            request: 当前请求，读取 Accept-Encoding 和 If-None-Match
+            version: 请求URL中的版本号，与当前内容哈希一致时允许长期缓存
+        """
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+        encoding = self._choose_encoding(asset, request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": IMMUTABLE_CACHE if version == asset.version else REVALIDATE_CACHE,
+            "Vary": "Accept-Encoding"
+        }
+        
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or asset.etag(encoding) in tags:
+                return Response(status_code=304, headers=headers)
+        
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = asset.encoded[encoding]
+        else:
+            body = asset.body
+        return Response(body, headers=headers, media_type=asset.media_type)
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from admission import Admission, AdmissionController, Overloaded, client_address, parse_trusted_proxies
+
+PROXIES = parse_trusted_proxies(["10.0.0.0/8", "127.0.0.1", "not-an-ip"])
+
+
+def test_forwarded_for_only_from_trusted_proxies():
+    assert client_address("203.0.113.9", "198.51.100.1", PROXIES) == "203.0.113.9"
+    assert client_address("10.1.2.3", "198.51.100.1", PROXIES) == "198.51.100.1"
+    # 客户端自带的伪造地址在最左侧，取最右侧第一个不受信任的地址
+    assert client_address("10.1.2.3", "1.2.3.4, 198.51.100.1, 10.0.0.5", PROXIES) == "198.51.100.1"
+    assert client_address("10.1.2.3", None, PROXIES) == "10.1.2.3"
+    assert client_address("10.1.2.3", "198.51.100.1", []) == "10.1.2.3"
+
+
+def test_rate_limits_per_key():
+    admission = Admission(ip_rate=0.001, ip_burst=2, session_rate=0.001, session_burst=1)
+    admission.check_rate("198.51.100.1", "s1")
+    with pytest.raises(Overloaded) as excinfo:
+        admission.check_rate("198.51.100.1", "s1")
+    assert (excinfo.value.status_code, excinfo.value.reason) == (429, "session_rate")
+    admission.check_rate("198.51.100.1", "s2")
+    with pytest.raises(Overloaded) as excinfo:
+        admission.check_rate("198.51.100.1", "s3")
+    assert excinfo.value.reason == "ip_rate"
+    # 其他客户端不受影响
+    admission.check_rate("198.51.100.2", "s4")
+
+
+def test_queue_full_and_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        held = await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire()
+        assert excinfo.value.reason == "queue_full"
+        with pytest.raises(Overloaded) as excinfo:
+            await waiter
+        assert excinfo.value.reason == "queue_timeout"
+        controller.release(held)
+        return controller
+    
+    controller = asyncio.run(scenario())
+    assert (controller.in_flight, controller.waiting, controller._semaphore._value) == (0, 0, 1)
+
+
+@pytest.mark.parametrize("release_first", [False, True])
+def test_cancelled_waiter_does_not_leak_slot(release_first):
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5.0)
+        held = await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        if release_first:
+            # 名额刚交给等待者，等待者还没来得及运行就被取消
+            controller.release(held)
+            waiter.cancel()
+        else:
+            waiter.cancel()
+            controller.release(held)
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        # 名额已归还，可以再次立即获得
+        again = await asyncio.wait_for(controller.acquire(), 1)
+        controller.release(again)
+        return controller
+    
+    controller = asyncio.run(scenario())
+    assert (controller.in_flight, controller.waiting, controller._semaphore._value) == (0, 0, 1)
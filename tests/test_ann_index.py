@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import ann_index
+
+
+def clustered(n=3000, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((30, dim)).astype(np.float32) * 4
+    return (centers[rng.integers(0, 30, n)] + rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def test_held_out_rows_are_not_their_own_neighbours():
+    embeddings = clustered(500)
+    queries, rows = ann_index.sample_queries(embeddings, 20)
+    truth = ann_index.exact_neighbors(queries, embeddings, 8, rows)
+    assert truth.shape == (20, 8)
+    assert not any(rows[i] in truth[i] for i in range(20))
+    assert np.array_equal(queries, embeddings[rows])
+
+
+def test_auto_tune_reaches_target_on_held_out_queries():
+    embeddings = clustered()
+    index = ann_index.build_index(embeddings, "IVF64,Flat")
+    tuning = ann_index.auto_tune(index, embeddings, target_recall=0.9, latency_budget_ms=float("inf"), query_count=50)
+    assert tuning["search_params"]["nprobe"] >= 1
+    assert tuning["recall"] >= 0.9
+    # 按选出的参数独立复测，召回率与调参结果一致
+    queries, rows = ann_index.sample_queries(embeddings, 50)
+    truth = ann_index.exact_neighbors(queries, embeddings, 8, rows)
+    recall, _ = ann_index.measure(index, queries, truth, 8, rows)
+    assert recall == tuning["recall"]
+
+
+def test_auto_tune_accepts_external_queries():
+    embeddings = clustered()
+    queries = clustered(40, seed=1)
+    index = ann_index.build_index(embeddings, "IVF64,Flat")
+    tuning = ann_index.auto_tune(index, embeddings, target_recall=0.9, latency_budget_ms=float("inf"), queries=queries)
+    assert tuning["recall"] >= 0.9
+
+
+class JitteryIndex:
+    """第一轮测量时每次检索都很慢，模拟一次偶发的抖动"""
+    
+    def __init__(self, index, slow_calls):
+        self.index = index
+        self.slow_calls = slow_calls
+        self.ntotal = index.ntotal
+    
+    def search(self, queries, k):
+        if self.slow_calls > 0:
+            self.slow_calls -= 1
+            time.sleep(0.01)
+        return self.index.search(queries, k)
+
+
+def test_measure_uses_median_latency():
+    embeddings = clustered(500)
+    queries, rows = ann_index.sample_queries(embeddings, 10)
+    truth = ann_index.exact_neighbors(queries, embeddings, 8, rows)
+    index = JitteryIndex(ann_index.build_index(embeddings, "Flat"), slow_calls=10)
+    recall, latency_ms = ann_index.measure(index, queries, truth, 8, rows, repeat=3)
+    assert recall == 1.0
+    assert latency_ms < 5
@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+from web_server import WebServer
+
+DOCS = {
+    "发票导入.txt": "发票导入步骤如下：\n1. 打开费控商旅首页\n2. 点击发票夹\n3. 选择导入方式，可以拍照识别或上传PDF发票\n"
+                "4. 确认发票信息后保存\n导入的发票可在报销时直接关联。\n",
+    "差旅标准.txt": "差旅住宿标准根据职级确定。一般员工在一线城市每晚不超过500元，其他城市每晚不超过350元。\n",
+}
+
+
+@pytest.fixture
+def server(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name, text in DOCS.items():
+        (data_dir / name).write_text(text, encoding="utf-8")
+    config = {
+        "data_dir": str(data_dir),
+        "vector_db_path": str(tmp_path / "vdb" / "faiss_index.bin"),
+        "log_dir": str(tmp_path / "logs"),
+        "doubao_api_key": "key",
+        # 大模型不可用，回答走降级路径
+        "doubao_api_url": "http://127.0.0.1:9/api/v3/chat/completions",
+        "llm_deadline_s": 0.5,
+        "llm_max_attempts": 1,
+        "llm_routing": False,
+        "extractive_min_confidence": 2.0,
+    }
+    server = WebServer(config)
+    assert server.warmed.wait(60)
+    yield server
+    server._stop_watch.set()
+
+
+def test_websocket_and_http_report_the_same_answer_type(server):
+    question = "发票导入步骤"
+    with TestClient(server.app) as client:
+        http_answer = client.post("/api/query", data={"text": question}).json()["answer"]
+        with client.websocket_connect("/ws/chat") as ws:
+            ws.send_json({"type": "query", "id": 1, "text": question})
+            while True:
+                message = ws.receive_json()
+                if message["type"] == "done":
+                    break
+        ws_answer = message["answer"]
+    
+    # 大模型失败后两条链路都返回降级的抽取式回答，而不是标成普通回答
+    assert http_answer["type"] != "info"
+    assert ws_answer["type"] == http_answer["type"]
+    assert ws_answer.get("degraded") == http_answer.get("degraded")
+    assert ws_answer["message"] == http_answer["message"]
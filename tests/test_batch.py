@@ -0,0 +1,46 @@
+import time
+import threading
+from rag_core import RAGCore
+from test_request_deadline import DOCS, FakeLoader, RecordingClient
+
+
+def make_core(delay):
+    core = RAGCore(FakeLoader(), "key", llm_client=RecordingClient(), extractive=False)
+    core.retrieve_relevant_docs_batch = lambda queries: [[dict(doc) for doc in DOCS] for _ in queries]
+    core._finish_answer = lambda query, answer, relevant_docs: answer
+    core.calls = []
+    core.finished = []
+    
+    def generate_answer(query, relevant_docs, deadline=None):
+        core.calls.append(deadline)
+        time.sleep(delay)
+        core.finished.append(query)
+        return {"type": "info", "message": query}
+    
+    core.generate_answer = generate_answer
+    return core
+
+
+def test_batch_yields_every_query_with_its_own_deadline():
+    core = make_core(0.01)
+    drained = threading.Event()
+    queries = [f"问题{i}" for i in range(6)]
+    results = list(core.process_queries_batch(queries, max_concurrency=2, on_drained=drained.set))
+    assert sorted(index for index, _, _ in results) == list(range(6))
+    assert drained.is_set()
+    # 每条查询开始时各自计算截止时间
+    assert len(set(core.calls)) == 6
+
+
+def test_closing_batch_cancels_pending_and_drains_in_flight():
+    core = make_core(0.3)
+    drained = threading.Event()
+    batch = core.process_queries_batch([f"问题{i}" for i in range(20)], max_concurrency=2, on_drained=drained.set)
+    next(batch)
+    batch.close()
+    # 关闭时进行中的调用还没结束，名额不能提前归还
+    assert not drained.is_set()
+    assert drained.wait(2)
+    # 还没开始的查询被取消
+    assert len(core.calls) <= 4
+    assert len(core.finished) == len(core.calls)
@@ -0,0 +1,69 @@
+import os
+import data_loader
+from data_loader import DataLoader
+
+
+def make_files(data_dir, count):
+    os.makedirs(data_dir, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(data_dir, f"doc{i}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# 文档{i}\n\n第{i}篇资料的正文。")
+
+
+def make_loader(tmp_path, **kwargs):
+    return DataLoader(str(tmp_path / "data"), str(tmp_path / "vdb" / "index.bin"), **kwargs)
+
+
+def test_parse_cache_reused_and_pruned(tmp_path):
+    make_files(tmp_path / "data", 3)
+    loader = make_loader(tmp_path, parse_workers=1)
+    assert len(loader.load_files()) == 3
+    assert (loader.parse_cache.hits, loader.parse_cache.misses) == (0, 3)
+    
+    # 修改一个文件：只重新解析这个文件，旧内容的缓存条目被清理
+    with open(tmp_path / "data" / "doc0.md", "w", encoding="utf-8") as f:
+        f.write("# 文档0\n\n修改后的正文。")
+    loader = make_loader(tmp_path, parse_workers=1)
+    files = dict(loader.load_files())
+    assert (loader.parse_cache.hits, loader.parse_cache.misses) == (2, 1)
+    assert files[str(tmp_path / "data" / "doc0.md")][-1].text == "修改后的正文。"
+    entries = [name for _, _, names in os.walk(loader.parse_cache.cache_dir) for name in names]
+    assert len(entries) == 3
+
+
+def test_process_pool_failure_falls_back_to_serial_parsing(tmp_path, monkeypatch):
+    make_files(tmp_path / "data", 4)
+    
+    class BrokenPool:
+        def __init__(self, *args, **kwargs):
+            raise OSError("无法创建子进程")
+    
+    monkeypatch.setattr(data_loader, "ProcessPoolExecutor", BrokenPool)
+    monkeypatch.setattr(data_loader, "PARALLEL_PARSE_MIN_FILES", 2)
+    loader = make_loader(tmp_path, parse_cache=False, parse_workers=2)
+    files = loader.load_files()
+    assert sorted(os.path.basename(path) for path, _ in files) == [f"doc{i}.md" for i in range(4)]
+
+
+def test_parallel_parsing_matches_serial(tmp_path, monkeypatch):
+    make_files(tmp_path / "data", 4)
+    monkeypatch.setattr(data_loader, "PARALLEL_PARSE_MIN_FILES", 2)
+    paths = sorted(str(tmp_path / "data" / name) for name in os.listdir(tmp_path / "data"))
+    parallel = make_loader(tmp_path, parse_cache=False, parse_workers=2)._parse_files(paths)
+    serial = make_loader(tmp_path, parse_cache=False, parse_workers=1)._parse_files(paths)
+    assert parallel == serial and all(serial)
+
+
+def test_deleted_files_are_dropped_from_hashes(tmp_path):
+    make_files(tmp_path / "data", 3)
+    loader = make_loader(tmp_path)
+    loader._update_file_hashes()
+    assert not loader.check_for_changes()
+    
+    # 删除文件算作变更；更新记录后不再反复报告变更
+    os.remove(tmp_path / "data" / "doc1.md")
+    assert loader.check_for_changes()
+    loader._update_file_hashes()
+    assert str(tmp_path / "data" / "doc1.md") not in loader.file_hashes
+    assert len(loader.file_hashes) == 2
+    assert not loader.check_for_changes()
@@ -0,0 +1,53 @@
+import zipfile
+import tracemalloc
+from chunker import TABLE_ROW, HEADING
+from docx_stream import iter_docx_blocks
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def cell(text, props=""):
+    return f"<w:tc><w:tcPr>{props}</w:tcPr><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:tc>"
+
+
+def write_docx(path, rows):
+    """生成一个带标题段落和表格的 .docx，rows 为每行的单元格XML"""
+    table = "".join(f"<w:tr>{''.join(cells)}</w:tr>" for cells in rows)
+    body = ('<w:p><w:pPr><w:outlineLvl w:val="0"/></w:pPr><w:r><w:t>差旅标准</w:t></w:r></w:p>'
+            f"<w:tbl><w:tblPr/>{table}</w:tbl>")
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f"<w:document {W}><w:body>{body}</w:body></w:document>")
+    return path
+
+
+def test_table_rows_with_merged_cells(tmp_path):
+    rows = [
+        [cell("城市"), cell("标准")],
+        [cell("一线城市", '<w:vMerge w:val="restart"/>'), cell("500元")],
+        [cell("", "<w:vMerge/>"), cell("经理600元")],
+        [cell("合计", '<w:gridSpan w:val="2"/>')],
+    ]
+    blocks = list(iter_docx_blocks(write_docx(tmp_path / "t.docx", rows)))
+    assert blocks[0].kind == HEADING
+    assert [block.text for block in blocks[1:]] == ["城市 | 标准", "一线城市 | 500元", "一线城市 | 经理600元", "合计"]
+    assert all(block.kind == TABLE_ROW for block in blocks[1:])
+
+
+def peak_bytes(path):
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in iter_docx_blocks(path))
+        return count, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_large_table_memory_does_not_grow_with_rows(tmp_path):
+    def rows(n):
+        return [[cell(f"第{i}行"), cell("内容" * 5, '<w:vMerge w:val="restart"/>')] for i in range(n)]
+    
+    small_count, small_peak = peak_bytes(write_docx(tmp_path / "small.docx", rows(2000)))
+    large_count, large_peak = peak_bytes(write_docx(tmp_path / "large.docx", rows(20000)))
+    assert (small_count, large_count) == (2001, 20001)
+    # 行数增加10倍，峰值内存基本不变
+    assert large_peak < small_peak * 2
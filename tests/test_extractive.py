@@ -0,0 +1,44 @@
+from extractive import ExtractiveAnswerer, extract_steps
+from model_router import query_overlap
+
+CREATE_STEPS = {
+    "page_content": "新建出差申请：\n1. 登录费控商旅\n2. 点击新建出差申请\n3. 填写出差行程\n4. 提交出差申请",
+    "similarity_score": 0.9,
+    "metadata": {"chunk_type": "procedure"}
+}
+
+
+def make_answerer():
+    return ExtractiveAnswerer(min_confidence=0.8, min_overlap=0.6, min_steps=2, max_depth=0)
+
+
+def test_matching_how_to_question_is_answered_from_steps():
+    answer = make_answerer().answer("如何提交出差申请", [CREATE_STEPS])
+    assert answer is not None and answer.startswith("1. 登录费控商旅")
+
+
+def test_borderline_question_goes_to_llm():
+    query = "如何撤回出差申请"
+    # 二元组重合度恰好达到阈值，但问的是撤回，步骤讲的是新建
+    assert query_overlap(query, CREATE_STEPS["page_content"]) >= 0.6
+    assert query_overlap(query, "\n".join(extract_steps(CREATE_STEPS["page_content"])), strict=True) < 0.6
+    assert make_answerer().answer(query, [CREATE_STEPS]) is None
+    # 放宽检索置信度阈值后，步骤重合度仍然不够
+    lenient = ExtractiveAnswerer(min_confidence=0.5, min_overlap=0.6)
+    assert lenient.answer(query, [CREATE_STEPS]) is None
+
+
+def test_low_confidence_retrieval_goes_to_llm():
+    # 排名靠前但与问题无关的操作步骤
+    assert make_answerer().answer("怎么修改收款账户", [CREATE_STEPS]) is None
+
+
+def test_follow_up_and_non_procedural_questions_go_to_llm():
+    answerer = make_answerer()
+    assert answerer.answer("如何提交出差申请", [CREATE_STEPS], conversation_depth=1) is None
+    assert answerer.answer("出差申请", [CREATE_STEPS]) is None
+
+
+def test_strict_overlap_for_short_segments():
+    assert query_overlap("借款", "借款单", strict=True) == 1.0
+    assert query_overlap("吗", "任何文本", strict=True) == 0.0
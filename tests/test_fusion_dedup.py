@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from dedup import dedupe_documents, find_near_duplicates, jaccard, shingle_hashes
+from fusion import fuse
+
+CANDIDATES = {
+    "mandatory": (np.array([5, 1]), np.array([1.0, 1.0])),
+    "keyword": (np.array([1, 7, 3]), np.array([3.0, 2.0, 1.0])),
+    "vector": (np.array([3, 1, 9]), np.array([0.9, 0.8, 0.1]))
+}
+
+
+def test_rrf_rewards_agreement_and_dedupes_ids():
+    ids, scores = fuse(CANDIDATES, "rrf", top_k=10, rrf_k=60)
+    assert ids[0] == 1
+    assert len(set(ids.tolist())) == len(ids) == 5
+    assert np.all(np.diff(scores) <= 0)
+    assert scores[0] == pytest.approx(1 / 62 + 1 / 61 + 1 / 62)
+
+
+def test_weights_and_top_k():
+    ids, _ = fuse(CANDIDATES, "rrf", weights={"vector": 1.0}, top_k=2)
+    assert ids.tolist() == [3, 1]
+    ids, scores = fuse(CANDIDATES, "weighted", top_k=3)
+    assert ids[0] == 1 and len(ids) == 3
+    assert fuse({}, "rrf")[0].size == 0
+    with pytest.raises(ValueError):
+        fuse(CANDIDATES, "unknown")
+
+
+def test_near_duplicates_merge_sources():
+    base = "登录费控商旅后点击新建出差申请，填写出差行程、出差事由和预计费用，确认无误后提交审批，审批通过后可预订机票酒店。"
+    documents = [
+        {"page_content": base, "metadata": {"source": "a.docx"}},
+        {"page_content": base.replace("。", "！"), "metadata": {"source": "b.docx"}},
+        {"page_content": "报销单需要关联出差申请单，并上传电子发票。", "metadata": {"source": "c.docx"}},
+        {"page_content": base, "metadata": {"source": "a.docx"}},
+    ]
+    assert find_near_duplicates([doc["page_content"] for doc in documents], 0.9) == [0, 0, 2, 0]
+    kept = dedupe_documents(documents, 0.9)
+    assert [doc["metadata"]["sources"] for doc in kept] == [["a.docx", "b.docx"], ["c.docx"]]
+
+
+def test_jaccard_of_shingles():
+    first, second = shingle_hashes("出差申请单填写说明"), shingle_hashes("出差申请单填写说明")
+    assert jaccard(first, second) == 1.0
+    assert jaccard(first, shingle_hashes("发票导入失败处理")) == 0.0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from lexical_index import LexicalIndex
+
+pytest.importorskip("jieba")
+from segmenter import Segmenter
+
+TEXTS = [
+    "登录企业手机银行后进入费控商旅，新建出差申请单并提交。",
+    "填写报销单，申请单提交后等待审批人审批。",
+    "差旅标准：住宿费按城市分级，超标需说明原因。",
+    "在票据夹中选择电子发票，发票导入失败时重新上传。",
+    "点击“进入费控”按钮，系统跳转到首页。",
+    "",
+]
+KEYWORDS = ["进入费控", "申请单提交", "费控商旅", "出差申请单", "发票导入", "报销单", "审批", "不存在的词", "“进入"]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    snapshot_dir = tmp_path_factory.mktemp("snapshot")
+    segmenter = Segmenter(keyword_file=str(snapshot_dir / "missing.json"))
+    LexicalIndex.write(str(snapshot_dir), TEXTS, segmenter)
+    return LexicalIndex.load(str(snapshot_dir), TEXTS.__getitem__)
+
+
+def substring_mask(term):
+    return np.array([term in text for text in TEXTS])
+
+
+def test_keyword_hits_match_substring_scan(index):
+    counts, hit_docs, hit_keywords = index.keyword_hits(KEYWORDS)
+    expected = np.stack([substring_mask(keyword) for keyword in KEYWORDS], axis=1)
+    assert counts.tolist() == expected.sum(axis=1).tolist()
+    assert sorted(zip(hit_docs.tolist(), hit_keywords.tolist())) == sorted(zip(*np.nonzero(expected)))
+    # 跨越词边界的关键词同样命中
+    assert expected[:, 0].any() and expected[:, 1].any()
+
+
+def test_contains_mask_for_terms_outside_dictionary(index):
+    # 运行时新增、不在入库词典中的词
+    for term in ["进入费控商旅", "登录企业手机银行", "申请单提交后", "城市分级"]:
+        assert index.contains_mask(term).tolist() == substring_mask(term).tolist()
+
+
+def test_without_texts_only_token_matches(tmp_path):
+    segmenter = Segmenter(keyword_file=str(tmp_path / "missing.json"))
+    LexicalIndex.write(str(tmp_path), TEXTS, segmenter)
+    index = LexicalIndex.load(str(tmp_path))
+    mask = index.contains_mask("费控商旅")
+    assert mask.tolist() == substring_mask("费控商旅").tolist()
+
+
+def test_term_tokens_uses_character_postings(index):
+    ids = index.term_tokens("发票")
+    assert len(ids) and all("发票" in index.vocab[i] for i in ids)
+    assert len(index.term_tokens("不存在的词")) == 0
+    assert len(index.term_tokens("")) == 0
@@ -0,0 +1,118 @@
+import pytest
+import requests
+from llm_client import LLMClient, CircuitBreaker, CircuitOpen, UpstreamError
+
+class FakeResponse:
+    def close(self):
+        pass
+
+def make_client(outcomes, threshold=2):
+    """按顺序返回或抛出 outcomes 中的结果；冷却时间为0，打开后立即进入半开"""
+    client = LLMClient("http://upstream.invalid", "key", max_attempts=1, breaker_threshold=threshold,
+                       breaker_reset_s=0.0)
+    calls = []
+    
+    def send(body, timeout, stream):
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    client._send = send
+    return client, calls
+
+def test_breaker_opens_after_threshold_and_recovers_through_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    ticket = breaker.allow()
+    assert ticket == CircuitBreaker.PROBE
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 半开状态只放行一个探测请求
+    assert breaker.allow() is False
+    breaker.record_success()
+    breaker.release(ticket)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() is True
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    assert breaker.allow() is False
+    breaker.opened_at -= 61
+    ticket = breaker.allow()
+    assert ticket == CircuitBreaker.PROBE
+    breaker.record_failure()
+    breaker.release(ticket)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+def test_rate_limited_probe_does_not_jam_half_open():
+    client, _ = make_client([
+        requests.exceptions.Timeout(), requests.exceptions.Timeout(),
+        UpstreamError(429), FakeResponse()
+    ])
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.Timeout):
+            client.post({})
+    assert client.breaker.state == CircuitBreaker.OPEN
+    
+    # 探测请求被限流：视为失败，重新打开
+    with pytest.raises(UpstreamError):
+        client.post({})
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert client.breaker._probing is False
+    
+    # 冷却后下一个探测请求成功，熔断器关闭
+    assert isinstance(client.post({}), FakeResponse)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError(), requests.exceptions.InvalidURL()])
+def test_other_request_errors_count_as_failures(error):
+    client, _ = make_client([error, error, FakeResponse()])
+    for _ in range(2):
+        with pytest.raises(type(error)):
+            client.post({})
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert isinstance(client.post({}), FakeResponse)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_unexpected_exception_releases_probe():
+    client, _ = make_client([requests.exceptions.Timeout(), requests.exceptions.Timeout(), ValueError("bad"),
+                             FakeResponse()])
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.Timeout):
+            client.post({})
+    with pytest.raises(ValueError):
+        client.post({})
+    # 探测名额已释放，之后的请求仍能探测
+    assert isinstance(client.post({}), FakeResponse)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_open_breaker_fails_fast():
+    client, calls = make_client([requests.exceptions.Timeout()], threshold=1)
+    client.breaker.reset_timeout = 60.0
+    with pytest.raises(requests.exceptions.Timeout):
+        client.post({})
+    with pytest.raises(CircuitOpen):
+        client.post({})
+    assert len(calls) == 1
+
+def test_backoff_respects_retry_after_and_cap():
+    client = LLMClient("http://upstream.invalid", "key", backoff_base_s=0.5, backoff_max_s=2.0)
+    for attempt in range(6):
+        assert 0 <= client._backoff(attempt) <= 2.0
+    assert client._backoff(0, retry_after=3.0) >= 3.0
+
+def test_non_retryable_status_is_not_retried():
+    client, calls = make_client([UpstreamError(400), FakeResponse()])
+    client.max_attempts = 3
+    with pytest.raises(UpstreamError):
+        client.post({})
+    assert len(calls) == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,58 @@
+import datetime
+import gzip
+import json
+import os
+import threading
+from log_handler import LogHandler
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_written_in_background(tmp_path):
+    handler = LogHandler(str(tmp_path), flush_interval=0.05)
+    assert handler.log_chat("如何提交出差申请", {"type": "info", "message": "登录费控商旅"},
+                            [{"chunk_id": 3, "metadata": {"source": "a.docx"}, "similarity_score": 0.9}])
+    handler.close()
+    [record] = read_lines(handler.get_log_path())
+    assert record["answer_type"] == "info" and record["chunks"][0]["chunk_id"] == 3
+    assert handler.get_stats() == {"queued": 0, "written": 1, "dropped": 0}
+
+
+def test_per_process_file_name(tmp_path):
+    handler = LogHandler(str(tmp_path), per_process=True)
+    handler.close()
+    assert handler.get_log_path().endswith(f"-{os.getpid()}.jsonl")
+
+
+def test_dropped_count_is_exact_under_contention(tmp_path):
+    handler = LogHandler(str(tmp_path), max_queue_size=1)
+    # 写入线程停止后队列很快就满，之后的记录全部丢弃
+    handler._queue.put(None)
+    handler._writer.join()
+    handler.log_chat("q", "a", [])
+    threads = [threading.Thread(target=lambda: [handler.log_chat("q", "a", []) for _ in range(1000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handler.get_stats()["dropped"] == 8000
+
+
+def test_rotation_compresses_previous_day(tmp_path):
+    handler = LogHandler(str(tmp_path), per_process=True)
+    # 先停止写入线程，由测试直接调用轮转
+    handler.close()
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    handler.log_date = yesterday
+    handler.log_file = handler._log_file_for(yesterday)
+    with open(handler.log_file, "w", encoding="utf-8") as f:
+        f.write('{"query": "q"}\n')
+    handler.rotate_log()
+    assert not os.path.exists(handler._log_file_for(yesterday))
+    with gzip.open(handler._log_file_for(yesterday) + ".gz", "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline()) == {"query": "q"}
+    assert handler.log_date == datetime.date.today()
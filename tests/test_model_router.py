@@ -0,0 +1,35 @@
+from model_router import ModelRouter, ModelRoute, query_overlap
+
+TRAVEL = {"page_content": "出差申请：登录费控商旅，点击新建出差申请，填写行程后提交审批。",
+          "similarity_score": 0.91, "keyword_score": 3.0, "mandatory_score": 1.0}
+INVOICE = {"page_content": "发票导入：在票据夹中选择电子发票，点击导入。", "similarity_score": 0.89}
+
+
+def make_router():
+    routes = {name: ModelRoute(name, name, client=None) for name in (ModelRouter.LARGE, ModelRouter.FAST)}
+    return ModelRouter(routes, min_confidence=0.6, max_query_chars=40, max_depth=2)
+
+
+def test_on_topic_query_goes_to_fast_route():
+    assert make_router().choose(8, [TRAVEL, INVOICE], query="如何提交出差申请") == (ModelRouter.FAST, "simple")
+
+
+def test_low_relevance_query_goes_to_large_route():
+    # 排名第一的文档块被三路检索同时命中、向量相似度也很高，但与问题无关
+    route, reason = make_router().choose(7, [TRAVEL, INVOICE], query="今天天气怎么样")
+    assert (route, reason) == (ModelRouter.LARGE, "low_confidence")
+
+
+def test_confidence_uses_top_vector_hit():
+    keyword_only = {"page_content": "出差申请的审批流程", "keyword_score": 5.0, "mandatory_score": 1.0}
+    docs = [keyword_only, INVOICE]
+    assert ModelRouter.retrieval_confidence("发票怎么导入", docs) == query_overlap("发票怎么导入", INVOICE["page_content"])
+    assert ModelRouter.retrieval_confidence("出差申请", docs) == 0.0
+    assert ModelRouter.retrieval_confidence("出差申请", [keyword_only]) == 1.0
+    assert ModelRouter.retrieval_confidence("出差申请", []) == 0.0
+
+
+def test_long_or_deep_queries_go_to_large_route():
+    router = make_router()
+    assert router.choose(41, [TRAVEL], query="如何提交出差申请")[1] == "long_query"
+    assert router.choose(8, [TRAVEL], depth=3, query="如何提交出差申请")[1] == "deep_conversation"
@@ -0,0 +1,62 @@
+import os
+import parsers
+from chunker import Block, HEADING, LIST_ITEM, PARAGRAPH
+from parsers import Parser, ParserRegistry, ParseCache, parse_file, parse_file_safe
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_registry_lookup_by_extension_and_mime():
+    registry = ParserRegistry()
+    text = registry.register(Parser("text", lambda path, ext: [], (".txt",), ("text/plain",)))
+    missing = registry.register(Parser("pdf", lambda path, ext: [], (".pdf",), requires="no_such_package_xyz"))
+    assert registry.for_path("/data/说明.TXT") is text
+    # 扩展名未注册时按MIME类型查找
+    assert registry.for_path("/data/readme.text") is text
+    assert registry.for_path("/data/a.pdf") is missing and not missing.available
+    assert registry.for_path("/data/a.unknown-ext") is None
+    assert registry.extensions() == [".txt"]
+
+
+def test_default_parsers(tmp_path):
+    blocks = parse_file(write(tmp_path / "a.md", "# 出差\n\n1. 登录\n2. 提交\n\n正文段落。"))
+    assert [block.kind for block in blocks] == [HEADING, LIST_ITEM, LIST_ITEM, PARAGRAPH]
+    blocks = parse_file(write(tmp_path / "a.html", "<h1>标题</h1><p>段落</p><script>var x;</script>"))
+    assert blocks == [Block(HEADING, "标题", 1), Block(PARAGRAPH, "段落", 0)]
+    assert parse_file(write(tmp_path / "a.unknown-ext", "x")) is None
+
+
+def test_parse_file_safe_reports_errors(tmp_path):
+    blocks, error = parse_file_safe(str(tmp_path / "missing.txt"))
+    assert blocks is None and error.startswith("FileNotFoundError")
+
+
+def test_parse_cache_hit_miss_and_prune(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    blocks = [Block(HEADING, "出差", 1), Block(PARAGRAPH, "正文", 0)]
+    key = ParseCache.key("abc123", "text")
+    assert key.endswith(f"-v{parsers.PARSER_VERSION}")
+    assert cache.get(key) is None
+    cache.put(key, blocks)
+    stale = ParseCache.key("def456", "text")
+    cache.put(stale, blocks)
+    
+    # 新一轮加载只用到 key，stale 对应的文件已修改
+    cache = ParseCache(str(tmp_path / "cache"))
+    assert cache.get(key) == blocks
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert cache.prune() == 1
+    assert cache.get(stale) is None
+    assert ParseCache(str(tmp_path / "cache")).get(key) == blocks
+
+
+def test_parse_cache_corrupt_entry_is_a_miss(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    key = ParseCache.key("abc123", "text")
+    os.makedirs(os.path.dirname(cache._path(key)))
+    write(cache._path(key), "{not json")
+    assert cache.get(key) is None and cache.misses == 1
@@ -0,0 +1,92 @@
+import time
+import pytest
+import requests
+from agent_core import AgentCore
+from llm_client import LLMClient
+from model_router import ModelRouter, ModelRoute
+from rag_core import RAGCore
+from session_manager import SessionManager
+
+DOCS = [{"page_content": "出差申请：登录费控商旅，点击新建出差申请，填写行程后提交审批。", "metadata": {},
+         "similarity_score": 0.9}]
+
+
+class FakeLoader:
+    segmenter = None
+    vector_store = None
+    documents = []
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+    
+    def json(self):
+        return {"choices": [{"message": {"content": self.content}}], "usage": {}}
+
+
+class RecordingClient(LLMClient):
+    """记录每次调用收到的截止时间，不发送网络请求"""
+    
+    def __init__(self, deadline_s=30.0):
+        super().__init__("http://127.0.0.1:9/", "key", deadline_s=deadline_s)
+        self.deadlines = []
+    
+    def post(self, data, stream=False, deadline=None):
+        self.deadlines.append(deadline)
+        return FakeResponse("请在费控商旅中提交出差申请。")
+
+
+def make_core(client, router=None):
+    core = RAGCore(FakeLoader(), "key", llm_client=client, router=router, extractive=False)
+    core.retrieve_relevant_docs = lambda query, top_k=8: [dict(doc) for doc in DOCS]
+    core._finish_answer = lambda query, answer, relevant_docs: answer
+    return core
+
+
+def test_request_deadline_reaches_llm_client():
+    client = RecordingClient()
+    agent = AgentCore(make_core(client), "key", session_manager=SessionManager(start_cleanup_thread=False))
+    deadline = time.monotonic() + 12.5
+    agent.process_query("如何提交出差申请", deadline=deadline)
+    list(agent.process_query_stream("如何提交出差申请", deadline=deadline))
+    assert client.deadlines[0] == deadline
+    assert all(value == deadline for value in client.deadlines)
+
+
+def test_deadline_defaults_to_one_budget_per_request():
+    client = RecordingClient(deadline_s=7.0)
+    start = time.monotonic()
+    make_core(client).process_query("如何提交出差申请")
+    [deadline] = client.deadlines
+    assert deadline == pytest.approx(start + 7.0, abs=0.5)
+
+
+class HangingClient(LLMClient):
+    """每次尝试都等到超时"""
+    
+    def _send(self, body, timeout, stream):
+        time.sleep(timeout)
+        raise requests.exceptions.ReadTimeout("read timed out")
+
+
+def test_escalation_shares_one_deadline():
+    routes = {}
+    for name in (ModelRouter.FAST, ModelRouter.LARGE):
+        client = HangingClient("http://127.0.0.1:9/", "key", deadline_s=1.0, attempt_timeout_s=0.4,
+                               max_attempts=3, backoff_base_s=0.01, backoff_max_s=0.01, breaker_threshold=100,
+                               name=name)
+        routes[name] = ModelRoute(name, name, client)
+    router = ModelRouter(routes, min_confidence=0.0)
+    core = make_core(routes[ModelRouter.LARGE].client, router=router)
+    
+    start = time.monotonic()
+    answer, _ = core.process_query("如何提交出差申请")
+    elapsed = time.monotonic() - start
+    # 小模型超时后升级到大模型，两者合计不超过一个 llm_deadline_s
+    assert elapsed < 1.4
+    assert answer["type"] in ("error", "extractive")
+    
+    start = time.monotonic()
+    assert "".join(core.generate_answer_stream("如何提交出差申请", [dict(doc) for doc in DOCS]))
+    assert time.monotonic() - start < 1.4
@@ -0,0 +1,43 @@
+import threading
+from segmenter import Segmenter
+
+
+def make_segmenter(tmp_path):
+    return Segmenter(keyword_file=str(tmp_path / "missing.json"), extra_terms=())
+
+
+def test_added_word_is_not_served_from_stale_cache(tmp_path):
+    segmenter = make_segmenter(tmp_path)
+    assert "云闪付卡" not in segmenter.cut("绑定云闪付卡的步骤")
+    assert segmenter.add_word("云闪付卡")
+    assert not segmenter.add_word("云闪付卡")
+    assert "云闪付卡" in segmenter.cut("绑定云闪付卡的步骤")
+
+
+def test_add_word_while_cutting(tmp_path):
+    segmenter = make_segmenter(tmp_path)
+    words = [f"测试新词{i}号" for i in range(200)]
+    errors = []
+    stop = threading.Event()
+    
+    def cut_loop():
+        try:
+            while not stop.is_set():
+                for word in words[::20]:
+                    segmenter.cut_uncached(f"请问{word}怎么办")
+                    segmenter.cut(f"请问{word}怎么办")
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=cut_loop) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for word in words:
+        segmenter.add_word(word)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    for word in words[::20]:
+        assert word in segmenter.cut(f"请问{word}怎么办")
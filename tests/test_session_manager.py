@@ -0,0 +1,46 @@
+import time
+from session_manager import SessionManager, SharedSessionManager
+
+
+def test_memory_sessions_keep_recent_history():
+    manager = SessionManager(max_history=3, start_cleanup_thread=False)
+    session_id = manager.create_session()
+    for i in range(5):
+        assert manager.add_message(session_id, "user", f"问题{i}")
+    assert [m["content"] for m in manager.get_history(session_id)] == ["问题2", "问题3", "问题4"]
+    assert manager.add_message("missing", "user", "x") is False
+
+
+def test_shared_sessions_visible_across_instances(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    # 两个实例模拟两个工作进程
+    first = SharedSessionManager(db_path, max_history=3, start_cleanup_thread=False)
+    second = SharedSessionManager(db_path, max_history=3, start_cleanup_thread=False)
+    session_id = first.create_session()
+    first.add_message(session_id, "user", "如何提交出差申请")
+    second.add_message(session_id, "assistant", "在费控系统中新建申请单")
+    for i in range(3):
+        second.add_message(session_id, "user", f"追问{i}")
+    
+    history = first.get_history(session_id)
+    assert [m["content"] for m in history] == ["追问0", "追问1", "追问2"]
+    assert second.get_session(session_id).history[-1]["role"] == "user"
+    assert first.get_session_count() == 1
+    
+    assert second.delete_session(session_id)
+    assert first.get_history(session_id) == []
+    assert first.get_session_count() == 0
+
+
+def test_shared_sessions_expire(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    manager = SharedSessionManager(db_path, session_timeout=1, start_cleanup_thread=False)
+    expired = manager.create_session()
+    manager._connect().execute("UPDATE sessions SET last_accessed = ? WHERE id = ?", (time.time() - 10, expired))
+    manager._connect().commit()
+    active = manager.create_session()
+    
+    assert manager.get_session_count() == 1
+    assert manager.add_message(expired, "user", "x") is False
+    assert manager.cleanup_expired_sessions() == 0
+    assert manager.get_session(active) is not None
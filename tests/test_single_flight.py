@@ -0,0 +1,65 @@
+import time
+import threading
+import pytest
+from llm_client import DeadlineExceeded
+from single_flight import SingleFlight
+
+
+def start_leader(flight, release, results, stream=False):
+    def slow():
+        release.wait(5)
+        return "answer"
+    
+    def slow_stream():
+        release.wait(5)
+        yield "ans"
+        yield "wer"
+    
+    def run():
+        if stream:
+            results.append("".join(flight.stream("key", slow_stream)))
+        else:
+            results.append(flight.do("key", slow))
+    
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not flight.in_flight():
+        time.sleep(0.01)
+    return thread
+
+
+def test_follower_shares_leader_result():
+    flight, release, results = SingleFlight(), threading.Event(), []
+    leader = start_leader(flight, release, results)
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", lambda: "other")))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ["answer", "answer"]
+
+
+def test_follower_honours_own_deadline():
+    flight, release, results = SingleFlight(), threading.Event(), []
+    leader = start_leader(flight, release, results)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        flight.do("key", lambda: "other", deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - start < 1.0
+    # 领头请求不受等待者超时影响
+    release.set()
+    leader.join()
+    assert results == ["answer"]
+
+
+def test_stream_subscriber_honours_own_deadline():
+    flight, release, results = SingleFlight(), threading.Event(), []
+    leader = start_leader(flight, release, results, stream=True)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        "".join(flight.stream("key", lambda: iter(()), deadline=time.monotonic() + 0.2))
+    assert time.monotonic() - start < 1.0
+    release.set()
+    leader.join()
+    assert results == ["answer"]
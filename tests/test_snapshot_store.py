@@ -0,0 +1,47 @@
+import os
+from snapshot_store import SnapshotStore
+
+
+def publish(store, marker):
+    tmp_dir = store.begin()
+    with open(os.path.join(tmp_dir, "data.txt"), "w", encoding="utf-8") as f:
+        f.write(marker)
+    return store.publish(tmp_dir, {"marker": marker})
+
+
+def test_publish_updates_current_and_prunes(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep_generations=2)
+    assert store.current_generation() is None
+    assert [publish(store, f"v{i}") for i in range(1, 5)] == [1, 2, 3, 4]
+    assert store.current_generation() == 4
+    assert store.read_manifest(4) == {"marker": "v4", "generation": 4}
+    # 只保留最近两个版本，临时目录已重命名
+    assert sorted(os.listdir(tmp_path)) == ["CURRENT", "gen-000003", "gen-000004"]
+
+
+def test_other_instances_see_new_generation(tmp_path):
+    writer = SnapshotStore(str(tmp_path))
+    reader = SnapshotStore(str(tmp_path))
+    publish(writer, "v1")
+    assert reader.current_generation() == 1
+    publish(writer, "v2")
+    assert reader.current_generation() == 2
+    with open(os.path.join(reader.generation_dir(2), "data.txt"), encoding="utf-8") as f:
+        assert f.read() == "v2"
+
+
+def test_discard_removes_unpublished_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    tmp_dir = store.begin()
+    store.discard(tmp_dir)
+    assert not os.path.exists(tmp_dir) and store.current_generation() is None
+
+
+def test_builder_lock_is_exclusive(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first, second = store.builder_lock(), store.builder_lock()
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
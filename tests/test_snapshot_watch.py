@@ -0,0 +1,50 @@
+import threading
+from event_hub import EventHub
+from web_server import WebServer
+
+
+class FakeLoader:
+    def __init__(self):
+        self.generation = 1
+        self.documents = []
+        self.refreshes = 0
+        self.checks = 0
+    
+    def refresh_if_stale(self):
+        self.refreshes += 1
+        self.generation = 2
+        return True
+    
+    def check_for_changes(self):
+        self.checks += 1
+        return True
+
+
+class FakeExecutor:
+    def __init__(self, done):
+        self.done = done
+    
+    def submit(self, fn):
+        self.done.set()
+
+
+def test_watcher_refreshes_snapshot_and_triggers_rebuild():
+    server = WebServer.__new__(WebServer)
+    server.config = {"snapshot_poll_s": 0.01, "data_check_interval_s": 0.01}
+    server.data_loader = FakeLoader()
+    server.events = EventHub()
+    server.rebuilding = False
+    server._published_generation = None
+    server._stop_watch = threading.Event()
+    submitted = threading.Event()
+    server.executor = FakeExecutor(submitted)
+    
+    thread = threading.Thread(target=server._watch_snapshots, daemon=True)
+    thread.start()
+    assert submitted.wait(2)
+    server._stop_watch.set()
+    thread.join(2)
+    
+    assert not thread.is_alive()
+    assert server.data_loader.refreshes >= 1
+    assert server._published_generation == 2
@@ -1,164 +1,565 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+import time
+# 模块导入的开始时间，用于统计启动耗时
+_IMPORT_STARTED = time.perf_counter()
+_IMPORT_STARTED_WALL = time.time()
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Body, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse, JSONResponse
 import uvicorn
 import os
+import asyncio
 import shutil
+import logging
 import threading
-import numpy as np
+import json
+import math
+from typing import List
+from contextlib import closing
 from concurrent.futures import ThreadPoolExecutor
 from data_loader import DataLoader
 from rag_core import RAGCore
 from log_handler import LogHandler
 from agent_core import AgentCore
+from session_manager import SessionManager, SharedSessionManager
+from admission import Admission, Overloaded, client_address, parse_trusted_proxies
+from event_hub import EventHub
+from static_assets import StaticAssets
+from fast_json import dumps, json_response
+from llm_client import LLMClient
+from model_router import ModelRouter
+from extractive import ExtractiveAnswerer
+from config import load_config, ensure_dirs
+from metrics import registry, request_trace
+from logging_setup import configure_logging, get_logger, log_sampled, log_rate_limited
+
+logger = get_logger("web_server")
+# jieba、faiss、psutil 等较慢的依赖推迟到预热线程或第一次使用时导入
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """流式响应结束时必定调用 on_close，包括客户端断开和响应从未开始发送的情况"""
+    
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
 
 class WebServer:
+    @staticmethod
+    def _create_session_manager(config):
+        """按 session_store 配置创建会话管理器
+        
+        memory 为进程内存储；sqlite 存放在向量库目录下，所有工作进程共享；
+        auto 在多进程部署时使用 sqlite，否则使用内存。多进程时请求可能落在任意进程上，
+        使用进程内存储会丢失多轮对话的上下文，因此这种组合直接拒绝启动。
+        """
+        store = config.get("session_store", "auto")
+        workers = config.get("workers", 1)
+        if store == "auto":
+            store = "sqlite" if workers > 1 else "memory"
+        if store == "memory":
+            if workers > 1:
+                raise ValueError("多进程部署（workers>1）时会话必须使用共享存储，请设置 session_store=sqlite")
+            return SessionManager()
+        if store == "sqlite":
+            db_path = config.get("session_db_path") or os.path.join(
+                os.path.dirname(config["vector_db_path"]), "sessions.db")
+            return SharedSessionManager(db_path)
+        raise ValueError(f"未知的会话存储: {store}")
+    
     def __init__(self, config):
+        init_started = time.perf_counter()
         self.config = config
         self.app = FastAPI(title="RAG客户问答系统", description="基于豆包LLM的智能问答系统")
         
         # 初始化核心模块
-        self.data_loader = DataLoader(config["data_dir"], config["vector_db_path"])
-        self.rag_core = RAGCore(self.data_loader, config["doubao_api_key"])
-        self.agent_core = AgentCore(self.rag_core, config["doubao_api_key"])
-        self.log_handler = LogHandler(config["log_dir"])
+        self.data_loader = DataLoader(config["data_dir"], config["vector_db_path"],
+                                      index_type=config.get("index_type", "auto"),
+                                      target_recall=config.get("index_target_recall", 0.95),
+                                      search_latency_budget_ms=config.get("index_latency_budget_ms", 2.0),
+                                      compression=config.get("index_compression"),
+                                      rerank_top_n=config.get("index_rerank_top_n", 0),
+                                      tuning_queries=config.get("index_tuning_queries"),
+                                      dedupe_threshold=config.get("dedupe_threshold", 0.95),
+                                      parse_cache=config.get("parse_cache", True),
+                                      parse_workers=config.get("parse_workers", 0))
+        self.llm_client = LLMClient.from_config(config, config.get("doubao_api_url") or RAGCore.DEFAULT_API_URL,
+                                                config["doubao_api_key"])
+        # 模型路由：大模型路由复用上面的客户端，小模型路由使用独立的客户端和熔断器
+        self.router = ModelRouter.from_config(config, self.llm_client)
+        self.rag_core = RAGCore(self.data_loader, config["doubao_api_key"],
+                                api_url=config.get("doubao_api_url"), model=config.get("doubao_model"),
+                                fusion_method=config.get("fusion_method", "rrf"),
+                                fusion_weights=config.get("fusion_weights"),
+                                rrf_k=config.get("rrf_k", 60),
+                                batch_window_ms=config.get("retrieval_batch_window_ms", 0.0),
+                                batch_max_size=config.get("retrieval_batch_max_size", 32),
+                                llm_client=self.llm_client, router=self.router,
+                                extractive=ExtractiveAnswerer(
+                                    min_confidence=config.get("extractive_min_confidence", 0.8),
+                                    min_overlap=config.get("extractive_min_overlap", 0.6),
+                                    min_steps=config.get("extractive_min_steps", 2),
+                                    max_depth=config.get("extractive_max_depth", 0)
+                                ) if config.get("extractive_answers", True) else False)
+        self.agent_core = AgentCore(self.rag_core, config["doubao_api_key"],
+                                    session_manager=self._create_session_manager(config))
+        self.log_handler = LogHandler(config["log_dir"], per_process=config.get("workers", 1) > 1)
+        # 准入控制：进程内并发上限、有界等待队列和按会话/IP的令牌桶
+        # 令牌桶在各工作进程内独立计数，配置值是整个服务的限额，按进程数平分
+        workers = max(1, config.get("workers", 1))
+        self.admission = Admission(
+            max_concurrent=config.get("max_concurrent_requests", 32),
+            max_queue=config.get("max_queued_requests", 64),
+            queue_timeout=config.get("queue_timeout_s", 5.0),
+            ip_rate=config.get("rate_limit_ip_rps", 0.0) / workers,
+            ip_burst=max(1, math.ceil(config.get("rate_limit_ip_burst", 1) / workers)),
+            session_rate=config.get("rate_limit_session_rps", 0.0) / workers,
+            session_burst=max(1, math.ceil(config.get("rate_limit_session_burst", 1) / workers))
+        )
+        self.trusted_proxies = parse_trusted_proxies(config.get("trusted_proxies"))
         
         # 初始化线程池
         self.executor = ThreadPoolExecutor(max_workers=2)
         self.rebuilding = False
         
-        # 加载向量库
-        if not self.data_loader.load_vector_store():
-            # 在后台线程中重建向量库
-            self.executor.submit(self._rebuild_vector_store_background)
+        # WebSocket推送：快照版本切换和重建进度广播到所有连接
+        self.events = EventHub()
+        self.rebuild_progress = None
+        self._published_generation = None
+        self._stop_watch = threading.Event()
+        
+        # 启动各阶段耗时（毫秒）；预热完成前 /readyz 返回503
+        self.startup = {}
+        self.warmed = threading.Event()
+        self._record_startup("imports", _IMPORT_SECONDS)
         
         # 注册路由
         self._register_routes()
         
-        # 挂载静态文件
-        if os.path.exists("static"):
-            self.app.mount("/static", StaticFiles(directory="static"), name="static")
+        # 静态文件读入内存并预压缩
+        self.static_assets = StaticAssets("static") if os.path.exists("static") else None
+        self._record_startup("init", time.perf_counter() - init_started)
+        
+        # 加载向量库和预热放到后台线程，服务先开始监听，/healthz 立即可用
+        threading.Thread(target=self._warmup, name="warmup", daemon=True).start()
+    
+    def _record_startup(self, phase, seconds):
+        self.startup[phase] = round(seconds * 1000, 1)
+        registry.set_gauge("rag_startup_phase_seconds", seconds, "启动各阶段耗时（秒）", phase=phase)
+    
+    def _warmup(self):
+        """后台预热：加载向量库（没有时重建），构建分词词典，预读文档块并执行一次检索"""
+        try:
+            import psutil
+            # 解释器启动到开始导入本模块的耗时
+            self._record_startup("interpreter", max(0.0, _IMPORT_STARTED_WALL - psutil.Process().create_time()))
+            
+            start = time.perf_counter()
+            loaded = self.data_loader.load_vector_store()
+            self._record_startup("load_index", time.perf_counter() - start)
+            if not loaded:
+                start = time.perf_counter()
+                self._rebuild_vector_store_background()
+                self._record_startup("rebuild_index", time.perf_counter() - start)
+            
+            for phase, elapsed_ms in self.rag_core.warmup(self.config.get("warmup_query", "如何提交出差申请")).items():
+                self._record_startup(f"warmup_{phase}", elapsed_ms / 1000)
+            self._record_startup("total", time.time() - psutil.Process().create_time())
+        except Exception as e:
+            logger.exception("启动预热失败: %s", e)
+        finally:
+            self.warmed.set()
+        logger.info("启动预热完成，向量库%s，各阶段耗时(ms): %s",
+                    "已加载" if self.data_loader.vector_store else "未加载", self.startup)
+        # 预热完成后才有文件记录，此时开始后台检查快照和资料变化
+        threading.Thread(target=self._watch_snapshots, name="snapshot-watch", daemon=True).start()
+    
+    def _readiness(self):
+        """是否可以接收流量：预热完成且向量库已加载，返回 (是否就绪, 原因)"""
+        if not self.warmed.is_set():
+            return False, "warming_up"
+        if not self.data_loader.vector_store:
+            return False, "rebuilding" if self.rebuilding else "index_not_loaded"
+        return True, "ready"
     
     def _rebuild_vector_store_background(self):
         """在后台线程中重建向量库"""
         if self.rebuilding:
-            print("向量库重建已在进行中，跳过")
+            logger.info("向量库重建已在进行中，跳过")
             return
         
-        print("开始后台重建向量库...")
+        logger.info("开始后台重建向量库...")
         self.rebuilding = True
         try:
-            self.data_loader.rebuild_vector_store()
-            print("后台向量库重建完成")
+            # 多进程部署时只有获得重建锁的进程会真正执行重建
+            if self.data_loader.rebuild_vector_store(progress=self._publish_rebuild):
+                logger.info("后台向量库重建完成")
+                self._publish_rebuild("done")
         except Exception as e:
-            print(f"后台向量库重建失败: {str(e)}")
+            logger.exception("后台向量库重建失败: %s", e)
+            self._publish_rebuild("failed")
         finally:
             self.rebuilding = False
+            self.rebuild_progress = None
+            self._publish_generation()
+    
+    def _publish_rebuild(self, stage, step=None, total=None):
+        """推送重建进度：各阶段开始时，以及完成（done）或失败（failed）时"""
+        self.rebuild_progress = {"type": "rebuild", "stage": stage, "step": step, "total": total}
+        self.events.publish(self.rebuild_progress)
+    
+    def _publish_generation(self):
+        """当前加载的快照版本变化时推送给所有连接"""
+        generation = self.data_loader.generation
+        if generation != self._published_generation:
+            self._published_generation = generation
+            self.events.publish({"type": "generation", "generation": generation,
+                                 "document_count": len(self.data_loader.documents)})
+    
+    def _watch_snapshots(self):
+        """后台线程：定期切换到其他进程发布的新快照并推送版本变化，间隔较长地检查资料目录，有变化时重建
+        
+        加载快照和遍历资料目录都是阻塞操作，放在这里执行，请求处理只读取当前已加载的状态。
+        """
+        poll_interval = self.config.get("snapshot_poll_s", 2.0)
+        check_interval = self.config.get("data_check_interval_s", 10.0)
+        last_check = time.monotonic()
+        while not self._stop_watch.wait(poll_interval):
+            try:
+                self.data_loader.refresh_if_stale()
+                self._publish_generation()
+                if check_interval and time.monotonic() - last_check >= check_interval:
+                    last_check = time.monotonic()
+                    if not self.rebuilding and self.data_loader.check_for_changes():
+                        self.executor.submit(self._rebuild_vector_store_background)
+            except Exception as e:
+                log_rate_limited(logger, logging.WARNING, "web_server.watch", "检查快照和资料变化失败: %s", e)
+    
+    def _status_event(self):
+        """连接建立时推送的系统状态，字段与 /api/status 一致"""
+        return {
+            "type": "status",
+            "vector_store_status": "loaded" if self.data_loader.vector_store else "not loaded",
+            "document_count": len(self.data_loader.documents),
+            "data_dir": self.config["data_dir"],
+            "rebuilding": self.rebuilding,
+            "rebuild": self.rebuild_progress,
+            "ready": self._readiness()[0],
+            "generation": self.data_loader.generation
+        }
+    
+    async def _ws_send_loop(self, websocket, outbox):
+        """把连接的事件队列写到WebSocket；空闲超过心跳间隔时发送ping"""
+        heartbeat = self.config.get("ws_heartbeat_s", 25.0)
+        while True:
+            try:
+                event = await asyncio.wait_for(outbox.get(), heartbeat)
+            except asyncio.TimeoutError:
+                event = {"type": "ping"}
+            await websocket.send_text(dumps(event).decode("utf-8"))
+    
+    async def _ws_query(self, client_ip, message, session, outbox, lock):
+        """处理WebSocket连接上的一个问题：推送会话、检索片段、回答分块，最后推送完整回答"""
+        query_id = message.get("id")
+        text = str(message.get("text") or "").strip()
+        if not text:
+            await outbox.put({"type": "error", "id": query_id, "detail": "text 不能为空"})
+            return
+        
+        # 同一连接上的问题按顺序处理，保证会话历史的顺序
+        async with lock:
+            # 截止时间从轮到该问题时开始计算，准入排队、检索和所有大模型调用共用
+            deadline = self.rag_core.request_deadline()
+            session_id = message.get("session_id") or session["id"]
+            try:
+                async with self.admission.admit(client_ip, session_id):
+                    log_sampled(logger, logging.INFO, "接收到WebSocket查询: %.100s, session_id: %s", text, session_id)
+                    
+                    result = None
+                    with request_trace() as timings:
+                        start_time = time.perf_counter()
+                        # 同步生成器放到线程池中迭代，不阻塞事件循环
+                        async for kind, payload in iterate_in_threadpool(
+                                self.agent_core.process_query_stream(text, session_id, deadline)):
+                            if kind == "session":
+                                session["id"] = payload
+                                event = {"type": "session", "session_id": payload}
+                            elif kind == "sources":
+                                event = {"type": "sources", "id": query_id, "sources": self._format_sources(payload)}
+                            elif kind == "token":
+                                event = {"type": "token", "id": query_id, "text": payload}
+                            else:
+                                result = payload
+                                continue
+                            # 回答分块不丢弃，客户端读得慢时在这里等待
+                            await outbox.put(event)
+                        timings["total"] = round((time.perf_counter() - start_time) * 1000, 3)
+                    registry.observe("rag_request_duration_seconds", timings["total"] / 1000,
+                                     "查询请求总耗时（秒）", endpoint="/ws/chat")
+                    self.log_handler.log_chat(text, result["answer"], result["relevant_docs"],
+                                              session_id=result["session_id"], latencies=timings)
+                    await outbox.put({
+                        "type": "done",
+                        "id": query_id,
+                        "answer": result["answer"],
+                        "session_id": result["session_id"],
+                        "rebuilding": self.rebuilding,
+                        "timings": timings
+                    })
+            except Overloaded as exc:
+                log_sampled(logger, logging.WARNING, "WebSocket查询被拒绝: %s", exc.reason)
+                await outbox.put({"type": "error", "id": query_id, "detail": "服务繁忙，请稍后再试",
+                                  "reason": exc.reason, "retry_after": exc.retry_after})
+            except Exception as e:
+                logger.exception("WebSocket查询处理失败: %s", e)
+                await outbox.put({"type": "error", "id": query_id, "detail": str(e)})
+    
+    @staticmethod
+    def _format_sources(relevant_docs):
+        """准备检索片段：直接引用文档块的文本和来源，不复制"""
+        sources = []
+        for doc in relevant_docs:
+            metadata = doc["metadata"]
+            source_item = {
+                "source": metadata["source"],
+                "content": doc["page_content"],
+                "distance": "N/A"
+            }
+            # 合并过的重复文档块附带全部来源文件
+            if len(metadata.get("sources") or ()) > 1:
+                source_item["sources"] = metadata["sources"]
+            sources.append(source_item)
+        return sources
+    
+    def _json(self, request, content):
+        """API响应：用orjson直接序列化（不经过 jsonable_encoder），较大的响应体gzip压缩"""
+        return json_response(request, content, min_size=self.config.get("json_gzip_min_bytes"),
+                             level=self.config.get("json_gzip_level"))
+    
+    def _client_ip(self, connection):
+        """按IP限流使用的客户端地址；部署在反向代理之后时需要配置 trusted_proxies，否则所有请求共用代理的地址"""
+        peer = connection.client.host if connection.client else None
+        return client_address(peer, connection.headers.get("x-forwarded-for"), self.trusted_proxies)
+    
+    async def _admit(self, request: Request, session_id: str = Form(None)):
+        """路由依赖：请求在准入名额内执行，超限时抛出 Overloaded"""
+        async with self.admission.admit(self._client_ip(request), session_id):
+            yield
     
     def _register_routes(self):
-        @self.app.get("/", response_class=HTMLResponse)
-        async def read_root():
-            with open("static/index.html", "r", encoding="utf-8") as f:
-                return f.read()
+        @self.app.exception_handler(Overloaded)
+        async def overloaded(request: Request, exc: Overloaded):
+            log_sampled(logger, logging.WARNING, "请求被拒绝: %s, 路径: %s", exc.reason, request.url.path)
+            return JSONResponse({"detail": "服务繁忙，请稍后再试", "reason": exc.reason},
+                                status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)})
+        
+        @self.app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+        async def read_root(request: Request):
+            response = self.static_assets.response("index.html", request) if self.static_assets else None
+            if response is None:
+                raise HTTPException(status_code=404, detail="Not Found")
+            return response
         
-        @self.app.post("/api/query")
-        async def query(text: str = Form(...), session_id: str = Form(None)):
+        @self.app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+        async def static_file(path: str, request: Request, v: str = None):
+            """静态文件：内存中的预压缩版本，URL带当前版本号时长期缓存"""
+            response = self.static_assets.response(path, request, version=v) if self.static_assets else None
+            if response is None:
+                raise HTTPException(status_code=404, detail="Not Found")
+            return response
+        
+        @self.app.post("/api/query", dependencies=[Depends(self._admit)])
+        async def query(request: Request, text: str = Form(...), session_id: str = Form(None)):
+            # 截止时间从收到请求时开始计算，检索和所有大模型调用（包括路由升级和重试）共用
+            deadline = self.rag_core.request_deadline()
             try:
-                # 调试信息
-                print(f"接收到查询请求: {text}, session_id: {session_id}")
+                # 调试信息（抽样输出）
+                log_sampled(logger, logging.INFO, "接收到查询请求: %.100s, session_id: %s", text, session_id)
                 
-                # 检查资料更新
-                if self.data_loader.check_for_changes():
-                    # 在后台线程中重建向量库
-                    self.executor.submit(self._rebuild_vector_store_background)
-                    # 立即返回，不等待重建完成
-                    # 注意：此时返回的可能是基于旧向量库的结果
-                
-                # 使用Agent处理查询
-                result = self.agent_core.process_query(text, session_id)
+                # 新快照切换和资料变化检查由后台线程完成，资料更新后重建期间返回的仍是旧向量库的结果
+                # 使用Agent处理查询，记录各阶段耗时
+                # 在线程池中执行，避免阻塞事件循环，并发请求才能被检索微批处理合并
+                with request_trace() as timings:
+                    start_time = time.perf_counter()
+                    result = await run_in_threadpool(self.agent_core.process_query, text, session_id, deadline)
+                    timings["total"] = round((time.perf_counter() - start_time) * 1000, 3)
+                registry.observe("rag_request_duration_seconds", timings["total"] / 1000,
+                                 "查询请求总耗时（秒）", endpoint="/api/query")
                 answer = result.get("answer")
                 session_id = result.get("session_id")
                 
-                # 处理relevant_docs
-                relevant_docs = []
-                if answer.get("type") != "no_info":
-                    # 重新获取相关文档
-                    _, relevant_docs = self.rag_core.process_query(text)
+                # 直接使用生成回答时的检索片段，不再重复检索和调用大模型
+                relevant_docs = result.get("relevant_docs", [])
                 
-                # 记录日志
-                # 暂时注释掉日志记录，避免处理relevant_docs
-                # self.log_handler.log_chat(text, answer, relevant_docs)
+                # 记录日志（非阻塞，由后台线程写入）
+                self.log_handler.log_chat(text, answer, relevant_docs, session_id=session_id,
+                                          latencies=timings)
                 
                 # 调试信息
-                print(f"Answer: {answer}")
-                print(f"Session ID: {session_id}")
-                print(f"Relevant docs count: {len(relevant_docs)}")
-                
-                # 准备检索片段，确保不包含numpy类型
-                sources = []
-                for doc in relevant_docs:
-                    source_item = {
-                        "source": str(doc["metadata"]["source"]),
-                        "content": str(doc["page_content"]),
-                        "distance": "N/A"
-                    }
-                    sources.append(source_item)
+                logger.debug("Answer: %s, Session ID: %s, Relevant docs count: %d",
+                             answer, session_id, len(relevant_docs))
                 
-                return {
+                return self._json(request, {
                     "answer": answer,
-                    "sources": sources,
+                    "sources": self._format_sources(relevant_docs),
                     "rebuilding": self.rebuilding,
-                    "session_id": session_id
-                }
+                    "session_id": session_id,
+                    "timings": timings
+                })
             except Exception as e:
-                print(f"Error: {str(e)}")
+                logger.exception("查询处理失败: %s", e)
                 raise HTTPException(status_code=500, detail=str(e))
         
+        @self.app.websocket("/ws/chat")
+        async def chat_socket(websocket: WebSocket):
+            """聊天通道：客户端发送问题，服务端流式推送回答分块和检索片段，并推送快照版本和重建进度
+            
+            客户端消息：{"type": "query", "id", "text", "session_id"}、{"type": "session"}（新建会话）、
+            {"type": "ping"} / {"type": "pong"}；服务端空闲时按心跳间隔发送ping，
+            超过空闲超时没有收到任何客户端消息时关闭连接。
+            """
+            await websocket.accept()
+            subscriber = self.events.subscribe()
+            outbox = subscriber.queue
+            client_ip = self._client_ip(websocket)
+            session = {"id": websocket.query_params.get("session_id") or None}
+            lock = asyncio.Lock()
+            tasks = set()
+            outbox.put_nowait(self._status_event())
+            sender = asyncio.create_task(self._ws_send_loop(websocket, outbox))
+            idle_timeout = self.config.get("ws_idle_timeout_s", 75.0)
+            try:
+                while True:
+                    try:
+                        raw = await asyncio.wait_for(websocket.receive_text(), idle_timeout)
+                    except asyncio.TimeoutError:
+                        logger.debug("WebSocket连接空闲超时，关闭")
+                        await websocket.close(code=1001)
+                        break
+                    try:
+                        message = json.loads(raw)
+                        kind = message.get("type")
+                    except (ValueError, AttributeError):
+                        await outbox.put({"type": "error", "detail": "消息必须是JSON对象"})
+                        continue
+                    
+                    if kind == "query":
+                        task = asyncio.create_task(self._ws_query(client_ip, message, session, outbox, lock))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif kind == "session":
+                        session["id"] = await run_in_threadpool(self.agent_core.create_session)
+                        await outbox.put({"type": "session", "session_id": session["id"]})
+                    elif kind == "ping":
+                        await outbox.put({"type": "pong"})
+                    elif kind != "pong":
+                        await outbox.put({"type": "error", "detail": f"未知的消息类型: {kind}"})
+            except WebSocketDisconnect:
+                pass
+            finally:
+                self.events.unsubscribe(subscriber)
+                sender.cancel()
+                for task in tasks:
+                    task.cancel()
+        
+        @self.app.post("/api/query/batch")
+        async def query_batch(request: Request, queries: List[str] = Body(..., embed=True)):
+            """批量查询：整批检索一次，大模型调用有限并发，按完成顺序逐行返回（NDJSON）"""
+            max_queries = self.config.get("batch_max_queries", 500)
+            if not queries:
+                raise HTTPException(status_code=400, detail="queries 不能为空")
+            if len(queries) > max_queries:
+                raise HTTPException(status_code=413, detail=f"单次最多提交 {max_queries} 条查询")
+            log_sampled(logger, logging.INFO, "接收到批量查询请求，共 %d 条", len(queries))
+            
+            # 整个批次占用一个准入名额，直到所有已开始的大模型调用结束
+            self.admission.check_rate(self._client_ip(request))
+            acquired_at = await self.admission.controller.acquire()
+            released = []
+            started = []
+            
+            def release():
+                if not released:
+                    released.append(True)
+                    self.admission.controller.release(acquired_at)
+            
+            def results():
+                started.append(True)
+                start_time = time.perf_counter()
+                batch = self.rag_core.process_queries_batch(
+                    queries, max_concurrency=self.config.get("batch_llm_concurrency", 8), on_drained=release)
+                with closing(batch):
+                    for index, answer, relevant_docs in batch:
+                        self.log_handler.log_chat(queries[index], answer, relevant_docs)
+                        item = {
+                            "index": index,
+                            "query": queries[index],
+                            "answer": answer,
+                            "sources": self._format_sources(relevant_docs)
+                        }
+                        yield dumps(item) + b"\n"
+                registry.observe("rag_request_duration_seconds", time.perf_counter() - start_time,
+                                 "查询请求总耗时（秒）", endpoint="/api/query/batch")
+            
+            lines = results()
+            
+            def finish():
+                # 关闭生成器以取消还没开始的查询，进行中的调用结束后由 on_drained 归还名额；
+                # 生成器从未开始时直接归还
+                lines.close()
+                if not started:
+                    release()
+            
+            # 同步生成器放到线程池中迭代，不阻塞事件循环
+            return _ClosingStreamingResponse(iterate_in_threadpool(lines), on_close=finish,
+                                             media_type="application/x-ndjson")
+        
         @self.app.post("/api/session")
         async def create_session():
             """创建新会话"""
             try:
-                session_id = self.agent_core.create_session()
-                print(f"创建新会话: {session_id}")
-                return {
-                    "session_id": session_id,
-                    "session_count": self.agent_core.get_session_count()
-                }
+                # 共享会话存储是阻塞的 sqlite 调用，放到线程池中执行；会话数量见 /metrics
+                session_id = await run_in_threadpool(self.agent_core.create_session)
+                logger.debug("创建新会话: %s", session_id)
+                return {"session_id": session_id}
             except Exception as e:
-                print(f"创建会话失败: {e}")
+                logger.exception("创建会话失败: %s", e)
                 raise HTTPException(status_code=500, detail=str(e))
         
         @self.app.delete("/api/session/{session_id}")
         async def delete_session(session_id: str):
             """删除会话"""
             try:
-                success = self.agent_core.delete_session(session_id)
-                print(f"删除会话: {session_id}, 结果: {success}")
-                return {
-                    "success": success,
-                    "session_count": self.agent_core.get_session_count()
-                }
+                success = await run_in_threadpool(self.agent_core.delete_session, session_id)
+                logger.debug("删除会话: %s, 结果: %s", session_id, success)
+                return {"success": success}
             except Exception as e:
-                print(f"删除会话失败: {e}")
+                logger.exception("删除会话失败: %s", e)
                 raise HTTPException(status_code=500, detail=str(e))
         
-        @self.app.post("/api/general_query")
+        @self.app.post("/api/general_query", dependencies=[Depends(self._admit)])
         async def general_query(text: str = Form(...)):
+            deadline = self.rag_core.request_deadline()
             try:
-                # 调试信息
-                print(f"接收到通用查询请求: {text}")
+                # 调试信息（抽样输出）
+                log_sampled(logger, logging.INFO, "接收到通用查询请求: %.100s", text)
                 
                 # 处理通用查询，调用豆包大模型自由回答
-                answer = self.rag_core.process_general_query(text)
+                answer = await run_in_threadpool(self.rag_core.process_general_query, text, deadline)
                 
                 # 调试信息
-                print(f"General answer: {answer}")
+                logger.debug("General answer: %s", answer)
                 
                 return {
                     "answer": answer
                 }
             except Exception as e:
-                print(f"Error: {str(e)}")
+                logger.exception("通用查询处理失败: %s", e)
                 raise HTTPException(status_code=500, detail=str(e))
         
         @self.app.post("/api/upload")
@@ -176,46 +577,103 @@ class WebServer:
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
         
+        @self.app.get("/healthz")
+        async def healthz():
+            """存活检查：进程能处理请求即返回200"""
+            return {"status": "ok", "pid": os.getpid()}
+        
+        @self.app.get("/readyz")
+        async def readyz():
+            """就绪检查：向量库已加载且预热完成时返回200，否则返回503，负载均衡只把流量发给就绪的进程"""
+            ready, reason = self._readiness()
+            registry.set_gauge("rag_ready", int(ready), "服务是否就绪（向量库已加载且预热完成）")
+            body = {"status": reason, "generation": self.data_loader.generation, "startup_ms": self.startup}
+            return JSONResponse(body, status_code=200 if ready else 503)
+        
         @self.app.get("/api/status")
-        async def get_status():
-            return {
+        async def get_status(request: Request):
+            return self._json(request, {
                 "vector_store_status": "loaded" if self.data_loader.vector_store else "not loaded",
                 "document_count": len(self.data_loader.documents),
                 "data_dir": self.config["data_dir"],
-                "rebuilding": self.rebuilding
-            }
+                "rebuilding": self.rebuilding,
+                "ready": self._readiness()[0],
+                "startup_ms": self.startup,
+                "generation": self.data_loader.generation,
+                "index": {key: self.data_loader.index_info.get(key) for key in ("factory", "search_params", "recall", "rerank_top_n", "bytes_per_vector")},
+                "llm_routes": self.router.stats(),
+                "pid": os.getpid(),
+                "chat_log": self.log_handler.get_stats()
+            })
+        
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def metrics():
+            """Prometheus文本格式的指标"""
+            stats = self.log_handler.get_stats()
+            registry.set_gauge("rag_chat_log_queue_depth", stats["queued"], "问答日志队列长度")
+            registry.set_gauge("rag_chat_log_dropped", stats["dropped"], "问答日志因队列已满丢弃的记录数")
+            registry.set_gauge("rag_active_sessions", await run_in_threadpool(self.agent_core.get_session_count),
+                               "活跃会话数量")
+            registry.set_gauge("rag_document_count", len(self.data_loader.documents), "向量库文档块数量")
+            return PlainTextResponse(registry.render_prometheus(),
+                                     media_type="text/plain; version=0.0.4; charset=utf-8")
+        
+        @self.app.on_event("shutdown")
+        async def shutdown():
+            self._stop_watch.set()
+            # 写出日志队列中剩余的记录
+            self.log_handler.close()
+            if self.rag_core.vector_batcher is not None:
+                self.rag_core.vector_batcher.close()
+            self.router.close()
     
     def run(self, host="0.0.0.0", port=8000):
         uvicorn.run(self.app, host=host, port=port)
 
+def create_app():
+    """多进程模式下每个工作进程调用的应用工厂"""
+    config = load_config()
+    configure_logging(config["log_profile"])
+    ensure_dirs(config)
+    return WebServer(config).app
+
+def run_workers(config):
+    """以多进程模式启动服务
+    
+    各工作进程以内存映射方式加载同一份快照，重建由持有重建锁的单一进程执行，
+    其余进程通过快照版本号发现并切换到新版本。
+    """
+    uvicorn.run("web_server:create_app", factory=True, host=config["host"],
+                port=config["port"], workers=config["workers"])
+
 if __name__ == "__main__":
     print("正在启动Web服务器...")
     
-    config = {
-        "data_dir": os.path.join(os.path.dirname(__file__), "审核后资料文件夹"),
-        "vector_db_path": os.path.join(os.path.dirname(__file__), "vector_db", "faiss_index.bin"),
-        "log_dir": os.path.join(os.path.dirname(__file__), "logs"),
-        "doubao_api_key": "1457918f-9107-4ca2-9c0d-bcda415e3830"
-    }
+    config = load_config()
+    configure_logging(config["log_profile"])
     
     print(f"配置信息：")
     print(f"  资料目录: {config['data_dir']}")
     print(f"  向量库路径: {config['vector_db_path']}")
     print(f"  日志目录: {config['log_dir']}")
+    print(f"  工作进程数: {config['workers']}")
     
     # 确保必要的目录存在
-    os.makedirs(os.path.dirname(config["vector_db_path"]), exist_ok=True)
-    os.makedirs(config["log_dir"], exist_ok=True)
-    os.makedirs(config["data_dir"], exist_ok=True)
+    ensure_dirs(config)
     
     print("目录检查完成，正在初始化WebServer...")
     
     try:
-        server = WebServer(config)
-        print("WebServer初始化成功，正在启动服务器...")
-        print("服务器启动后，可通过以下地址访问：")
-        print("http://localhost:8000")
-        server.run()
+        if config["workers"] > 1:
+            print("服务器启动后，可通过以下地址访问：")
+            print(f"http://localhost:{config['port']}")
+            run_workers(config)
+        else:
+            server = WebServer(config)
+            print("WebServer初始化成功，正在启动服务器...")
+            print("服务器启动后，可通过以下地址访问：")
+            print(f"http://localhost:{config['port']}")
+            server.run(host=config["host"], port=config["port"])
     except Exception as e:
         print(f"启动失败: {str(e)}")
         import traceback